@@ -1,19 +1,37 @@
 from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth import get_user_model
+from django.db.models import Q
+
+from .models import normalize_phone
 
 User = get_user_model()
 
 class UsernameOrPhoneBackend(ModelBackend):
+    """
+    Log in with a username or a phone number, in one query.
+
+    username and phone both have unique indexes, so the OR is two index
+    probes. A value that is one user's username and another user's phone
+    logs in as the username. This is the only backend in
+    AUTHENTICATION_BACKENDS, so a failed login costs one query and one
+    password hash, whether or not the user exists.
+    """
+
     def authenticate(self, request, username=None, password=None, **kwargs):
-        # Try to fetch user by username
-        try:
-            user = User.objects.get(username=username)
-        except User.DoesNotExist:
-            # If not found, try by phone
-            try:
-                user = User.objects.get(phone=username)
-            except User.DoesNotExist:
-                return None
+        if username is None:
+            username = kwargs.get(User.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        match = Q(username=username)
+        phone = normalize_phone(username)
+        if len(phone) == 10:
+            match |= Q(phone=phone)
+        candidates = list(User.objects.filter(match)[:2])
+        user = next((u for u in candidates if u.username == username), candidates[0] if candidates else None)
+        if user is None:
+            # Hash anyway so response time doesn't reveal whether the account exists
+            User().set_password(password)
+            return None
         if user.check_password(password) and self.user_can_authenticate(user):
             return user
-        return None 
\ No newline at end of file
+        return None
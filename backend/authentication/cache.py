@@ -0,0 +1,73 @@
+"""
+Per-process cache of the users behind JWTs.
+
+CachedJWTAuthentication looks request.user up here instead of loading the
+row on every request. Entries live for JWT_USER_CACHE_TTL seconds. The
+cache is local to each worker process, so a change saved in one worker
+reaches the others within the TTL: User.save() and delete() drop the
+entry in the process that made the change. Bulk .update() calls bypass
+save(); call forget_user() after those.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+
+DEFAULT_TTL = 30  # seconds
+MAX_USERS = 10000
+
+_users = OrderedDict()  # user id -> (expires at, user)
+_lock = threading.Lock()
+
+
+def get_user_cache_ttl():
+    return getattr(settings, 'JWT_USER_CACHE_TTL', DEFAULT_TTL)
+
+
+def get_cached_user(user_id):
+    """
+    The user with this id, from the cache or (on a miss) the database.
+    Returns a copy, so request code can't change the cached instance.
+    Returns None if there is no such user.
+    """
+    now = time.monotonic()
+    with _lock:
+        entry = _users.get(user_id)
+        if entry is not None and entry[0] > now:
+            _users.move_to_end(user_id)
+            return copy.copy(entry[1])
+
+    User = get_user_model()
+    user = User.objects.filter(pk=user_id).first()
+    if user is None:
+        return None
+    ttl = get_user_cache_ttl()
+    if ttl > 0:
+        with _lock:
+            _users[user_id] = (now + ttl, user)
+            _users.move_to_end(user_id)
+            while len(_users) > MAX_USERS:
+                _users.popitem(last=False)
+    return copy.copy(user)
+
+
+def forget_user(user_id):
+    with _lock:
+        _users.pop(user_id, None)
+
+
+def forget_user_on_commit(user_id):
+    """Drop the user now and again once the transaction commits, so a
+    concurrent request can't re-cache the pre-commit row."""
+    forget_user(user_id)
+    transaction.on_commit(lambda: forget_user(user_id))
+
+
+def clear_user_cache():
+    with _lock:
+        _users.clear()
@@ -0,0 +1,11 @@
+from mailer.rendering import render_email
+
+
+def password_reset_email(user, reset_url):
+    return render_email(
+        'authentication/emails/password_reset.html',
+        {'reset_url': reset_url},
+        subject='Password Reset Request',
+        text=f'Click the link to reset your password: {reset_url}',
+        to=[user.email],
+    )
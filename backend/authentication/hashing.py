@@ -0,0 +1,125 @@
+"""
+Password hashing policy.
+
+PolicyPBKDF2PasswordHasher is first in PASSWORD_HASHERS. Its work factor is
+PASSWORD_HASH_ITERATIONS (`manage.py benchmark_password_hashing` suggests
+one for the CPU it runs on), so changing the cost needs no code change.
+A stored hash made with another iteration count or an older algorithm is
+rehashed the next time its user logs in: Django's check_password() saves
+a new hash whenever the first hasher says the old one must_update.
+
+The app runs on threaded gunicorn workers (gthread, WEB_THREADS request
+threads each; see deploy.sh). PBKDF2 runs in OpenSSL with the GIL
+released, so hashes are computed on a small pool of PASSWORD_HASH_WORKERS
+threads, fewer than WEB_THREADS, and the remaining request threads keep
+serving the other endpoints during a login burst. At most
+PASSWORD_HASH_QUEUE more hashes wait for a pool thread; a request that
+can't get a place within PASSWORD_HASH_WAIT seconds gets a 503 instead of
+tying up another request thread. The defaults are sized from WEB_THREADS
+so that one thread is always left over. With sync workers (one request
+at a time) the pool can't fill and only moves the hash to another
+thread; set PASSWORD_HASH_WORKERS = 0 there to hash inline.
+
+HashingBusy is a DRF APIException, so API views answer it themselves;
+HashingBusyMiddleware gives plain Django views (the admin login) the same
+503 instead of a server error. Management commands such as
+createsuperuser hash one password at a time in their own process, so the
+pool is never full for them.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.http import HttpResponse
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+DEFAULT_ITERATIONS = PBKDF2PasswordHasher.iterations
+DEFAULT_WORKERS = 2
+DEFAULT_QUEUE = 1
+DEFAULT_WAIT = 1  # seconds
+
+_pool = None
+_slots = None
+_pool_lock = threading.Lock()
+_local = threading.local()
+
+
+class HashingBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Too many logins at once, please try again in a moment.'
+    default_code = 'hashing_busy'
+    wait = 1  # sent as Retry-After
+
+
+class HashingBusyMiddleware:
+    """Turn HashingBusy raised outside DRF into a 503 with Retry-After."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_exception(self, request, exception):
+        if isinstance(exception, HashingBusy):
+            response = HttpResponse(str(exception.detail), status=exception.status_code, content_type='text/plain')
+            response['Retry-After'] = str(exception.wait)
+            return response
+        return None
+
+
+def _mark_pool_thread():
+    _local.in_pool = True
+
+
+def _get_pool():
+    global _pool, _slots
+    with _pool_lock:
+        if _pool is None:
+            workers = getattr(settings, 'PASSWORD_HASH_WORKERS', DEFAULT_WORKERS)
+            if workers <= 0:
+                return None, None
+            queue = getattr(settings, 'PASSWORD_HASH_QUEUE', DEFAULT_QUEUE)
+            _pool = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix='password-hash', initializer=_mark_pool_thread,
+            )
+            _slots = threading.BoundedSemaphore(workers + queue)
+        return _pool, _slots
+
+
+def reset_hash_pool():
+    """Shut the pool down; the next hash starts one with the current settings."""
+    global _pool, _slots
+    with _pool_lock:
+        pool, _pool, _slots = _pool, None, None
+    if pool is not None:
+        pool.shutdown(wait=True)
+
+
+def run_hash(fn, *args):
+    """Run fn(*args) on the hashing pool and return its result. Raises HashingBusy if the pool is full."""
+    if getattr(_local, 'in_pool', False):
+        return fn(*args)
+    pool, slots = _get_pool()
+    if pool is None:
+        return fn(*args)
+    if not slots.acquire(timeout=getattr(settings, 'PASSWORD_HASH_WAIT', DEFAULT_WAIT)):
+        raise HashingBusy()
+    try:
+        return pool.submit(fn, *args).result()
+    finally:
+        slots.release()
+
+
+class PolicyPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """PBKDF2-SHA256 with the iteration count from settings, computed on the hashing pool."""
+
+    @property
+    def iterations(self):
+        return getattr(settings, 'PASSWORD_HASH_ITERATIONS', DEFAULT_ITERATIONS)
+
+    def encode(self, password, salt, iterations=None):
+        return run_hash(super().encode, password, salt, iterations)
@@ -0,0 +1,65 @@
+import os
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.core.management.base import BaseCommand, CommandError
+
+from authentication.hashing import DEFAULT_ITERATIONS
+
+
+def cpu_count():
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+class Command(BaseCommand):
+    help = 'Time password hashing on this CPU and suggest PASSWORD_HASH_ITERATIONS and PASSWORD_HASH_WORKERS'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target-ms', type=float, default=250,
+                            help='How long one hash should take (default: 250)')
+        parser.add_argument('--probe', type=int, default=100000, help='Iterations to time (default: 100000)')
+        parser.add_argument('--samples', type=int, default=5)
+        parser.add_argument('--min-iterations', type=int, default=DEFAULT_ITERATIONS,
+                            help=f'Never suggest fewer iterations than this (default: {DEFAULT_ITERATIONS})')
+
+    def handle(self, *args, **options):
+        if options['target_ms'] <= 0 or options['probe'] <= 0 or options['samples'] <= 0:
+            raise CommandError('--target-ms, --probe and --samples must be positive')
+
+        # The plain hasher, so the timing isn't skewed by the pool
+        hasher = PBKDF2PasswordHasher()
+        salt = hasher.salt()
+        timings = []
+        for _ in range(options['samples']):
+            started = time.perf_counter()
+            hasher.encode('benchmark-password', salt, options['probe'])
+            timings.append(time.perf_counter() - started)
+        per_iteration = statistics.median(timings) / options['probe']
+        self.stdout.write(
+            f"{hasher.algorithm}: {options['probe']} iterations take {per_iteration * options['probe'] * 1000:.1f} ms"
+        )
+
+        iterations = round(options['target_ms'] / 1000 / per_iteration, -4)
+        if iterations < options['min_iterations']:
+            self.stdout.write(self.style.WARNING(
+                f"{options['target_ms']:g} ms is only {iterations:.0f} iterations here; "
+                f"using the minimum of {options['min_iterations']}"
+            ))
+            iterations = options['min_iterations']
+        iterations = int(iterations)
+
+        # Leave half the CPUs, and at least one request thread, for the
+        # requests that aren't logins
+        cpus = cpu_count()
+        threads = getattr(settings, 'WEB_THREADS', 4)
+        workers = max(1, min(cpus // 2, threads - 1))
+        hash_ms = iterations * per_iteration * 1000
+        self.stdout.write(f"{cpus} CPU(s): about {workers * 1000 / hash_ms:.0f} logins/s per process at this cost")
+        self.stdout.write(self.style.SUCCESS(
+            f"PASSWORD_HASH_ITERATIONS={iterations}  (~{hash_ms:.0f} ms per hash)\n"
+            f"PASSWORD_HASH_WORKERS={workers}"
+        ))
@@ -0,0 +1,58 @@
+# Generated by Django 4.2.7 on 2026-10-18 05:01
+
+import re
+
+from django.db import migrations, models
+
+
+BATCH_SIZE = 2000
+
+
+def normalize_phones(apps, schema_editor):
+    """
+    Store phones as their 10 digits (no +91, leading 0 or formatting). If
+    two accounts share a number, the oldest keeps it; the others lose it as
+    a login and get it in altPhone (when that is empty) so nothing is lost.
+    """
+    User = apps.get_model("authentication", "User")
+    seen = set()
+    batch = []
+    users = User.objects.exclude(phone="").order_by("id").only("id", "phone", "altPhone")
+    for user in users.iterator(chunk_size=BATCH_SIZE):
+        digits = re.sub(r"\D", "", user.phone)
+        if len(digits) == 12 and digits.startswith("91"):
+            digits = digits[2:]
+        elif len(digits) == 11 and digits.startswith("0"):
+            digits = digits[1:]
+        if digits in seen:
+            if not user.altPhone:
+                user.altPhone = user.phone
+            digits = ""
+        elif digits:
+            seen.add(digits)
+        if digits != user.phone:
+            user.phone = digits
+            batch.append(user)
+        if len(batch) >= BATCH_SIZE:
+            User.objects.bulk_update(batch, ["phone", "altPhone"])
+            batch = []
+    User.objects.bulk_update(batch, ["phone", "altPhone"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("authentication", "0002_user_name_alter_user_phone"),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_phones, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="user",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("phone", ""), _negated=True),
+                fields=("phone",),
+                name="unique_user_phone",
+            ),
+        ),
+    ]
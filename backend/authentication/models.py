@@ -1,14 +1,56 @@
+import re
+
 from django.db import models
+from django.db.models import Q
 from django.contrib.auth.models import AbstractUser
 
+from .cache import forget_user_on_commit
+
+NON_DIGITS = re.compile(r'\D')
+
+
+def normalize_phone(value):
+    """
+    Canonical form of an Indian mobile number: its 10 digits, without
+    spaces, dashes, +91 or a leading 0. Values that aren't a mobile number
+    come back with only the formatting removed.
+    """
+    digits = NON_DIGITS.sub('', value or '')
+    if len(digits) == 12 and digits.startswith('91'):
+        return digits[2:]
+    if len(digits) == 11 and digits.startswith('0'):
+        return digits[1:]
+    return digits
+
+
 # Create your models here.
 class User(AbstractUser):
     name = models.CharField(max_length=100, blank=True)
+    # Stored normalized (see normalize_phone) so login by phone is an exact,
+    # indexed match; unique when set
     phone = models.CharField(max_length=10, blank=True)
     altPhone = models.CharField(max_length=20, blank=True)
     address = models.CharField(max_length=255, blank=True)
     city = models.CharField(max_length=100, blank=True)
     salon = models.CharField(max_length=100, blank=True)
 
+    class Meta(AbstractUser.Meta):
+        constraints = [
+            models.UniqueConstraint(fields=['phone'], condition=~Q(phone=''), name='unique_user_phone'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.phone = normalize_phone(self.phone)
+        super().save(*args, **kwargs)
+        # Profile edits, password resets and (de)activation reach
+        # request.user on the next request
+        forget_user_on_commit(self.pk)
+
+    def delete(self, *args, **kwargs):
+        pk = self.pk
+        result = super().delete(*args, **kwargs)
+        forget_user_on_commit(pk)
+        return result
+
     def __str__(self):
         return self.username
@@ -1,13 +1,45 @@
 from rest_framework import serializers
-from .models import User
+from .models import User, normalize_phone
+
+
+class PhoneField(serializers.CharField):
+    """Accepts +91 / 0-prefixed and formatted numbers; stores the 10 digits."""
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('required', False)
+        kwargs.setdefault('allow_blank', True)
+        kwargs.setdefault('max_length', 20)
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        phone = normalize_phone(super().to_internal_value(data))
+        if phone and len(phone) != 10:
+            raise serializers.ValidationError("Enter a 10-digit mobile number.")
+        return phone
+
+
+def validate_unique_phone(phone, instance=None):
+    if not phone:
+        return phone
+    users = User.objects.filter(phone=phone)
+    if instance is not None:
+        users = users.exclude(pk=instance.pk)
+    if users.exists():
+        raise serializers.ValidationError("A user with this phone number already exists.")
+    return phone
+
 
 class RegisterSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, required=True, style={'input_type': 'password'})
+    phone = PhoneField()
 
     class Meta:
         model = User
         fields = ('username', 'name', 'email', 'password', 'phone', 'altPhone', 'address', 'city', 'salon')
 
+    def validate_phone(self, value):
+        return validate_unique_phone(value)
+
     def create(self, validated_data):
         user = User.objects.create_user(
             username=validated_data['username'],
@@ -1,3 +1,378 @@
-from django.test import TestCase
+import threading
+from io import StringIO
+from unittest.mock import patch
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.contrib.auth.hashers import MD5PasswordHasher, make_password
+from django.contrib.auth.tokens import PasswordResetTokenGenerator
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from backend.testing import FAST_HASHERS, BudgetTestCase, fake_razorpay, seed_users
+from mailer.models import OutboundEmail
+from .cache import clear_user_cache
+from .hashing import reset_hash_pool, run_hash
+from .throttling import CacheBucketStore, LocalBucketStore, reset_throttle_stores
+from .models import User
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class AuthenticationEndpointBudgetTests(BudgetTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = seed_users(500)
+        cls.user = cls.users[250]
+
+    def registration(self):
+        n = User.objects.count()
+        return {'data': {
+            'username': f'newuser{n}', 'name': 'New User', 'email': f'new{n}@example.com',
+            'password': 'password123', 'phone': f'97{n:08d}', 'address': 'Ring Road', 'city': 'Surat',
+        }}
+
+    def test_register(self):
+        self.assertBudget('POST', '/auth/register/', setup=self.registration, status=201, runs=10,
+                          queries=3, p50=30, p95=60)
+
+    def test_login_with_username(self):
+        response = self.assertBudget('POST', '/auth/login/', data={'username': self.user.username, 'password': 'password123'},
+                                     queries=1, p50=30, p95=60)
+        self.assertIn('access', response.data)
+
+    def test_login_with_phone(self):
+        self.assertBudget('POST', '/auth/login/', data={'username': self.user.phone, 'password': 'password123'},
+                          queries=1, p50=30, p95=60)
+
+    def test_login_rejected(self):
+        self.assertBudget('POST', '/auth/login/', data={'username': 'nobody', 'password': 'wrong'}, status=401,
+                          queries=1, p50=30, p95=60)
+
+    def test_token_refresh(self):
+        refresh = str(RefreshToken.for_user(self.user))
+        self.assertBudget('POST', '/auth/token/refresh/', data={'refresh': refresh}, queries=1, p50=20, p95=40)
+
+    def test_profile(self):
+        self.assertBudget('GET', '/auth/profile/', user=self.user, queries=0, p50=20, p95=40)
+        self.assertBudget('PUT', '/auth/profile/', user=self.user, data={'city': 'Vadodara'},
+                          queries=1, p50=20, p95=40)
+
+    def test_forgot_password(self):
+        self.assertBudget('POST', '/auth/forgot-password/', data={'username': self.user.username},
+                          queries=1, p50=20, p95=40)
+
+    def test_password_reset_request(self):
+        self.assertBudget('POST', '/auth/password-reset/', data={'username': self.user.email},
+                          queries=3, p50=20, p95=40)
+
+    def test_password_reset_confirm(self):
+        def setup():
+            self.user.refresh_from_db()
+            return {'data': {
+                'uid': urlsafe_base64_encode(force_bytes(self.user.pk)),
+                'token': PasswordResetTokenGenerator().make_token(self.user),
+                'new_password': 'password456',
+            }}
+        self.assertBudget('POST', '/auth/password-reset-confirm/', setup=setup, runs=10,
+                          queries=2, p50=20, p95=40)
+
+    def test_create_razorpay_order(self):
+        with fake_razorpay():
+            response = self.assertBudget('POST', '/auth/create-razorpay-order/', user=self.user,
+                                         data={'order_id': 1, 'amount': '499.50'}, queries=0, p50=20, p95=40)
+        self.assertEqual(response.data['amount'], 49950)
+
+
+class PasswordResetEmailTests(TestCase):
+    def test_reset_link_is_queued(self):
+        user = User.objects.create_user(username='reset-me', password='secret', email='reset@example.com')
+        response = self.client.post('/auth/password-reset/', {'username': 'reset-me'})
+        self.assertEqual(response.status_code, 200)
+        email = OutboundEmail.objects.get()
+        self.assertEqual(email.to, ['reset@example.com'])
+        uid = urlsafe_base64_encode(force_bytes(user.pk))
+        self.assertIn(f'reset-password?uid={uid}&amp;token=', email.html_body)
+        self.assertIn(f'reset-password?uid={uid}&token=', email.body)
+
+
+class CountingHasher(MD5PasswordHasher):
+    calls = 0
+
+    def encode(self, password, salt):
+        CountingHasher.calls += 1
+        return super().encode(password, salt)
+
+
+@override_settings(PASSWORD_HASHERS=['authentication.tests.CountingHasher'])
+class UsernameOrPhoneLoginTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='meera', password='secret', phone='+91 98765-43210')
+
+    def test_phone_is_stored_normalized(self):
+        self.assertEqual(self.user.phone, '9876543210')
+
+    def test_any_spelling_of_the_phone_logs_in(self):
+        for login in ['meera', '9876543210', '+919876543210', '09876543210']:
+            with self.assertNumQueries(1):
+                self.assertEqual(authenticate(username=login, password='secret'), self.user)
+
+    def test_username_wins_over_someone_elses_phone(self):
+        other = User.objects.create_user(username='9876543210', password='other')
+        self.assertEqual(authenticate(username='9876543210', password='other'), other)
+
+    def test_unknown_user_costs_one_query_and_one_hash(self):
+        CountingHasher.calls = 0
+        with self.assertNumQueries(1):
+            self.assertIsNone(authenticate(username='nobody', password='secret'))
+        self.assertEqual(CountingHasher.calls, 1)
+
+    def test_inactive_user_is_refused(self):
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertIsNone(authenticate(username='meera', password='secret'))
+
+    def test_phone_must_be_unique(self):
+        response = self.client.post('/auth/register/', {
+            'username': 'copycat', 'email': 'c@example.com', 'password': 'password123', 'phone': '098765 43210',
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('phone', response.data)
+
+    def test_phone_must_be_a_mobile_number(self):
+        response = self.client.post('/auth/register/', {
+            'username': 'shorty', 'email': 's@example.com', 'password': 'password123', 'phone': '12345',
+        })
+        self.assertEqual(response.status_code, 400)
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        clear_user_cache()
+        self.addCleanup(clear_user_cache)
+        self.user = User.objects.create_user(username='meera', password='secret', city='Surat')
+        self.api = APIClient()
+        self.api.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def test_user_row_is_loaded_once(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.api.get('/auth/profile/').status_code, 200)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.api.get('/auth/profile/').data['city'], 'Surat')
+
+    def test_profile_update_is_seen_on_the_next_request(self):
+        self.api.get('/auth/profile/')
+        self.api.put('/auth/profile/', {'city': 'Vadodara'}, format='json')
+        self.assertEqual(self.api.get('/auth/profile/').data['city'], 'Vadodara')
+
+    def test_deactivated_user_is_refused(self):
+        self.api.get('/auth/profile/')
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.api.get('/auth/profile/').status_code, 401)
+
+    @override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+    def test_password_reset_drops_the_cached_user(self):
+        self.api.get('/auth/profile/')
+        self.client.post('/auth/password-reset-confirm/', {
+            'uid': urlsafe_base64_encode(force_bytes(self.user.pk)),
+            'token': PasswordResetTokenGenerator().make_token(self.user),
+            'new_password': 'password456',
+        })
+        with self.assertNumQueries(1):
+            self.api.get('/auth/profile/')
+
+    @override_settings(JWT_USER_CACHE_TTL=0)
+    def test_ttl_zero_disables_the_cache(self):
+        self.api.get('/auth/profile/')
+        with self.assertNumQueries(1):
+            self.api.get('/auth/profile/')
+
+
+POLICY_HASHERS = ['authentication.hashing.PolicyPBKDF2PasswordHasher', 'django.contrib.auth.hashers.MD5PasswordHasher']
+
+
+@override_settings(PASSWORD_HASHERS=POLICY_HASHERS, PASSWORD_HASH_ITERATIONS=1000)
+class PasswordHashingPolicyTests(TestCase):
+    def setUp(self):
+        reset_hash_pool()
+        self.addCleanup(reset_hash_pool)
+        self.user = User.objects.create_user(username='meera', password='secret')
+
+    def test_hashes_use_the_configured_iterations(self):
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$1000$'))
+
+    def test_login_rehashes_to_a_new_iteration_count(self):
+        with self.settings(PASSWORD_HASH_ITERATIONS=2000):
+            self.assertEqual(authenticate(username='meera', password='secret'), self.user)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$2000$'))
+
+    def test_login_rehashes_an_old_algorithm(self):
+        User.objects.filter(pk=self.user.pk).update(password=make_password('secret', hasher='md5'))
+        self.assertEqual(authenticate(username='meera', password='secret'), self.user)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$1000$'))
+
+    def test_hashing_runs_on_the_pool(self):
+        self.assertTrue(run_hash(lambda: threading.current_thread().name).startswith('password-hash'))
+        with self.settings(PASSWORD_HASH_WORKERS=0):
+            reset_hash_pool()
+            self.assertEqual(run_hash(lambda: threading.current_thread().name), threading.current_thread().name)
+
+    @override_settings(PASSWORD_HASH_WORKERS=1, PASSWORD_HASH_QUEUE=0, PASSWORD_HASH_WAIT=0)
+    def test_login_is_refused_while_the_pool_is_full(self):
+        reset_hash_pool()  # setUp started one with the default size
+        started, release = threading.Event(), threading.Event()
+        busy = threading.Thread(target=run_hash, args=(lambda: started.set() or release.wait(5),))
+        busy.start()
+        started.wait(5)
+        try:
+            response = self.client.post('/auth/login/', {'username': 'meera', 'password': 'secret'})
+        finally:
+            release.set()
+            busy.join()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+        response = self.client.post('/auth/login/', {'username': 'meera', 'password': 'secret'})
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(PASSWORD_HASH_WORKERS=1, PASSWORD_HASH_QUEUE=0, PASSWORD_HASH_WAIT=0)
+    def test_admin_login_gets_a_503_while_the_pool_is_full(self):
+        reset_hash_pool()
+        started, release = threading.Event(), threading.Event()
+        busy = threading.Thread(target=run_hash, args=(lambda: started.set() or release.wait(5),))
+        busy.start()
+        started.wait(5)
+        try:
+            response = self.client.post('/admin/login/', {'username': 'meera', 'password': 'secret'})
+        finally:
+            release.set()
+            busy.join()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+
+    @override_settings(WEB_THREADS=2)
+    def test_benchmark_leaves_a_request_thread_free(self):
+        out = StringIO()
+        call_command('benchmark_password_hashing', '--probe', '1000', '--samples', '1',
+                     '--target-ms', '1', '--min-iterations', '1000', stdout=out)
+        self.assertIn('PASSWORD_HASH_WORKERS=1', out.getvalue())
+
+    def test_benchmark_suggests_settings(self):
+        out = StringIO()
+        call_command('benchmark_password_hashing', '--probe', '1000', '--samples', '1',
+                     '--target-ms', '1', '--min-iterations', '1000', stdout=out)
+        self.assertIn('PASSWORD_HASH_ITERATIONS=', out.getvalue())
+        self.assertIn('PASSWORD_HASH_WORKERS=', out.getvalue())
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@override_settings(PASSWORD_HASHERS=['authentication.tests.CountingHasher'], AUTH_THROTTLE_RATES={
+    'login_ip': '4/min', 'login_account': '2/min', 'password_reset_ip': '2/hour', 'password_reset_account': '1/hour',
+})
+class AuthThrottleTests(TestCase):
+    def setUp(self):
+        reset_throttle_stores()
+        self.addCleanup(reset_throttle_stores)
+        self.user = User.objects.create_user(username='meera', password='secret', email='m@example.com',
+                                             phone='9876543210')
+
+    def login(self, username, ip='10.0.0.1'):
+        return self.client.post('/auth/login/', {'username': username, 'password': 'wrong'}, REMOTE_ADDR=ip)
+
+    def test_refused_login_touches_neither_database_nor_hasher(self):
+        self.login('meera')
+        self.login('meera')
+        CountingHasher.calls = 0
+        with self.assertNumQueries(0):
+            response = self.login('meera')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(CountingHasher.calls, 0)
+        self.assertIn('Retry-After', response)
+
+    def test_every_spelling_of_a_phone_shares_a_bucket(self):
+        self.login('9876543210', ip='10.0.0.1')
+        self.login('+91 98765 43210', ip='10.0.0.2')
+        self.assertEqual(self.login('09876543210', ip='10.0.0.3').status_code, 429)
+
+    def test_one_ip_is_limited_across_accounts(self):
+        for n in range(4):
+            self.assertEqual(self.login(f'user{n}').status_code, 401)
+        self.assertEqual(self.login('user9').status_code, 429)
+        self.assertEqual(self.login('user9', ip='10.0.0.2').status_code, 401)
+
+    def test_spoofed_forwarded_for_shares_the_proxy_reported_bucket(self):
+        # Our proxy appends the real client address; anything before it is the client's
+        for n in range(4):
+            self.client.post('/auth/login/', {'username': f'user{n}', 'password': 'x'},
+                             HTTP_X_FORWARDED_FOR=f'203.0.113.{n}, 10.0.0.1')
+        response = self.client.post('/auth/login/', {'username': 'user9', 'password': 'x'},
+                                    HTTP_X_FORWARDED_FOR='203.0.113.9, 10.0.0.1')
+        self.assertEqual(response.status_code, 429)
+
+    @override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'NUM_PROXIES': 0})
+    def test_without_proxies_forwarded_for_is_ignored(self):
+        for n in range(4):
+            self.client.post('/auth/login/', {'username': f'user{n}', 'password': 'x'},
+                             HTTP_X_FORWARDED_FOR=f'203.0.113.{n}', REMOTE_ADDR='10.0.0.1')
+        response = self.client.post('/auth/login/', {'username': 'user9', 'password': 'x'},
+                                    HTTP_X_FORWARDED_FOR='203.0.113.9', REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, 429)
+
+    def test_a_flood_of_ips_does_not_reset_account_buckets(self):
+        self.login('meera')
+        self.login('meera')
+        with patch.object(LocalBucketStore, 'MAX_KEYS', 2):
+            for n in range(5):
+                self.login(f'user{n}', ip=f'10.0.1.{n}')
+            self.assertEqual(self.login('meera', ip='10.0.2.1').status_code, 429)
+
+    def test_only_refilled_buckets_are_evicted(self):
+        clock = FakeClock()
+        store = LocalBucketStore(clock=clock)
+        store.MAX_KEYS = 1
+        store.hit('a', 1, 60)
+        store.hit('b', 1, 60)
+        self.assertGreater(store.hit('a', 1, 60), 0)
+        clock.now += 60
+        store.hit('c', 1, 60)
+        self.assertEqual(list(store._buckets), ['c'])
+
+    def test_password_reset_is_limited_per_account(self):
+        self.client.post('/auth/password-reset/', {'email': 'm@example.com'}, REMOTE_ADDR='10.0.0.1')
+        with self.assertNumQueries(0):
+            response = self.client.post('/auth/forgot-password/', {'username': 'M@Example.com'},
+                                        REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(response.status_code, 429)
+
+    def test_local_bucket_refills(self):
+        clock = FakeClock()
+        store = LocalBucketStore(clock=clock)
+        self.assertEqual([store.hit('k', 2, 60) for _ in range(2)], [0, 0])
+        self.assertEqual(store.hit('k', 2, 60), 30)
+        clock.now += 30
+        self.assertEqual(store.hit('k', 2, 60), 0)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                           'LOCATION': 'throttle-tests'}})
+    def test_cache_store_slides_its_window(self):
+        clock = FakeClock()
+        clock.now = 6000.0
+        store = CacheBucketStore(clock=clock)
+        self.assertEqual([store.hit('k', 2, 60) for _ in range(2)], [0, 0])
+        self.assertGreater(store.hit('k', 2, 60), 0)
+        clock.now += 60  # the previous window still counts for most of this one
+        self.assertGreater(store.hit('k', 2, 60), 0)
+        clock.now += 60
+        self.assertEqual(store.hit('k', 2, 60), 0)
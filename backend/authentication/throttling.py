@@ -0,0 +1,174 @@
+"""
+Rate limits for the anonymous account endpoints (login, password reset).
+
+Each request spends one token from two buckets: one for the client IP and
+one for the account it names (username, email or phone; the spellings of
+one phone share a bucket). A bucket holds as many tokens as its rate, e.g.
+'5/min', and refills continuously at that rate. DRF checks throttles
+before the view runs, so a refused request costs no query and no password
+hash; it gets a 429 with Retry-After.
+
+The client IP is REMOTE_ADDR, or with REST_FRAMEWORK['NUM_PROXIES'] = n the
+address n hops from the end of X-Forwarded-For (the one our own proxy
+added), so a client can't pick its own bucket by sending that header.
+
+Rates are in AUTH_THROTTLE_RATES, keyed by the view's throttle_scope and
+the bucket kind ('login_ip', 'login_account', ...); a missing or None rate
+means no limit. Buckets live in AUTH_THROTTLE_STORE:
+
+    LocalBucketStore   (default) exact token buckets in this process. Each
+                       worker process limits on its own. IP and account
+                       buckets are kept apart, and only buckets that have
+                       refilled are evicted, so a flood of new keys can't
+                       reset anyone's limit.
+    CacheBucketStore   shared through the AUTH_THROTTLE_CACHE cache alias
+                       (Redis or memcached), as a sliding window of two
+                       counters; cache.incr() keeps it atomic across workers.
+"""
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+from rest_framework.throttling import BaseThrottle
+
+from .models import normalize_phone
+
+
+DEFAULT_RATES = {
+    'login_ip': '20/min',
+    'login_account': '5/min',
+    'password_reset_ip': '10/hour',
+    'password_reset_account': '5/hour',
+}
+DEFAULT_STORE = 'authentication.throttling.LocalBucketStore'
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def parse_rate(rate):
+    """'5/min' -> (5, 60.0): the bucket size and seconds to refill it."""
+    count, period = rate.split('/')
+    return int(count), float(PERIODS[period[0]])
+
+
+class LocalBucketStore:
+    MAX_KEYS = 100000
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._buckets = OrderedDict()  # key -> (tokens, at, full at)
+        self._lock = threading.Lock()
+
+    def hit(self, key, count, period):
+        """Take a token; returns 0 if there was one, else the seconds until there is."""
+        now = self.clock()
+        with self._lock:
+            tokens, at, _ = self._buckets.get(key, (count, now, now))
+            tokens = min(count, tokens + (now - at) * count / period)
+            wait = 0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) * period / count
+            self._buckets[key] = (tokens, now, now + (count - tokens) * period / count)
+            self._buckets.move_to_end(key)
+            # Forgetting a full bucket changes nothing; past MAX_KEYS drop the
+            # least recently used ones that have refilled, and only those
+            while len(self._buckets) > self.MAX_KEYS:
+                oldest = next(iter(self._buckets))
+                if self._buckets[oldest][2] > now:
+                    break
+                del self._buckets[oldest]
+        return wait
+
+
+class CacheBucketStore:
+    """
+    Counts hits in fixed windows of one period and estimates the last
+    period as this window plus the overlapping part of the previous one.
+    Refused requests count too, so a client that keeps hammering stays out.
+    """
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.cache = caches[getattr(settings, 'AUTH_THROTTLE_CACHE', 'default')]
+
+    def hit(self, key, count, period):
+        now = self.clock()
+        window, elapsed = divmod(now, period)
+        digest = hashlib.sha1(key.encode()).hexdigest()
+        current = f'throttle:{digest}:{window:.0f}'
+        self.cache.add(current, 0, timeout=math.ceil(2 * period))
+        hits = self.cache.incr(current)
+        previous = self.cache.get(f'throttle:{digest}:{window - 1:.0f}', 0)
+        estimate = previous * (1 - elapsed / period) + hits
+        if estimate <= count:
+            return 0
+        return (estimate - count) * period / count
+
+
+def get_throttle_store(kind):
+    """The store for one kind of bucket ('ip' or 'account')."""
+    path = getattr(settings, 'AUTH_THROTTLE_STORE', DEFAULT_STORE)
+    with _stores_lock:
+        if (path, kind) not in _stores:
+            _stores[path, kind] = import_string(path)()
+        return _stores[path, kind]
+
+
+def reset_throttle_stores():
+    """Forget the stores; local buckets start full again."""
+    with _stores_lock:
+        _stores.clear()
+
+
+class BucketThrottle(BaseThrottle):
+    """Base for the two buckets; the view sets throttle_scope."""
+    kind = None
+
+    def get_ident_key(self, request):
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        self.delay = 0
+        rates = getattr(settings, 'AUTH_THROTTLE_RATES', DEFAULT_RATES)
+        name = f'{view.throttle_scope}_{self.kind}'
+        rate = rates.get(name)
+        ident = self.get_ident_key(request)
+        if rate is None or not ident:
+            return True
+        self.delay = get_throttle_store(self.kind).hit(f'{name}:{ident}', *parse_rate(rate))
+        return self.delay == 0
+
+    def wait(self):
+        return math.ceil(self.delay)
+
+
+class IPThrottle(BucketThrottle):
+    kind = 'ip'
+
+    def get_ident_key(self, request):
+        return self.get_ident(request)
+
+
+class AccountThrottle(BucketThrottle):
+    kind = 'account'
+    fields = ('username', 'email')
+
+    def get_ident_key(self, request):
+        try:
+            value = next((request.data.get(f) for f in self.fields if request.data.get(f)), None)
+        except AttributeError:  # a JSON body that isn't an object
+            return None
+        if value is None:
+            return None
+        value = str(value).strip()
+        phone = normalize_phone(value)
+        return phone if len(phone) == 10 else value.casefold()
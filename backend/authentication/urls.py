@@ -1,14 +1,14 @@
 from django.urls import path
 from .views import (
-    RegisterView, ProfileView, ForgotPasswordView,
+    RegisterView, LoginView, ProfileView, ForgotPasswordView,
     PasswordResetRequestView, PasswordResetConfirmView,
     CreateRazorpayOrderView
 )
-from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from rest_framework_simplejwt.views import TokenRefreshView
 
 urlpatterns = [
     path('register/', RegisterView.as_view(), name='register'),
-    path('login/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
+    path('login/', LoginView.as_view(), name='token_obtain_pair'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('profile/', ProfileView.as_view(), name='profile'),
     path('forgot-password/', ForgotPasswordView.as_view(), name='forgot-password'),
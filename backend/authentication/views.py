@@ -1,18 +1,22 @@
 from django.shortcuts import render
 from rest_framework import generics
 from rest_framework.permissions import AllowAny, IsAuthenticated
-from .serializers import RegisterSerializer
+from .serializers import PhoneField, RegisterSerializer, validate_unique_phone
 from .models import User
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework import serializers
 from django.core.mail import send_mail
+from mailer.outbox import enqueue
+from .emails import password_reset_email
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes, force_str
 from django.contrib.auth.tokens import PasswordResetTokenGenerator
 from django.conf import settings
-import razorpay
+from backend.gateway import GatewayUnavailable, get_razorpay_client
+from rest_framework_simplejwt.views import TokenObtainPairView
+from .throttling import AccountThrottle, IPThrottle
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 
@@ -23,11 +27,20 @@ class RegisterView(generics.CreateAPIView):
     permission_classes = (AllowAny,)
     serializer_class = RegisterSerializer
 
+class LoginView(TokenObtainPairView):
+    throttle_classes = [IPThrottle, AccountThrottle]
+    throttle_scope = 'login'
+
 class ProfileSerializer(serializers.ModelSerializer):
+    phone = PhoneField()
+
     class Meta:
         model = User
         fields = ('username', 'email', 'phone', 'altPhone', 'address', 'city', 'salon')
 
+    def validate_phone(self, value):
+        return validate_unique_phone(value, self.instance)
+
 class ProfileView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -44,9 +57,9 @@ class ProfileView(APIView):
 
 class ForgotPasswordView(APIView):
     permission_classes = [AllowAny]
-
-    def remove_non_ascii(self, text):
-        return ''.join(i if ord(i) < 128 else ' ' for i in str(text))
+    authentication_classes = []
+    throttle_classes = [IPThrottle, AccountThrottle]
+    throttle_scope = 'password_reset'
 
     def post(self, request):
         username = request.data.get('username')
@@ -60,20 +73,13 @@ class ForgotPasswordView(APIView):
         password = user.password  # This is hashed, not plain text
         # If you store plain text somewhere (not recommended), use that. Otherwise, you can't send the real password.
         # For demonstration, we will just send the username and a note about password security.
-        # send_mail(
-        #     self.remove_non_ascii('Your Account Information'),
-        #     self.remove_non_ascii(f'Username: {user.username}\nPassword: (We do not store plain passwords. Please contact admin to reset your password.)'),
-        #     self.remove_non_ascii('shreekrishnabeautyproducts@gmail.com'),
-        #     [self.remove_non_ascii(user.email)],
-        #     fail_silently=False,
-        # )
         return Response({'message': 'An email has been sent to your registered email address.'})
 
 class PasswordResetRequestView(APIView):
     permission_classes = [AllowAny]
-
-    def remove_non_ascii(self, text):
-        return ''.join(i if ord(i) < 128 else ' ' for i in str(text))
+    authentication_classes = []
+    throttle_classes = [IPThrottle, AccountThrottle]
+    throttle_scope = 'password_reset'
 
     def post(self, request):
         username_or_email = request.data.get('username') or request.data.get('email')
@@ -93,34 +99,7 @@ class PasswordResetRequestView(APIView):
         # Use the production frontend URL
         reset_url = f"https://shreekrishnabeautyproducts.vercel.app/reset-password?uid={uid}&token={token}"
         
-        html_message = f'''
-            <div style="width:100%;background:linear-gradient(135deg, #f8e4ff 0%, #ffd1e8 100%);padding:40px 20px;font-family:Arial,sans-serif;">
-              <div style="max-width:480px;margin:auto;background:white;border-radius:16px;padding:32px;box-shadow:0 4px 16px rgba(0,0,0,0.1);">
-                <div style="background:linear-gradient(135deg, #fff5f9 0%, #fff 100%);border-radius:16px;padding:24px;margin-bottom:24px;border:1px solid rgba(214,51,132,0.1);">
-                  <h2 style="color:#d63384;font-size:28px;margin:0 0 16px;font-weight:700;text-align:center;">Password Reset Request</h2>
-                  <p style="font-size:16px;color:#333;margin:0 0 16px;line-height:1.6;">We received a request to reset your password for your <span style="color:#d63384;font-weight:600;">SK Beauty</span> account.</p>
-                  <p style="font-size:15px;color:#666;margin:0 0 24px;line-height:1.5;">If you did not request a password reset, please ignore this email. Otherwise, click the button below to reset your password.</p>
-                </div>
-                <div style="text-align:center;">
-                  <a href="{reset_url}" style="display:inline-block;padding:16px 40px;background:linear-gradient(135deg, #ff80b5 0%, #d63384 100%);color:#fff;text-decoration:none;font-size:16px;font-weight:600;border-radius:12px;margin-bottom:24px;box-shadow:0 4px 12px rgba(214,51,132,0.3);">Reset Password</a>
-                </div>
-                <div style="background:linear-gradient(135deg, #fff5f9 0%, #fff 100%);border-radius:12px;padding:16px;margin-top:24px;border:1px solid rgba(214,51,132,0.1);">
-                  <p style="font-size:14px;color:#666;margin:0;line-height:1.6;text-align:center;">Thank you,<br/><span style="color:#d63384;font-weight:600;">SK Beauty Team</span></p>
-                </div>
-                <div style="margin-top:24px;padding-top:24px;border-top:1px solid rgba(214,51,132,0.1);">
-                  <p style="font-size:12px;color:#888;margin:0;line-height:1.5;text-align:center;">This is an automated message, please do not reply to this email.<br/>Link is valid for a limited time only.</p>
-                </div>
-              </div>
-            </div>
-        '''
-        # send_mail(
-        #     self.remove_non_ascii('Password Reset Request'),
-        #     self.remove_non_ascii(f'Click the link to reset your password: {reset_url}'),
-        #     self.remove_non_ascii(settings.DEFAULT_FROM_EMAIL),
-        #     [self.remove_non_ascii(user.email)],
-        #     fail_silently=False,
-        #     html_message=self.remove_non_ascii(html_message)
-        # )
+        enqueue(password_reset_email(user, reset_url))
         return Response({'message': 'A password reset link will be shared with you in your registered email soon.'})
 
 class PasswordResetConfirmView(APIView):
@@ -156,8 +135,7 @@ class CreateRazorpayOrderView(APIView):
             # Convert amount to paise
             amount_paise = int(float(amount) * 100)
             
-            # Initialize Razorpay client
-            client = razorpay.Client(auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET))
+            client = get_razorpay_client()
             
             # Create order data
             data = {
@@ -183,6 +161,8 @@ class CreateRazorpayOrderView(APIView):
                 'test_mode': True  # Indicate this is test mode
             })
             
+        except GatewayUnavailable as e:
+            return Response({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
         except Exception as e:
             return Response({
                 'error': f'Failed to create Razorpay order: {str(e)}',
@@ -0,0 +1,160 @@
+"""
+Process-wide Razorpay client.
+
+get_razorpay_client() returns one client per process (per credentials),
+built on a requests.Session with a keep-alive connection pool. Payment
+views stop paying for a new session and TLS handshake on every request.
+Every call made through the client:
+
+* gets a default (connect, read) timeout, so a slow gateway can't hold a
+  worker forever, and
+* goes through a circuit breaker. After RAZORPAY_BREAKER_THRESHOLD
+  consecutive failures (network errors, timeouts, 5xx, anything else
+  raised except a 4xx answer) calls fail fast
+  with GatewayUnavailable for RAZORPAY_BREAKER_COOLDOWN seconds, then a
+  single trial call decides whether the circuit closes again.
+
+RAZORPAY_GATEWAY = 'stub' answers every call in-process from
+backend.gateway_stub, for tests and offline load testing. All of these
+settings are read from the environment in settings.py.
+"""
+import threading
+import time
+
+import razorpay
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from .gateway_stub import StubAdapter, StubGateway
+
+# A new client is built when any of these change
+CLIENT_SETTINGS = (
+    'RAZORPAY_GATEWAY', 'RAZORPAY_BASE_URL', 'RAZORPAY_CONNECT_TIMEOUT', 'RAZORPAY_READ_TIMEOUT',
+    'RAZORPAY_POOL_SIZE', 'RAZORPAY_BREAKER_THRESHOLD', 'RAZORPAY_BREAKER_COOLDOWN',
+)
+
+# The gateway answered, it just didn't like the request: not a reason to trip.
+HEALTHY_ERRORS = (razorpay.errors.BadRequestError, razorpay.errors.SignatureVerificationError)
+
+
+class GatewayUnavailable(Exception):
+    """The circuit is open: Razorpay has been failing, so we don't call it."""
+
+
+class CircuitBreaker:
+    def __init__(self, threshold, cooldown, clock=time.monotonic):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        return 'open' if self.clock() - self.opened_at < self.cooldown else 'half-open'
+
+    def before_call(self):
+        with self._lock:
+            if self.opened_at is None:
+                return
+            if self.clock() - self.opened_at < self.cooldown or self._trial_running:
+                raise GatewayUnavailable("Payment gateway is unavailable, please try again shortly")
+            self._trial_running = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_running or self.failures >= self.threshold:
+                self.opened_at = self.clock()
+            self._trial_running = False
+
+
+class _Session(requests.Session):
+    """Session that applies a default timeout to every request."""
+
+    def __init__(self, timeout):
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return super().request(method, url, **kwargs)
+
+
+class PooledRazorpayClient(razorpay.Client):
+    def __init__(self, breaker, **kwargs):
+        super().__init__(**kwargs)
+        self.breaker = breaker
+
+    def request(self, method, path, **options):
+        self.breaker.before_call()
+        try:
+            response = super().request(method, path, **options)
+        except HEALTHY_ERRORS:
+            self.breaker.record_success()
+            raise
+        except BaseException:
+            # Anything else (including an unexpected error body or a worker
+            # timeout) counts against the gateway, and always ends a trial call
+            self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+        return response
+
+
+def build_client(key_id, key_secret):
+    session = _Session(timeout=(settings.RAZORPAY_CONNECT_TIMEOUT, settings.RAZORPAY_READ_TIMEOUT))
+    pool = settings.RAZORPAY_POOL_SIZE
+    adapter = HTTPAdapter(pool_connections=pool, pool_maxsize=pool, max_retries=0)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+    options = {}
+    if settings.RAZORPAY_BASE_URL:
+        options['base_url'] = settings.RAZORPAY_BASE_URL
+    if settings.RAZORPAY_GATEWAY == 'stub':
+        session.mount(options.get('base_url', razorpay.Client.DEFAULTS['base_url']), StubAdapter(StubGateway()))
+
+    breaker = CircuitBreaker(settings.RAZORPAY_BREAKER_THRESHOLD, settings.RAZORPAY_BREAKER_COOLDOWN)
+    return PooledRazorpayClient(breaker, session=session, auth=(key_id, key_secret), **options)
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _registry_key():
+    return (settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET) + tuple(
+        getattr(settings, name) for name in CLIENT_SETTINGS
+    )
+
+
+def get_razorpay_client():
+    """The shared client for the current settings, created on first use."""
+    key = _registry_key()
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = build_client(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET)
+    return client
+
+
+def reset_razorpay_clients():
+    """Close pooled connections and forget every client (tests, after forking)."""
+    with _clients_lock:
+        for client in _clients.values():
+            client.session.close()
+        _clients.clear()
@@ -0,0 +1,149 @@
+"""
+A local stand-in for the parts of the Razorpay API this project calls.
+
+StubGateway keeps orders and payments in memory and answers the same JSON
+the real API does, closely enough for our views. It is used two ways:
+
+* RAZORPAY_GATEWAY = 'stub' mounts StubAdapter on the pooled client's
+  session, so every request is answered in-process (tests, offline dev).
+* ``python manage.py razorpay_stub`` serves it over HTTP/1.1 keep-alive;
+  point RAZORPAY_BASE_URL at it to load-test the real client stack
+  (connection pool, timeouts, circuit breaker) without the network.
+"""
+import json
+import threading
+import time
+import uuid
+from urllib.parse import parse_qs, urlsplit
+
+from requests.adapters import BaseAdapter
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+
+
+def _id(prefix):
+    return f'{prefix}_{uuid.uuid4().hex[:14]}'
+
+
+def _error(status, description, code='BAD_REQUEST_ERROR'):
+    return status, {'error': {'code': code, 'description': description}}
+
+
+class StubGateway:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.orders = {}
+        self.payments = {}
+        self._lock = threading.Lock()
+
+    def handle(self, method, path, query=None, body=None):
+        """Answer one API call. Returns (status code, JSON-able dict)."""
+        if self.latency:
+            time.sleep(self.latency)
+        query = query or {}
+        parts = [p for p in path.split('/') if p]
+        if parts and parts[0] == 'v1':
+            parts = parts[1:]
+        method = method.upper()
+
+        if parts == ['orders'] and method == 'POST':
+            return self.create_order(body or {})
+        if len(parts) == 2 and parts[0] == 'orders' and method == 'GET':
+            order = self.orders.get(parts[1])
+            return (200, order) if order else _error(404, 'The id provided does not exist')
+        if parts == ['payments'] and method == 'GET':
+            return self.list_payments(query)
+        return _error(404, f'The requested URL {path} was not found on the server.')
+
+    def create_order(self, data):
+        amount = data.get('amount')
+        if not isinstance(amount, int) or amount < 100:
+            return _error(400, 'The amount must be atleast INR 1.00')
+        order = {
+            'id': _id('order'),
+            'entity': 'order',
+            'amount': amount,
+            'amount_paid': 0,
+            'amount_due': amount,
+            'currency': data.get('currency', 'INR'),
+            'receipt': data.get('receipt'),
+            'status': 'created',
+            'attempts': 0,
+            'notes': data.get('notes') or {},
+            'created_at': int(time.time()),
+        }
+        with self._lock:
+            self.orders[order['id']] = order
+        return 200, order
+
+    def capture(self, order_id, method='upi', notes=None):
+        """
+        Record a captured payment for a stub order (for tests and load
+        scripts). Its notes are the order's unless given.
+        """
+        with self._lock:
+            order = self.orders[order_id]
+            payment = {
+                'id': _id('pay'),
+                'entity': 'payment',
+                'amount': order['amount'],
+                'currency': order['currency'],
+                'status': 'captured',
+                'order_id': order_id,
+                'method': method,
+                'captured': True,
+                'notes': order['notes'] if notes is None else notes,
+                'created_at': int(time.time()),
+            }
+            self.payments[payment['id']] = payment
+            order.update(status='paid', amount_paid=order['amount'], amount_due=0)
+        return payment
+
+    def list_payments(self, query):
+        def number(name, default):
+            try:
+                return int(query.get(name, default))
+            except (TypeError, ValueError):
+                return default
+        start, end = number('from', 0), number('to', 2 ** 62)
+        count, skip = min(number('count', 10), 100), number('skip', 0)
+        with self._lock:
+            items = sorted(
+                (p for p in self.payments.values() if start <= p['created_at'] <= end),
+                key=lambda p: p['created_at'], reverse=True,
+            )[skip:skip + count]
+            if query.get('expand[]') == 'order':
+                items = [dict(p, order=dict(self.orders[p['order_id']])) for p in items]
+        return 200, {'entity': 'collection', 'count': len(items), 'items': items}
+
+
+def flatten_query(query):
+    return {key: values[-1] for key, values in parse_qs(query).items()}
+
+
+class StubAdapter(BaseAdapter):
+    """requests transport adapter that answers from a StubGateway instead of the network."""
+
+    def __init__(self, gateway):
+        super().__init__()
+        self.gateway = gateway
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        url = urlsplit(request.url)
+        body = request.body
+        if isinstance(body, bytes):
+            body = body.decode('utf-8')
+        status, payload = self.gateway.handle(
+            request.method, url.path, flatten_query(url.query), json.loads(body) if body else None,
+        )
+        response = Response()
+        response.status_code = status
+        response.headers = CaseInsensitiveDict({'Content-Type': 'application/json'})
+        response._content = json.dumps(payload).encode('utf-8')
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
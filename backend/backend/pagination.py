@@ -0,0 +1,44 @@
+from rest_framework import serializers
+from rest_framework.pagination import CursorPagination
+
+
+class OptionalCursorPagination(CursorPagination):
+    """
+    Keyset (cursor) pagination that only kicks in when the client asks for it.
+
+    Requests without ``cursor`` or ``page_size`` keep getting the plain list
+    the frontend already expects; anything else gets ``next``/``previous``
+    links that seek on the first ordering column (indexed) instead of
+    OFFSETting from the start of the list. DRF's cursor keeps only that
+    column's value; rows that tie on it are stepped over with a small
+    OFFSET, so a page boundary inside a long run of equal prices costs as
+    many rows as the run.
+    """
+    page_size = 24
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering_query_param = 'ordering'
+    # Maps the public ``?ordering=`` value to the ordering used for it; any
+    # other value is rejected with a 400. The cursor seeks on the first
+    # column only; every ordering must end on a unique column so rows tied on
+    # the first come back in the same order and the OFFSET over them skips
+    # the same rows every time.
+    ordering_choices = {}
+    default_ordering = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if self.cursor_query_param not in params and self.page_size_query_param not in params:
+            return None
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_ordering(self, request, queryset, view):
+        requested = request.query_params.get(self.ordering_query_param)
+        if requested in self.ordering_choices:
+            return self.ordering_choices[requested]
+        if requested:
+            raise serializers.ValidationError(
+                {self.ordering_query_param: f"Unknown ordering {requested!r}. Choose from {', '.join(self.ordering_choices)}."}
+            )
+        ordering = self.ordering_choices.get(self.default_ordering, self.ordering)
+        return (ordering,) if isinstance(ordering, str) else ordering
@@ -0,0 +1,37 @@
+"""
+Lazy-load guard for serializers.
+
+With settings.LAZY_LOAD_GUARD on (the default when DEBUG is), serializers
+using LazyLoadGuardMixin may not run any query while rendering an instance:
+everything they read has to be loaded up front with select_related /
+prefetch_related. A missing one raises LazyLoadError naming the query
+instead of silently costing one query per row.
+"""
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+
+
+class LazyLoadError(RuntimeError):
+    pass
+
+
+@contextmanager
+def forbid_queries(label):
+    def blocker(execute, sql, params, many, context):
+        raise LazyLoadError(
+            f'{label} ran a query while rendering; add select_related/prefetch_related '
+            f'to the view queryset. Query: {sql}'
+        )
+
+    with connection.execute_wrapper(blocker):
+        yield
+
+
+class LazyLoadGuardMixin:
+    def to_representation(self, instance):
+        if not getattr(settings, 'LAZY_LOAD_GUARD', False):
+            return super().to_representation(instance)
+        with forbid_queries(type(self).__name__):
+            return super().to_representation(instance)
@@ -13,8 +13,9 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 
 from pathlib import Path
 import os
-from decouple import config
+from decouple import Csv, config
 import logging
+from datetime import timedelta
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -47,6 +48,7 @@ INSTALLED_APPS = [
     "authentication",
     "product",
     'cart',
+    'mailer',
     'cloudinary',
     'cloudinary_storage',
 ]
@@ -60,6 +62,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "authentication.hashing.HashingBusyMiddleware",
 ]
 
 ROOT_URLCONF = "backend.urls"
@@ -105,6 +108,65 @@ DATABASES = {
 }
 
 
+# Caches
+# The catalog cache holds serialized product responses keyed by a version
+# counter that every product change bumps. Local memory is per process, so
+# with several gunicorn workers point CATALOG_CACHE_BACKEND at a shared
+# backend (e.g. django.core.cache.backends.redis.RedisCache) so a bump in
+# one worker invalidates all of them.
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "catalog": {
+        "BACKEND": config('CATALOG_CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        "LOCATION": config('CATALOG_CACHE_LOCATION', default='catalog'),
+        "TIMEOUT": config('CATALOG_CACHE_TIMEOUT', default=300, cast=int),
+    },
+}
+CATALOG_CACHE_ALIAS = 'catalog'
+# Admin order queue counts share the catalog cache so an invalidation in one
+# worker reaches all of them; the timeout is a backstop for missed ones.
+ORDER_CACHE_ALIAS = 'catalog'
+ORDER_COUNTS_TIMEOUT = 60
+
+# Fail loudly when a serializer lazy-loads related rows (see backend/query_guard.py).
+LAZY_LOAD_GUARD = config('LAZY_LOAD_GUARD', default=DEBUG, cast=bool)
+
+# Product search: 'auto' uses PostgreSQL full-text/trigram indexes when the
+# pg_trgm extension is installed, 'memory' forces the in-process index.
+PRODUCT_SEARCH_BACKEND = config('PRODUCT_SEARCH_BACKEND', default='auto')
+
+# How long stock stays held for an approved order that hasn't been paid.
+# Lapsed holds are released on the next approval or by
+# `manage.py release_expired_reservations` (run it from cron).
+STOCK_RESERVATION_TTL = timedelta(hours=config('STOCK_RESERVATION_TTL_HOURS', default=48, cast=int))
+
+
+# Password hashing (authentication/hashing.py). Logins rehash stored
+# passwords made with another iteration count or an older hasher. Pick
+# PASSWORD_HASH_ITERATIONS for the server with
+# `manage.py benchmark_password_hashing`.
+PASSWORD_HASHERS = [
+    'authentication.hashing.PolicyPBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+PASSWORD_HASH_ITERATIONS = config('PASSWORD_HASH_ITERATIONS', default=600000, cast=int)
+# Request threads per gunicorn worker (deploy.sh runs gthread workers with
+# --threads WEB_THREADS). Hashes run on PASSWORD_HASH_WORKERS of them at a
+# time and PASSWORD_HASH_QUEUE more may wait up to PASSWORD_HASH_WAIT
+# seconds, after which logins get a 503; by default at least one thread is
+# always left for the other endpoints.
+WEB_THREADS = config('WEB_THREADS', default=4, cast=int)
+PASSWORD_HASH_WORKERS = config('PASSWORD_HASH_WORKERS', default=max(1, WEB_THREADS // 2), cast=int)
+PASSWORD_HASH_QUEUE = config('PASSWORD_HASH_QUEUE', default=max(0, WEB_THREADS - PASSWORD_HASH_WORKERS - 1), cast=int)
+PASSWORD_HASH_WAIT = 1
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -156,15 +218,17 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # REST Framework and JWT settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'authentication.jwt.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    # Proxies in front of the app (Render's load balancer is one). The client
+    # IP used by rate limits is taken this many hops from the end of
+    # X-Forwarded-For; 0 ignores the header and uses REMOTE_ADDR.
+    'NUM_PROXIES': config('NUM_PROXIES', default=1, cast=int),
 }
 
-from datetime import timedelta
-
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
@@ -175,6 +239,24 @@ SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('Bearer',),
 }
 
+# Login and password reset rate limits per client IP and per account
+# (authentication/throttling.py). Buckets are per process unless
+# AUTH_THROTTLE_STORE is 'authentication.throttling.CacheBucketStore',
+# which shares them through the AUTH_THROTTLE_CACHE alias (e.g. 'catalog'
+# with CATALOG_CACHE_BACKEND pointing at Redis).
+AUTH_THROTTLE_RATES = {
+    'login_ip': '20/min',
+    'login_account': '5/min',
+    'password_reset_ip': '10/hour',
+    'password_reset_account': '5/hour',
+}
+AUTH_THROTTLE_STORE = config('AUTH_THROTTLE_STORE', default='authentication.throttling.LocalBucketStore')
+AUTH_THROTTLE_CACHE = config('AUTH_THROTTLE_CACHE', default='default')
+
+# request.user is cached per process for this long (authentication/cache.py);
+# it bounds how stale another worker's copy can be after a profile change
+JWT_USER_CACHE_TTL = 30
+
 # CORS settings for production
 CORS_ALLOW_ALL_ORIGINS = False
 CORS_ALLOWED_ORIGINS = [
@@ -204,15 +286,37 @@ EMAIL_HOST_USER = config('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD')
 EMAIL_USE_TLS = True
 DEFAULT_FROM_EMAIL = config('EMAIL_HOST_USER')
+EMAIL_TIMEOUT = 30
+
+# Outbound email queue (mailer app): requests only enqueue, the
+# send_queued_email worker does the SMTP work.
+EMAIL_OUTBOX_BATCH_SIZE = config('EMAIL_OUTBOX_BATCH_SIZE', default=50, cast=int)
+EMAIL_OUTBOX_MAX_ATTEMPTS = config('EMAIL_OUTBOX_MAX_ATTEMPTS', default=8, cast=int)
+EMAIL_OUTBOX_RETRY_DELAY = 60  # seconds, doubled after every failed attempt
+EMAIL_OUTBOX_MAX_RETRY_DELAY = 3600
 
 # Razorpay Credentials
 RAZORPAY_KEY_ID = config('RAZORPAY_KEY_ID')
 RAZORPAY_KEY_SECRET = config('RAZORPAY_KEY_SECRET')
 RAZORPAY_WEBHOOK_SECRET = config('RAZORPAY_WEBHOOK_SECRET')
-
+# Still accepted while a secret rotation rolls out (comma separated)
+RAZORPAY_WEBHOOK_PREVIOUS_SECRETS = config('RAZORPAY_WEBHOOK_PREVIOUS_SECRETS', default='', cast=Csv())
+
+# Shared Razorpay client (backend/gateway.py). 'stub' answers every call
+# in-process, for tests and offline load testing.
+RAZORPAY_GATEWAY = config('RAZORPAY_GATEWAY', default='live')
+RAZORPAY_BASE_URL = config('RAZORPAY_BASE_URL', default='')
+RAZORPAY_CONNECT_TIMEOUT = config('RAZORPAY_CONNECT_TIMEOUT', default=3.05, cast=float)  # seconds
+RAZORPAY_READ_TIMEOUT = config('RAZORPAY_READ_TIMEOUT', default=10, cast=float)
+RAZORPAY_POOL_SIZE = config('RAZORPAY_POOL_SIZE', default=10, cast=int)
+# Consecutive failures before calls fail fast, and seconds before trying again
+RAZORPAY_BREAKER_THRESHOLD = config('RAZORPAY_BREAKER_THRESHOLD', default=5, cast=int)
+RAZORPAY_BREAKER_COOLDOWN = config('RAZORPAY_BREAKER_COOLDOWN', default=30, cast=float)
+
+# UsernameOrPhoneBackend also handles plain usernames (it extends
+# ModelBackend), so a failed login isn't looked up a second time
 AUTHENTICATION_BACKENDS = [
     'authentication.backends.UsernameOrPhoneBackend',
-    'django.contrib.auth.backends.ModelBackend',
 ]
 
 # Logging configuration for production
@@ -260,5 +364,10 @@ LOGGING = {
             'level': 'DEBUG',
             'propagate': False,
         },
+        'mailer': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     },
 }
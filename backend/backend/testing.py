@@ -0,0 +1,172 @@
+"""
+Helpers for the per-endpoint query-count and latency budget tests.
+
+Each app's tests.py seeds a realistic amount of data and calls
+``assertBudget`` for its routes. Query counts are exact-enough upper bounds
+that catch N+1 regressions; latency budgets are generous p50/p95 limits in
+milliseconds that catch accidental O(n) work per request. On slow CI
+machines scale the latency budgets with PERF_BUDGET_SCALE (e.g. 3) and set
+PERF_RUNS to take more samples; PERF_REPORT=1 prints the measured numbers
+for every endpoint, which is how the budgets were picked.
+"""
+import gc
+import math
+import os
+import statistics
+import time
+
+from django.core.cache import caches
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient, APITestCase
+
+from authentication.models import User
+from cart.models import Order, OrderLine
+from product.models import Product
+
+
+BUDGET_SCALE = float(os.environ.get('PERF_BUDGET_SCALE', '1'))
+BUDGET_RUNS = int(os.environ.get('PERF_RUNS', '15'))
+REPORT = os.environ.get('PERF_REPORT') == '1'
+FAST_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+BRANDS = [value for value, _ in Product.BRAND_CHOICES]
+CATEGORIES = ['Lips', 'Eyes', 'Face', 'Nails', 'Skin', 'Hair']
+
+
+def seed_products(count=2000):
+    return Product.objects.bulk_create([
+        Product(
+            name=f'{CATEGORIES[i % len(CATEGORIES)]} shade {i}',
+            brand=BRANDS[i % len(BRANDS)],
+            category=CATEGORIES[i % len(CATEGORIES)],
+            description=f'Long lasting {CATEGORIES[i % len(CATEGORIES)].lower()} product number {i}',
+            price=50 + (i * 37) % 1500,
+            original_price=50 + (i * 37) % 1500,
+            discount_percent=0,
+            stock=i % 40,
+            image='products/seed.jpg',
+        )
+        for i in range(count)
+    ], batch_size=500)
+
+
+def seed_users(count=50, password='password123'):
+    users = [
+        User(
+            username=f'customer{i}',
+            email=f'customer{i}@example.com',
+            name=f'Customer {i}',
+            phone=f'98{i:08d}',
+            address=f'{i} Market Road',
+            city='Surat',
+        )
+        for i in range(count)
+    ]
+    for user in users:
+        user.set_password(password)
+    return User.objects.bulk_create(users)
+
+
+def seed_orders(users, products, per_user=4, lines_per_order=5, status='completed'):
+    orders = Order.objects.bulk_create([
+        Order(user=user, total=0, status=status, address=user.address, payment_status='success')
+        for user in users
+        for _ in range(per_user)
+    ])
+    lines = []
+    for n, order in enumerate(orders):
+        for j in range(lines_per_order):
+            product = products[(n * lines_per_order + j) % len(products)]
+            lines.append(OrderLine(order=order, product=product, product_name=product.name,
+                                   unit_price=product.price, quantity=1 + j % 3))
+    OrderLine.objects.bulk_create(lines, batch_size=1000)
+    return orders
+
+
+def fake_razorpay():
+    """Answer Razorpay calls from the in-process stub gateway (see backend/gateway_stub.py)."""
+    return override_settings(RAZORPAY_GATEWAY='stub')
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile."""
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+@override_settings(LAZY_LOAD_GUARD=True, AUTH_THROTTLE_RATES={})
+class BudgetTestCase(APITestCase):
+    """
+    APITestCase with assertBudget(), a fresh cache for every test, the
+    lazy-load guard switched on and the login rate limits off (budgets
+    request the same endpoint many times over).
+    """
+
+    def setUp(self):
+        super().setUp()
+        for cache in caches.all():
+            cache.clear()
+
+    def client_for(self, user=None):
+        client = APIClient()
+        if user is not None:
+            client.force_authenticate(user)
+        return client
+
+    def assertBudget(self, method, path, *, queries, p50, p95, user=None, client=None, data=None,
+                     status=200, setup=None, runs=None, **extra):
+        """
+        Request path repeatedly and check the response status, the number of
+        queries of the first (cold) request and the p50/p95 latency in ms of
+        the requests after it.
+
+        data is sent as JSON unless a content_type is passed in extra, in
+        which case it goes out as the raw body. setup, if given, runs before
+        every request (outside the timing) and may return a dict of
+        overrides for path/data plus extra request kwargs such as headers.
+        """
+        if 'content_type' not in extra:
+            extra['format'] = 'json'
+        client = client or self.client_for(user)
+        call = getattr(client, method.lower())
+        runs = runs or BUDGET_RUNS
+        timings = []
+        # Like timeit, keep garbage collection pauses out of the samples.
+        gc.collect()
+        gc.disable()
+        try:
+            for run in range(runs):
+                overrides = dict(setup() or {}) if setup is not None else {}
+                request_path = overrides.pop('path', path)
+                request_data = overrides.pop('data', data)
+                with CaptureQueriesContext(connection) as captured:
+                    start = time.perf_counter()
+                    response = call(request_path, request_data, **extra, **overrides)
+                    elapsed = (time.perf_counter() - start) * 1000
+                self.assertEqual(response.status_code, status, getattr(response, 'data', response))
+                if run == 0:
+                    # The first request pays for warm-up (URL resolver, caches,
+                    # imports): count its queries but leave it out of the timings.
+                    path = request_path
+                    cold_queries = len(captured)
+                    self.assertLessEqual(
+                        len(captured), queries,
+                        f'{method} {path} ran {len(captured)} queries (budget {queries}):\n'
+                        + '\n'.join(q['sql'] for q in captured.captured_queries),
+                    )
+                if run or runs == 1:
+                    timings.append(elapsed)
+        finally:
+            gc.enable()
+        observed_p50 = statistics.median(timings)
+        observed_p95 = percentile(timings, 95)
+        if REPORT:
+            print(f'\n{method:6} {path:70} {cold_queries:3} queries  '
+                  f'p50 {observed_p50:7.1f}ms  p95 {observed_p95:7.1f}ms')
+        self.assertLessEqual(observed_p50, p50 * BUDGET_SCALE,
+                             f'{method} {path} p50 {observed_p50:.1f}ms over budget {p50}ms')
+        self.assertLessEqual(observed_p95, p95 * BUDGET_SCALE,
+                             f'{method} {path} p95 {observed_p95:.1f}ms over budget {p95}ms')
+        return response
@@ -0,0 +1,133 @@
+import gzip
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+from unittest.mock import patch
+
+import psycopg
+from django.test import SimpleTestCase
+
+with patch('logging.FileHandler'), patch('logging.basicConfig'):  # no backup.log from the tests
+    import backup
+
+
+class FakeCopy:
+    def __init__(self, conn, statement):
+        self.conn = conn
+        self.fail = conn.fail_csv and 'csv' in repr(statement)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __iter__(self):
+        yield b'1,Kajal\n'
+        if self.fail:
+            self.conn.aborted = True
+            raise psycopg.OperationalError('canceling statement due to statement timeout')
+        yield b'2,Gloss\n'
+
+
+class FakeCursor:
+    rowcount = 2
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, query, params=None):
+        self.conn.check()
+
+    def fetchall(self):
+        return [('id',), ('name',)]
+
+    def copy(self, statement):
+        self.conn.check()
+        return FakeCopy(self.conn, statement)
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    """
+    Enough of a psycopg connection for backup.py's exports. Like
+    PostgreSQL, a failed statement aborts the transaction until it (or the
+    savepoint around the statement) is rolled back.
+    """
+    connection = None  # lets psycopg.sql compose without a server
+
+    def __init__(self, fail_csv=False):
+        self.fail_csv = fail_csv
+        self.aborted = False
+        self.closed = False
+
+    def check(self):
+        if self.aborted:
+            raise psycopg.errors.InFailedSqlTransaction('current transaction is aborted')
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    @contextmanager
+    def transaction(self):
+        try:
+            yield
+        except Exception:
+            self.aborted = False  # ROLLBACK TO SAVEPOINT
+            raise
+
+    def close(self):
+        self.closed = True
+
+
+class BackupExportTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.dir = directory.name
+
+    def export(self, conn, table='cart_order'):
+        with patch.object(backup, 'connect_to_snapshot', return_value=conn):
+            return backup.export_table('snap-1', table, self.dir)
+
+    def test_both_exports_are_written(self):
+        files, complete = self.export(FakeConnection())
+        self.assertTrue(complete)
+        self.assertEqual(sorted(map(os.path.basename, files)), ['cart_order.csv.gz', 'cart_order.sql.gz'])
+        with gzip.open(os.path.join(self.dir, 'cart_order.sql.gz'), 'rt') as f:
+            dump = f.read()
+        self.assertIn('COPY "cart_order" ("id", "name") FROM stdin;\n1,Kajal\n2,Gloss\n\\.\n', dump)
+
+    def test_failed_csv_export_leaves_the_sql_export_working(self):
+        conn = FakeConnection(fail_csv=True)
+        with self.assertLogs(backup.logger, 'ERROR'):
+            files, complete = self.export(conn)
+        self.assertFalse(complete)
+        self.assertEqual(list(map(os.path.basename, files)), ['cart_order.sql.gz'])
+        self.assertEqual(os.listdir(self.dir), ['cart_order.sql.gz'])
+        self.assertTrue(conn.closed)
+
+    def test_manifest_lists_only_complete_tables(self):
+        cwd = os.getcwd()
+        os.chdir(self.dir)
+        self.addCleanup(os.chdir, cwd)
+        with patch.object(backup, 'connect_to_database', return_value=FakeConnection()), \
+                patch.object(backup, 'begin_snapshot', return_value='snap-1'), \
+                patch.object(backup, 'get_table_list', return_value=['cart_order', 'cart_orderline', 'product']), \
+                patch.object(backup, 'BACKUP_WORKERS', 1), \
+                patch.object(backup, 'connect_to_snapshot',
+                             side_effect=[FakeConnection(fail_csv=True), FakeConnection()]), \
+                self.assertLogs(backup.logger) as logs:
+            backup_dir, files = backup.backup_data()
+        with open(os.path.join(backup_dir, 'backup_manifest.json')) as f:
+            manifest = json.load(f)
+        self.assertEqual(manifest['tables_backed_up'], ['cart_orderline'])
+        self.assertEqual(manifest['tables_failed'], ['cart_order'])
+        self.assertEqual(manifest['total_files'], 3)
+        self.assertEqual(sorted(os.listdir(backup_dir)), [
+            'backup_manifest.json', 'cart_order.sql.gz', 'cart_orderline.csv.gz', 'cart_orderline.sql.gz',
+        ])
+        self.assertIn('Backup incomplete for: cart_order', '\n'.join(logs.output))
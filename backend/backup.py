@@ -4,7 +4,8 @@ Database Backup Script with Email Delivery
 
 This script:
 1. Connects to Neon PostgreSQL database
-2. Exports data from specified tables using pandas for efficiency
+2. Streams each table out with COPY into gzipped CSV and SQL files,
+   several tables at a time, in constant memory
 3. Creates zip archive of backup files
 4. Sends backup via email
 5. Deletes old data from database to stay within storage limits
@@ -15,23 +16,27 @@ Usage: python backup.py
 
 import os
 import sys
+import gzip
 import json
 import logging
 import psycopg
-import pandas as pd
 import zipfile
 import smtplib
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.base import MIMEBase
 from email import encoders
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone, timedelta
 from decouple import config
+from psycopg import sql
 
 # Configuration
 EXCLUDED_FROM_BACKUP = ['auth_user', 'auth_group', 'product']  # Tables to exclude from backup
 EXCLUDED_FROM_DELETION = ['auth_user', 'auth_group', 'product', 'django_migrations', 'django_content_type', 'django_admin_log']  # Tables to never delete from
 RETENTION_DAYS = 30  # Keep data for 30 days
+BACKUP_WORKERS = config('BACKUP_WORKERS', default=4, cast=int)  # Tables exported at once, one connection each
+COMPRESS_LEVEL = 6
 
 # Timezone Configuration (IST = UTC+5:30)
 IST_TIMEZONE = timezone(timedelta(hours=5, minutes=30))
@@ -93,60 +98,105 @@ def get_table_list(conn):
         logger.error(f"❌ Failed to get table list: {e}")
         raise
 
+def begin_snapshot(conn):
+    """Open a repeatable-read transaction and export its snapshot, so every
+    worker connection backs up the database as of the same moment"""
+    conn.isolation_level = psycopg.IsolationLevel.REPEATABLE_READ
+    return conn.execute("SELECT pg_export_snapshot()").fetchone()[0]
+
+def connect_to_snapshot(snapshot):
+    """A new connection that reads from the exported snapshot"""
+    conn = connect_to_database()
+    conn.isolation_level = psycopg.IsolationLevel.REPEATABLE_READ
+    conn.execute(sql.SQL("SET TRANSACTION SNAPSHOT {}").format(sql.Literal(snapshot)))
+    return conn
+
+def copy_to_file(conn, statement, out):
+    """Stream COPY ... TO STDOUT into an open file; returns the row count.
+    Only one chunk is held in memory at a time."""
+    cursor = conn.cursor()
+    with cursor.copy(statement) as copy:
+        for data in copy:
+            out.write(data)
+    rows = cursor.rowcount
+    cursor.close()
+    return rows
+
+def remove_partial_file(path):
+    """Delete what a failed export left behind, so it isn't zipped and mailed"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
 def export_table_to_csv(conn, table_name, backup_dir):
-    """Export a single table to CSV format"""
+    """Export a single table to gzipped CSV with a header row"""
+    csv_file = os.path.join(backup_dir, f"{table_name}.csv.gz")
     try:
-        query = f"SELECT * FROM {table_name}"
-        df = pd.read_sql_query(query, conn)
-        
-        csv_file = os.path.join(backup_dir, f"{table_name}.csv")
-        df.to_csv(csv_file, index=False)
+        statement = sql.SQL("COPY {} TO STDOUT WITH (FORMAT csv, HEADER)").format(sql.Identifier(table_name))
+        # A savepoint: if the COPY fails, only it is rolled back and the
+        # snapshot transaction stays usable for the SQL export
+        with conn.transaction():
+            with gzip.open(csv_file, 'wb', compresslevel=COMPRESS_LEVEL) as f:
+                rows = copy_to_file(conn, statement, f)
         
-        logger.info(f"📊 Exported {table_name}: {len(df)} rows")
+        logger.info(f"📊 Exported {table_name}: {rows} rows")
         return csv_file
     except Exception as e:
         logger.error(f"❌ Failed to export {table_name}: {e}")
+        remove_partial_file(csv_file)
         return None
 
 def export_table_to_sql(conn, table_name, backup_dir):
-    """Export a single table to SQL format"""
+    """Export a single table to a gzipped SQL file that psql can restore
+    (a COPY ... FROM stdin block, the way pg_dump writes data)"""
+    sql_file = os.path.join(backup_dir, f"{table_name}.sql.gz")
     try:
         cursor = conn.cursor()
         
         # Get table structure
-        cursor.execute(f"SELECT column_name, data_type FROM information_schema.columns WHERE table_name = '{table_name}' ORDER BY ordinal_position")
-        columns = cursor.fetchall()
+        cursor.execute(
+            "SELECT column_name FROM information_schema.columns "
+            "WHERE table_schema = 'public' AND table_name = %s ORDER BY ordinal_position",
+            (table_name,)
+        )
+        columns = sql.SQL(', ').join(sql.Identifier(row[0]) for row in cursor.fetchall())
+        cursor.close()
+        table = sql.Identifier(table_name)
         
-        # Get table data
-        cursor.execute(f"SELECT * FROM {table_name}")
-        rows = cursor.fetchall()
+        with conn.transaction():
+            with gzip.open(sql_file, 'wb', compresslevel=COMPRESS_LEVEL) as f:
+                f.write(f"-- Table: {table_name}\n".encode())
+                f.write(f"-- Exported on: {get_ist_time()}\n\n".encode())
+                f.write(sql.SQL("COPY {} ({}) FROM stdin;\n").format(table, columns).as_string(conn).encode())
+                rows = copy_to_file(conn, sql.SQL("COPY {} ({}) TO STDOUT").format(table, columns), f)
+                f.write(b"\\.\n")
         
-        sql_file = os.path.join(backup_dir, f"{table_name}.sql")
-        with open(sql_file, 'w') as f:
-            f.write(f"-- Table: {table_name}\n")
-            f.write(f"-- Exported on: {get_ist_time()}\n\n")
-            
-            if rows:
-                # Create INSERT statements
-                column_names = [col[0] for col in columns]
-                placeholders = ', '.join(['%s'] * len(column_names))
-                insert_sql = f"INSERT INTO {table_name} ({', '.join(column_names)}) VALUES ({placeholders});\n"
-                
-                for row in rows:
-                    f.write(insert_sql % row)
-        
-        cursor.close()
-        logger.info(f"📄 Exported {table_name} to SQL: {len(rows)} rows")
+        logger.info(f"📄 Exported {table_name} to SQL: {rows} rows")
         return sql_file
     except Exception as e:
         logger.error(f"❌ Failed to export {table_name} to SQL: {e}")
+        remove_partial_file(sql_file)
         return None
 
+def export_table(snapshot, table_name, backup_dir):
+    """Export one table to CSV and SQL on its own connection.
+    Returns the files written and whether both exports succeeded."""
+    conn = connect_to_snapshot(snapshot)
+    try:
+        files = [export_table_to_csv(conn, table_name, backup_dir),
+                 export_table_to_sql(conn, table_name, backup_dir)]
+        return [f for f in files if f], all(files)
+    finally:
+        conn.close()
+
 def backup_data():
     """Backup data from all tables except excluded ones"""
     logger.info("🔄 Starting database backup...")
     
     conn = connect_to_database()
+    # conn holds the snapshot open until every worker has finished
+    snapshot = begin_snapshot(conn)
     tables = get_table_list(conn)
     
     # Create backup directory with IST timestamp
@@ -155,26 +205,27 @@ def backup_data():
     os.makedirs(backup_dir, exist_ok=True)
     
     backup_files = []
+    backed_up, failed = [], []
     
     try:
         for table in tables:
-            if table not in EXCLUDED_FROM_BACKUP:
-                # Export to CSV
-                csv_file = export_table_to_csv(conn, table, backup_dir)
-                if csv_file:
-                    backup_files.append(csv_file)
-                
-                # Export to SQL
-                sql_file = export_table_to_sql(conn, table, backup_dir)
-                if sql_file:
-                    backup_files.append(sql_file)
-            else:
+            if table in EXCLUDED_FROM_BACKUP:
                 logger.info(f"⏭️ Skipping {table} (excluded from backup)")
+        to_back_up = [t for t in tables if t not in EXCLUDED_FROM_BACKUP]
+        
+        with ThreadPoolExecutor(max_workers=max(1, BACKUP_WORKERS)) as pool:
+            results = pool.map(lambda table: export_table(snapshot, table, backup_dir), to_back_up)
+            for table, (files, complete) in zip(to_back_up, results):
+                backup_files.extend(files)
+                (backed_up if complete else failed).append(table)
+        if failed:
+            logger.warning(f"⚠️ Backup incomplete for: {', '.join(failed)}")
         
         # Create backup manifest
         manifest = {
             'timestamp': timestamp,
-            'tables_backed_up': [t for t in tables if t not in EXCLUDED_FROM_BACKUP],
+            'tables_backed_up': backed_up,
+            'tables_failed': failed,
             'tables_excluded': EXCLUDED_FROM_BACKUP,
             'total_files': len(backup_files),
             'backup_date': get_ist_time().isoformat()
@@ -201,7 +252,9 @@ def create_zip_archive(backup_dir, backup_files):
             for file_path in backup_files:
                 # Add file to zip with relative path
                 arcname = os.path.basename(file_path)
-                zipf.write(file_path, arcname)
+                # The exports are gzipped already; deflating them again only costs time
+                compression = zipfile.ZIP_STORED if file_path.endswith('.gz') else zipfile.ZIP_DEFLATED
+                zipf.write(file_path, arcname, compress_type=compression)
                 logger.info(f"📦 Added to zip: {arcname}")
         
         logger.info(f"✅ Zip archive created: {zip_filename}")
@@ -230,7 +283,8 @@ Database Backup Completed Successfully!
 📦 Attachment: {os.path.basename(zip_filename)}
 📅 Backup Date: {get_ist_time().strftime('%Y-%m-%d %H:%M:%S')}
 
-This backup contains all database tables in both CSV and SQL formats.
+This backup contains all database tables as gzipped CSV and SQL files
+(restore a table with: gunzip -c table.sql.gz | psql).
         """
         
         msg.attach(MIMEText(body, 'plain'))
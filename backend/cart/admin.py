@@ -1,6 +1,8 @@
-from django.contrib import admin
-from .models import CartItem, Order
+from django.contrib import admin, messages
 from django.utils import timezone
+from .models import CartItem, Order, OrderLine, OrderTransition, WebhookEvent
+from .approvals import decide_orders
+from .cache import invalidate_order_counts_on_commit
 
 @admin.register(CartItem)
 class CartItemAdmin(admin.ModelAdmin):
@@ -8,27 +10,64 @@ class CartItemAdmin(admin.ModelAdmin):
     search_fields = ('user__username', 'product__name')
     list_filter = ('user', 'product')
 
+class OrderLineInline(admin.TabularInline):
+    model = OrderLine
+    fields = ('product', 'product_name', 'unit_price', 'quantity')
+    raw_id_fields = ('product',)
+    extra = 0
+
+class OrderTransitionInline(admin.TabularInline):
+    model = OrderTransition
+    fields = ('created_at', 'name', 'from_status', 'to_status', 'from_payment_status', 'to_payment_status',
+              'actor', 'reference')
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     list_display = ('id', 'user', 'total', 'status', 'payment_status', 'created_at', 'decision_time')
     search_fields = ('user__username', 'transaction_id', 'address')
     list_filter = ('status', 'payment_status', 'created_at')
-    readonly_fields = ('created_at', 'updated_at', 'decision_time')
+    # Status only changes through the approve/reject actions and payments (cart.states)
+    readonly_fields = ('status', 'payment_status', 'created_at', 'updated_at', 'decision_time')
+    inlines = [OrderLineInline, OrderTransitionInline]
     
     actions = ['approve_orders', 'reject_orders']
+
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        invalidate_order_counts_on_commit()
     
+    def _decide(self, request, queryset, action):
+        results = decide_orders([{'id': pk} for pk in queryset.values_list('pk', flat=True)], action, actor=request.user)
+        succeeded = [r for r in results if r['ok']]
+        if succeeded:
+            self.message_user(request, f'{len(succeeded)} orders were successfully {action}d.')
+        for result in results:
+            if not result['ok']:
+                self.message_user(request, f"Order #{result['order_id']}: {result['error']}", messages.WARNING)
+
     def approve_orders(self, request, queryset):
-        updated = queryset.update(
-            status='approved',
-            decision_time=timezone.now()
-        )
-        self.message_user(request, f'{updated} orders were successfully approved.')
+        self._decide(request, queryset, 'approve')
     approve_orders.short_description = "Approve selected orders"
     
     def reject_orders(self, request, queryset):
-        updated = queryset.update(
-            status='rejected',
-            decision_time=timezone.now()
-        )
-        self.message_user(request, f'{updated} orders were successfully rejected.')
+        self._decide(request, queryset, 'reject')
     reject_orders.short_description = "Reject selected orders"
+
+@admin.register(WebhookEvent)
+class WebhookEventAdmin(admin.ModelAdmin):
+    list_display = ('id', 'event', 'event_id', 'status', 'attempts', 'occurred_at', 'processed_at')
+    search_fields = ('event_id', 'event')
+    list_filter = ('status', 'event')
+    readonly_fields = ('event_id', 'event', 'body', 'occurred_at', 'received_at', 'processed_at', 'attempts', 'last_error')
+    actions = ['reprocess_events']
+
+    def reprocess_events(self, request, queryset):
+        updated = queryset.update(status='pending', next_attempt_at=timezone.now())
+        self.message_user(request, f'{updated} events will be applied again by the webhook worker.')
+    reprocess_events.short_description = "Apply selected events again"
@@ -0,0 +1,216 @@
+"""
+Approving and rejecting orders, one or many at a time.
+
+decide_orders() is the single code path behind the per-order approval view,
+the bulk decision endpoint and the Django admin actions. For a batch it:
+
+* loads the orders with their lines and existing stock holds (3 queries),
+* checks stock for every order in the batch against one aggregated read of
+  the products involved, oldest order first, so one short product only
+  fails the orders that actually need it,
+* takes the stock for all new holds with one conditional UPDATE per
+  distinct product and writes the holds in one INSERT,
+* moves every order with one compare-and-swap UPDATE (cart.states), which
+  also writes shipping charge, comment and decision time, and records the
+  transitions with one INSERT,
+* queues the approval emails with a single INSERT into the outbox.
+"""
+import logging
+from collections import defaultdict
+
+from django.db import transaction
+from django.utils import timezone
+
+from product.models import Product
+from .emails import send_order_approval_emails
+from .models import Order, StockReservation
+from .states import apply_transitions, can_transition
+from .reservations import (
+    InsufficientStock, release_expired_reservations, release_order_stock,
+    reserve_new_orders_stock, reserve_order_stock,
+)
+
+logger = logging.getLogger(__name__)
+
+ACTIONS = ('approve', 'reject')
+MAX_BULK_DECISIONS = 500
+DEFAULT_COMMENTS = {
+    'approve': "Order approved. Stock is reserved until payment.",
+    'reject': "Order rejected.",
+}
+
+
+def parse_shipping_charge(value):
+    if value is None:
+        return 0
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return 0
+
+
+class _Conflict(Exception):
+    """An order changed under the batch; roll the whole decision back."""
+
+
+def _failure(order_id, code, error):
+    return {'order_id': order_id, 'ok': False, 'code': code, 'error': error}
+
+
+def _needed_quantities(order, reservations):
+    """
+    {product_id: quantity} the order needs to hold, or None if it has
+    reservation rows already (a re-approval, handled order by order).
+    """
+    if reservations:
+        return None
+    needed = defaultdict(int)
+    for line in order.lines.all():
+        if line.product_id is not None:
+            needed[line.product_id] += line.quantity
+    return dict(needed)
+
+
+def _check_stock(orders, needed, products):
+    """
+    Allocate available stock to orders oldest first.
+
+    Returns {order_id: InsufficientStock} for the orders that don't fit.
+    """
+    remaining = {pk: product.stock for pk, product in products.items()}
+    short = {}
+    for order in sorted(orders, key=lambda o: (o.created_at, o.id)):
+        quantities = needed.get(order.id)
+        if not quantities:
+            continue
+        for product_id, quantity in sorted(quantities.items()):
+            available = remaining.get(product_id, 0)
+            if available < quantity:
+                name = products[product_id].name if product_id in products else product_id
+                short[order.id] = InsufficientStock(name, available, quantity)
+                break
+        else:
+            for product_id, quantity in quantities.items():
+                remaining[product_id] -= quantity
+    return short
+
+
+def decide_orders(decisions, action, comment='', shipping_charge=None, actor=None):
+    """
+    Approve or reject a batch of orders.
+
+    decisions is a list of {'id', optional 'comment', optional
+    'shipping_charge'}; comment and shipping_charge are the defaults for
+    entries that don't set their own. actor is the admin, recorded in the
+    order history. Returns one result dict per decision, in the same order:
+    {'order_id', 'ok': True, 'status', 'comment'} or {'order_id', 'ok':
+    False, 'code', 'error'}.
+    """
+    if action not in ACTIONS:
+        raise ValueError(f"Invalid action {action!r}")
+
+    # First decision wins if an order is listed twice
+    decisions = list({d['id']: d for d in reversed(decisions)}.values())[::-1]
+    order_ids = [d['id'] for d in decisions]
+    orders = Order.objects.with_details().in_bulk(order_ids)
+    reservations = defaultdict(list)
+    for reservation in StockReservation.objects.filter(order_id__in=list(orders)):
+        reservations[reservation.order_id].append(reservation)
+
+    results = {}
+    decided = []
+    for decision in decisions:
+        order = orders.get(decision['id'])
+        if order is None:
+            results[decision['id']] = _failure(decision['id'], 'not_found', "Order not found")
+        elif not can_transition(order, action):
+            results[order.id] = _failure(order.id, 'invalid_status', f"Order is already {order.status}")
+        else:
+            decided.append((order, decision))
+
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            to_save = _decide(decided, action, comment, shipping_charge, reservations, results, now, actor)
+    except _Conflict:
+        # Someone else (a payment, another admin) moved an order while we were
+        # deciding; nothing was written, so the admin can simply retry.
+        for order, _ in decided:
+            results[order.id] = _failure(order.id, 'conflict', "Order was updated by someone else, please retry")
+        to_save = []
+
+    logger.info(f"{action}: {len(to_save)} of {len(decisions)} order(s) decided")
+    return [results[order_id] for order_id in order_ids]
+
+
+def _decide(decided, action, comment, shipping_charge, reservations, results, now, actor):
+    if action == 'approve':
+        release_expired_reservations()
+        approvable = _reserve_stock([order for order, _ in decided], reservations, results)
+    else:
+        for order, _ in decided:
+            if any(r.status == 'held' for r in reservations.get(order.id, ())):
+                release_order_stock(order)
+        approvable = {order.id for order, _ in decided}
+
+    changes = []
+    for order, decision in decided:
+        if order.id not in approvable:
+            continue
+        fields = {
+            'admin_comment': decision.get('comment') or comment or DEFAULT_COMMENTS[action],
+            'decision_time': now,
+        }
+        if action == 'approve':
+            fields['shipping_charge'] = parse_shipping_charge(decision.get('shipping_charge', shipping_charge))
+        changes.append((order, fields))
+    to_save = apply_transitions(changes, action, actor=actor, now=now)
+    if len(to_save) != len(changes):
+        raise _Conflict()
+    for order in to_save:
+        results[order.id] = {
+            'order_id': order.id, 'ok': True, 'status': order.status, 'comment': order.admin_comment,
+        }
+    if action == 'approve':
+        send_order_approval_emails(to_save)
+    return to_save
+
+
+def _reserve_stock(orders, reservations, results):
+    """Hold stock for orders; returns the ids that got it and records failures in results."""
+    needed = {order.id: _needed_quantities(order, reservations.get(order.id)) for order in orders}
+    product_ids = {pid for quantities in needed.values() if quantities for pid in quantities}
+    products = Product.objects.only('id', 'name', 'stock').in_bulk(product_ids)
+    short = _check_stock(orders, needed, products)
+    for order_id, error in short.items():
+        results[order_id] = _failure(order_id, 'insufficient_stock', str(error))
+
+    fresh = {order_id: quantities for order_id, quantities in needed.items()
+             if quantities is not None and order_id not in short}
+    approvable = set(fresh)
+    try:
+        with transaction.atomic():
+            reserve_new_orders_stock({k: v for k, v in fresh.items() if v})
+    except InsufficientStock:
+        # Someone bought stock between the check and the update; fall back to
+        # reserving order by order so only the orders that lost out fail.
+        approvable = set()
+        for order in orders:
+            if order.id in fresh:
+                approvable |= _reserve_one(order, results)
+
+    # Orders that already hold stock (re-approvals) extend or top up their holds.
+    for order in orders:
+        if needed[order.id] is None:
+            approvable |= _reserve_one(order, results)
+    return approvable
+
+
+def _reserve_one(order, results):
+    try:
+        with transaction.atomic():
+            reserve_order_stock(order)
+    except InsufficientStock as e:
+        results[order.id] = _failure(order.id, 'insufficient_stock', str(e))
+        return set()
+    return {order.id}
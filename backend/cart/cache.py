@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Count
+
+
+ORDER_COUNTS_KEY = 'orders:status-counts'
+
+
+def get_order_cache():
+    return caches[getattr(settings, 'ORDER_CACHE_ALIAS', 'default')]
+
+
+def get_order_status_counts():
+    """
+    Return {status: count, ..., 'total': n} for every order status.
+
+    Computed with one GROUP BY over the status index and cached until the
+    next status transition (or ORDER_COUNTS_TIMEOUT as a backstop).
+    """
+    from .models import Order  # models import this module
+
+    cache = get_order_cache()
+    counts = cache.get(ORDER_COUNTS_KEY)
+    if counts is None:
+        counts = {value: 0 for value, _ in Order.STATUS_CHOICES}
+        for row in Order.objects.values('status').annotate(count=Count('id')).order_by():
+            counts[row['status']] = row['count']
+        counts['total'] = sum(counts.values())
+        cache.set(ORDER_COUNTS_KEY, counts, getattr(settings, 'ORDER_COUNTS_TIMEOUT', 60))
+    return counts
+
+
+def invalidate_order_counts():
+    get_order_cache().delete(ORDER_COUNTS_KEY)
+
+
+def invalidate_order_counts_on_commit():
+    """Drop the cached counts once the surrounding transaction commits, so a
+    concurrent reader can't re-cache the pre-commit numbers."""
+    transaction.on_commit(invalidate_order_counts)
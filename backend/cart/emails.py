@@ -0,0 +1,105 @@
+"""
+Customer emails for orders.
+
+The *_email(order) builders render the templates in
+cart/templates/cart/emails/ and return an EmailMultiAlternatives, or None
+when the customer has no email address. The send_* helpers put the email
+on the outbound queue. Nothing here talks to SMTP, so the helpers are safe
+to call from request handlers and webhooks.
+"""
+import logging
+
+from mailer.outbox import enqueue, enqueue_many
+from mailer.rendering import render_email
+
+logger = logging.getLogger(__name__)
+
+
+def _shipping(order):
+    return order.shipping_charge or 0
+
+
+def order_approval_email(order):
+    if not order.user.email:
+        return None
+    return render_email(
+        'cart/emails/order_approved.html',
+        {'order': order, 'shipping_charge': _shipping(order), 'order_total': order.total + _shipping(order)},
+        subject=f'Order Approved - Order #{order.id}',
+        text=f'Your order #{order.id} has been approved! Please complete your payment to proceed.',
+        to=[order.user.email],
+    )
+
+
+def payment_success_email(order):
+    # Lines are snapshots taken at order time, so they are still there after
+    # checkout and show the prices the customer paid
+    if not order.user.email:
+        return None
+    return render_email(
+        'cart/emails/payment_success.html',
+        {
+            'order': order,
+            'lines': order.lines.all(),
+            'shipping_charge': _shipping(order),
+            'total_paid': order.total + _shipping(order),
+        },
+        subject='Payment Successful - Shree Krishna Beauty Products',
+        text=f'Thank you for your purchase! Your order #{order.id} was successful.',
+        to=[order.user.email],
+    )
+
+
+def payment_failure_email(order):
+    if not order.user.email:
+        return None
+    return render_email(
+        'cart/emails/payment_failed.html',
+        {'order': order},
+        subject=f'Payment Failed - Order #{order.id}',
+        text=f'Your payment for order #{order.id} failed. Please try again or contact support.',
+        to=[order.user.email],
+    )
+
+
+def _build(builder, order):
+    # A broken template must never fail the order change that queued the email
+    try:
+        return builder(order)
+    except Exception as e:
+        logger.error(f"Error building {builder.__name__} for order {order.id}: {str(e)}")
+        return None
+
+
+def send_order_approval_email(order):
+    email = _build(order_approval_email, order)
+    if email is not None:
+        enqueue(email)
+
+
+def send_order_approval_emails(orders):
+    """Queue approval emails for many orders with one INSERT."""
+    emails = (_build(order_approval_email, order) for order in orders)
+    return enqueue_many(email for email in emails if email is not None)
+
+
+def send_payment_success_email(order):
+    # The payment callback and the payment.captured webhook both confirm the
+    # same payment; the dedupe key makes sure the customer hears it once.
+    email = _build(payment_success_email, order)
+    if email is not None:
+        enqueue(email, dedupe_key=f'payment-success:{order.id}')
+
+
+def send_payment_success_emails(orders):
+    """Queue success emails for many paid orders with one INSERT."""
+    emails = ((_build(payment_success_email, order), order.id) for order in orders)
+    return enqueue_many(
+        (email, f'payment-success:{order_id}') for email, order_id in emails if email is not None
+    )
+
+
+def send_payment_failure_email(order, payment_id=None):
+    email = _build(payment_failure_email, order)
+    if email is not None:
+        enqueue(email, dedupe_key=f'payment-failed:{order.id}:{payment_id}' if payment_id else None)
@@ -0,0 +1,84 @@
+from datetime import datetime, time, timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework import serializers
+
+from product.filters import parse_list
+from .models import Order
+
+
+STATUS_VALUES = [value for value, _ in Order.STATUS_CHOICES]
+MAX_ID = 2 ** 63 - 1  # largest bigint primary key
+
+
+def _parse_moment(params, name):
+    """
+    Parse an ISO date or datetime into (aware datetime, is_whole_day).
+    A bare date comes back as midnight at the start of that day.
+    """
+    value = params.get(name)
+    if value in (None, ''):
+        return None, False
+    # Dates first: parse_datetime would also accept a bare date as midnight.
+    try:
+        day = parse_date(value)
+        moment = None if day else parse_datetime(value)
+    except ValueError:
+        moment = day = None
+    if moment is None and day is None:
+        raise serializers.ValidationError({name: 'Must be an ISO date or datetime.'})
+    if moment is None:
+        moment = datetime.combine(day, time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment, day is not None
+
+
+def parse_statuses(params, default=('pending',)):
+    """?status=pending,approved; 'all' (or an explicit empty value) means no status filter."""
+    if 'status' not in params:
+        return list(default)
+    statuses = parse_list(params, 'status')
+    if statuses in ([], ['all']):
+        return []
+    unknown = [s for s in statuses if s not in STATUS_VALUES]
+    if unknown:
+        raise serializers.ValidationError(
+            {'status': f"Unknown status(es): {', '.join(unknown)}. Choose from {', '.join(STATUS_VALUES)} or all."}
+        )
+    return statuses
+
+
+def filter_orders(queryset, params):
+    """
+    Apply the admin queue query parameters:
+
+    status          comma-separated statuses, or all (default: pending)
+    created_after   ISO date/datetime, inclusive
+    created_before  ISO date/datetime; a bare date includes that whole day
+    user            username, or a user id (all-digit usernames match too)
+    """
+    statuses = parse_statuses(params)
+    if len(statuses) == 1:
+        queryset = queryset.filter(status=statuses[0])
+    elif statuses:
+        queryset = queryset.filter(status__in=statuses)
+
+    created_after, _ = _parse_moment(params, 'created_after')
+    if created_after is not None:
+        queryset = queryset.filter(created_at__gte=created_after)
+    created_before, whole_day = _parse_moment(params, 'created_before')
+    if whole_day:
+        queryset = queryset.filter(created_at__lt=created_before + timedelta(days=1))
+    elif created_before is not None:
+        queryset = queryset.filter(created_at__lte=created_before)
+
+    user = params.get('user')
+    if user:
+        match = Q(user__username=user)
+        if user.isascii() and user.isdigit() and int(user) <= MAX_ID:
+            match |= Q(user_id=int(user))
+        queryset = queryset.filter(match)
+    return queryset
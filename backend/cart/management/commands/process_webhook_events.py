@@ -0,0 +1,45 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, close_old_connections
+
+from cart.webhooks import process_pending_events
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Apply recorded Razorpay webhook events in the order the gateway created them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--interval', type=float, default=1,
+                            help='Seconds to sleep when there is nothing to apply')
+        parser.add_argument('--once', action='store_true',
+                            help='Apply what is due now and exit instead of running forever')
+
+    def handle(self, *args, **options):
+        total = 0
+        try:
+            while True:
+                # Drop a database connection that broke or outlived CONN_MAX_AGE
+                close_old_connections()
+                try:
+                    applied = process_pending_events(limit=options['batch_size'])
+                except DatabaseError:
+                    if options['once']:
+                        raise
+                    # The batch rolled back; its events are still pending
+                    logger.exception('Database error in the webhook worker, retrying')
+                    time.sleep(options['interval'])
+                    continue
+                total += applied
+                if applied == options['batch_size']:
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f'Applied {total} webhook event(s)'))
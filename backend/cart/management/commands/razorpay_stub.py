@@ -0,0 +1,54 @@
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand
+
+from backend.gateway_stub import StubGateway, flatten_query
+
+
+class Command(BaseCommand):
+    help = 'Serve a local stub of the Razorpay API for offline load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=9000)
+        parser.add_argument('--latency-ms', type=float, default=0,
+                            help='Delay added to every response, to mimic the real gateway')
+
+    def handle(self, *args, **options):
+        gateway = StubGateway(latency=options['latency_ms'] / 1000)
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive, like the real API
+
+            def _respond(self):
+                url = urlsplit(self.path)
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                status, payload = gateway.handle(
+                    self.command, url.path, flatten_query(url.query), json.loads(body) if body else None,
+                )
+                data = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = do_PATCH = do_PUT = do_DELETE = _respond
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((options['host'], options['port']), Handler)
+        self.stdout.write(self.style.SUCCESS(
+            f"Razorpay stub listening on http://{options['host']}:{options['port']}/v1 "
+            f"(set RAZORPAY_BASE_URL to this)"
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,47 @@
+from datetime import datetime, time, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from cart.reconciliation import fixture_payments, gateway_payments, reconcile_payments
+
+
+def parse_moment(value):
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f"Invalid date/time: {value}")
+        moment = datetime.combine(day, time.min)
+    return moment if timezone.is_aware(moment) else timezone.make_aware(moment)
+
+
+class Command(BaseCommand):
+    help = 'Bring orders in line with the payments Razorpay recorded (fixes missed callbacks and webhooks)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='start', help='Start of the window, date or ISO time (default: 24h ago)')
+        parser.add_argument('--to', dest='end', help='End of the window (default: now)')
+        parser.add_argument('--fixture', help='Read payments from a JSONL export (.gz or - for stdin) '
+                                              'instead of the gateway')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help='Report what would change without writing')
+
+    def handle(self, *args, **options):
+        if options['fixture']:
+            payments = fixture_payments(options['fixture'])
+        else:
+            end = parse_moment(options['end']) if options['end'] else timezone.now()
+            start = parse_moment(options['start']) if options['start'] else end - timedelta(days=1)
+            if start >= end:
+                raise CommandError('--from must be before --to')
+            payments = gateway_payments(start, end)
+
+        totals = reconcile_payments(payments, batch_size=options['batch_size'], dry_run=options['dry_run'])
+
+        prefix = '[dry run] ' if options['dry_run'] else ''
+        summary = ', '.join(f'{count} {name}' for name, count in totals.items() if name != 'payments')
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}Reconciled {totals['payments']} payment(s): {summary or 'nothing to do'}"
+        ))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from cart.reservations import release_expired_reservations
+
+
+class Command(BaseCommand):
+    help = 'Return stock held by approved orders whose reservation has expired'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            released = release_expired_reservations(limit=options['batch_size'])
+            total += released
+            if released < options['batch_size']:
+                break
+        self.stdout.write(self.style.SUCCESS(f'Released {total} expired reservation(s)'))
@@ -0,0 +1,66 @@
+from django.db import migrations
+
+
+BATCH_SIZE = 2000
+
+
+def copy_items_to_lines(apps, schema_editor):
+    """
+    Snapshot each order's linked cart items as order lines, then delete those
+    items: they were per-order copies, not part of anyone's basket. Orders
+    whose items were already deleted at checkout have nothing left to copy.
+    """
+    Order = apps.get_model("cart", "Order")
+    OrderLine = apps.get_model("cart", "OrderLine")
+    CartItem = apps.get_model("cart", "CartItem")
+    links = (
+        Order.items.through.objects.select_related("cartitem__product")
+        .order_by("order_id", "cartitem_id")
+        .iterator(chunk_size=BATCH_SIZE)
+    )
+    batch = []
+    for link in links:
+        item = link.cartitem
+        batch.append(
+            OrderLine(
+                order_id=link.order_id,
+                product_id=item.product_id,
+                product_name=item.product.name,
+                unit_price=item.product.price,
+                quantity=item.quantity,
+            )
+        )
+        if len(batch) >= BATCH_SIZE:
+            OrderLine.objects.bulk_create(batch)
+            batch = []
+    OrderLine.objects.bulk_create(batch)
+    CartItem.objects.filter(order__isnull=False).delete()
+
+
+def copy_lines_to_items(apps, schema_editor):
+    Order = apps.get_model("cart", "Order")
+    OrderLine = apps.get_model("cart", "OrderLine")
+    CartItem = apps.get_model("cart", "CartItem")
+    lines = (
+        OrderLine.objects.filter(product__isnull=False)
+        .select_related("order")
+        .order_by("id")
+        .iterator(chunk_size=BATCH_SIZE)
+    )
+    for line in lines:
+        item = CartItem.objects.create(
+            user_id=line.order.user_id, product_id=line.product_id, quantity=line.quantity
+        )
+        Order.items.through.objects.create(order_id=line.order_id, cartitem_id=item.id)
+    OrderLine.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("cart", "0007_orderline"),
+    ]
+
+    operations = [
+        migrations.RunPython(copy_items_to_lines, copy_lines_to_items),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:23
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("cart", "0008_copy_order_items_to_lines"),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name="order",
+            name="items",
+        ),
+    ]
@@ -1,15 +1,33 @@
 from django.db import models
+from django.db.models.functions import Lead
 from django.conf import settings
+from django.utils import timezone
 from product.models import Product
+from .cache import invalidate_order_counts_on_commit
 
 # Create your models here.
 
+class CartItemQuerySet(models.QuerySet):
+    def with_product(self):
+        """Everything CartItemSerializer reads, in one query."""
+        return self.select_related('product')
+
+class OrderQuerySet(models.QuerySet):
+    def with_user(self):
+        return self.select_related('user')
+
+    def with_details(self):
+        """Everything OrderSerializer reads: the user joined in, lines in one extra query."""
+        return self.select_related('user').prefetch_related('lines')
+
 class CartItem(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='cart_items')
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
     added_at = models.DateTimeField(auto_now_add=True)
 
+    objects = CartItemQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.product.name} x {self.quantity} ({self.user.username})"
 
@@ -20,11 +38,15 @@ class Order(models.Model):
         ('rejected', 'Rejected'),
         ('completed', 'Completed'),
     ]
+    PAYMENT_STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('success', 'Success'),
+        ('failed', 'Failed'),
+    ]
     
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='orders')
-    items = models.ManyToManyField(CartItem)
     total = models.DecimalField(max_digits=10, decimal_places=2)
-    payment_status = models.CharField(max_length=20, default='pending')
+    payment_status = models.CharField(max_length=20, choices=PAYMENT_STATUS_CHOICES, default='pending')
     transaction_id = models.CharField(max_length=100, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -36,5 +58,165 @@ class Order(models.Model):
     decision_time = models.DateTimeField(null=True, blank=True)
     shipping_charge = models.IntegerField(default=0)
 
+    objects = OrderQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Admin queue: filter on status, keyset-paginate on (created_at, id)
+            models.Index(fields=['status', 'created_at', 'id'], name='order_status_created_idx'),
+        ]
+
     def __str__(self):
         return f"Order #{self.id} by {self.user.username} - {self.status}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
+
+    def save(self, *args, **kwargs):
+        status_changed = self._state.adding or self.status != getattr(self, '_loaded_status', None)
+        super().save(*args, **kwargs)
+        self._loaded_status = self.status
+        if status_changed:
+            invalidate_order_counts_on_commit()
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        invalidate_order_counts_on_commit()
+        return result
+
+class OrderLine(models.Model):
+    """
+    One product on an order. Name and unit price are copied from the product
+    when the order is placed, so order history and totals don't change when
+    the catalog does (or when the product is deleted).
+    """
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='lines')
+    product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, blank=True, related_name='order_lines')
+    product_name = models.CharField(max_length=255)
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+    quantity = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        ordering = ['id']
+
+    @property
+    def line_total(self):
+        return self.unit_price * self.quantity
+
+    def __str__(self):
+        return f"{self.product_name} x {self.quantity} (order #{self.order_id})"
+
+class OrderTransitionQuerySet(models.QuerySet):
+    def with_time_in_state(self):
+        """
+        Annotate left_at: when the order made its next transition (None while
+        it is still in to_status). left_at - created_at is the time spent there.
+        """
+        return self.annotate(left_at=models.Window(
+            Lead('created_at'),
+            partition_by=[models.F('order_id')],
+            order_by=[models.F('created_at').asc(), models.F('id').asc()],
+        ))
+
+class OrderTransition(models.Model):
+    """
+    One change of an order's status or payment_status, written by
+    cart.states in the same transaction as the change itself. Rows are only
+    ever added. An order's first state (pending) starts at Order.created_at.
+    """
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='transitions')
+    name = models.CharField(max_length=30)
+    from_status = models.CharField(max_length=20)
+    to_status = models.CharField(max_length=20)
+    from_payment_status = models.CharField(max_length=20)
+    to_payment_status = models.CharField(max_length=20)
+    actor = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True,
+                              related_name='+')
+    reference = models.CharField(max_length=100, blank=True, help_text="e.g. the Razorpay payment id")
+    created_at = models.DateTimeField(default=timezone.now)
+
+    objects = OrderTransitionQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['created_at', 'id']
+        indexes = [
+            models.Index(fields=['order', 'created_at', 'id'], name='order_transition_order_idx'),
+            # Time-in-state reports: everything that entered a status in a window
+            models.Index(fields=['to_status', 'created_at'], name='order_transition_status_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Order transitions are append-only")
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"Order #{self.order_id}: {self.name} ({self.from_status} -> {self.to_status})"
+
+class StockReservation(models.Model):
+    """
+    Stock held for an approved order. Product.stock is decremented when the
+    hold is taken, so ``held`` and ``committed`` quantities are never sold
+    twice; releasing a hold puts the quantity back.
+    """
+    STATUS_CHOICES = [
+        ('held', 'Held'),
+        ('committed', 'Committed'),
+        ('released', 'Released'),
+    ]
+
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='reservations')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='held')
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['order', 'product'], name='unique_reservation_per_order_product'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'expires_at'], name='reservation_status_exp_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} for order #{self.order_id} ({self.status})"
+
+class WebhookEvent(models.Model):
+    """
+    A Razorpay webhook delivery, stored as received. The webhook view only
+    records the event (the unique event_id turns Razorpay's retries into
+    no-ops) and the process_webhook_events worker applies pending events
+    in the order the gateway created them.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processed', 'Processed'),
+        ('ignored', 'Ignored'),
+        ('failed', 'Failed'),
+    ]
+
+    event_id = models.CharField(max_length=100, unique=True)
+    event = models.CharField(max_length=50)
+    body = models.TextField()
+    occurred_at = models.DateTimeField()
+    received_at = models.DateTimeField(auto_now_add=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['occurred_at', 'id']
+        indexes = [
+            models.Index(fields=['status', 'occurred_at', 'id'], name='webhook_event_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.event} {self.event_id} ({self.status})"
@@ -0,0 +1,11 @@
+from backend.pagination import OptionalCursorPagination
+
+
+class AdminOrderCursorPagination(OptionalCursorPagination):
+    page_size = 50
+    # Both orderings walk the (status, created_at, id) index.
+    ordering_choices = {
+        'created_at': ('created_at', 'id'),
+        '-created_at': ('-created_at', '-id'),
+    }
+    default_ordering = '-created_at'
@@ -0,0 +1,188 @@
+"""
+Payment reconciliation.
+
+Orders normally move to completed/failed when the payment callback or a
+webhook arrives. If both are missed the order sits in 'approved' forever.
+reconcile_payments() walks the payments Razorpay has for a time window
+(gateway_payments()) or a saved export (fixture_payments()) and applies
+whatever didn't happen:
+
+* a captured payment completes its approved order (stock committed,
+  success email queued, transaction_id recorded);
+* a failed payment marks an approved, still-pending order as failed.
+
+Payments are handled in batches. Each batch is matched with one query,
+which loads only the orders it mentions into a dict keyed by
+transaction_id and id. The notes.order_id we send when creating the
+Razorpay order gives the id, or failing that the order_<id> receipt of
+that Razorpay order: payment entities carry no receipt of their own, so
+gateway_payments() asks for the order to be expanded into each one. The
+batch's changes go through cart.states as grouped compare-and-swap
+UPDATEs, so an order a webhook moves meanwhile is left alone. Memory stays
+at one batch however long the window is. Anything that doesn't line up is counted, not
+fixed: an order that isn't approved, or an amount that doesn't match.
+"""
+import gzip
+import json
+import logging
+import re
+import sys
+from collections import Counter
+from contextlib import nullcontext
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from backend.gateway import get_razorpay_client
+from .emails import send_payment_success_emails
+from .models import Order
+from .reservations import commit_orders_stock, release_order_stock
+from .states import apply_transitions, can_transition
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 100  # the most GET /payments returns per call
+RECEIPT_PATTERN = re.compile(r'^order_(\d+)$')
+
+
+def gateway_payments(start, end, client=None, page_size=PAGE_SIZE):
+    """Yield every payment created between start and end, a page at a time."""
+    client = client or get_razorpay_client()
+    # expand[]=order embeds the Razorpay order, whose receipt names our order
+    params = {'from': int(start.timestamp()), 'to': int(end.timestamp()), 'count': page_size, 'expand[]': 'order'}
+    skip = 0
+    while True:
+        items = client.payment.all(dict(params, skip=skip)).get('items', [])
+        yield from items
+        if len(items) < page_size:
+            return
+        skip += len(items)
+
+
+def fixture_payments(path):
+    """Yield payments from a JSONL export (one payment entity per line, .gz or - for stdin)."""
+    if path == '-':
+        source = nullcontext(sys.stdin)
+    elif path.endswith('.gz'):
+        source = gzip.open(path, 'rt', encoding='utf-8')
+    else:
+        source = open(path, encoding='utf-8')
+    with source as lines:
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def local_order_id(payment):
+    """Our Order id for a payment: from its notes, else from its expanded order's order_<id> receipt."""
+    notes = payment.get('notes')
+    # Razorpay sends empty notes as [] rather than {}
+    order_id = notes.get('order_id') if isinstance(notes, dict) else None
+    if order_id and str(order_id).isdigit():
+        return int(order_id)
+    razorpay_order = payment.get('order')
+    receipt = razorpay_order.get('receipt') if isinstance(razorpay_order, dict) else None
+    match = RECEIPT_PATTERN.match(receipt or '')
+    return int(match.group(1)) if match else None
+
+
+def amount_due(order):
+    """What the customer was asked to pay, in paise."""
+    return int((order.total + (order.shipping_charge or 0)) * 100)
+
+
+def match_batch(payments, orders):
+    """
+    Decide what each payment means for its order.
+
+    Returns (to_complete, to_fail, stats). to_complete maps order id to
+    (order, payment id), to_fail maps order id to order.
+    """
+    by_id = {order.pk: order for order in orders}
+    by_transaction = {order.transaction_id: order for order in orders if order.transaction_id}
+    to_complete, to_fail, stats = {}, {}, Counter()
+
+    for payment in payments:
+        order = by_transaction.get(payment.get('id')) or by_id.get(local_order_id(payment))
+        if order is None:
+            stats['unmatched'] += 1
+            continue
+        state = payment.get('status')
+        if state == 'captured':
+            if order.status == 'completed' and order.payment_status == 'success':
+                stats['in sync'] += 1
+            elif not can_transition(order, 'complete'):
+                logger.warning(f"Payment {payment['id']} captured for order {order.id} in status {order.status}")
+                stats['skipped'] += 1
+            elif abs(payment.get('amount', 0) - amount_due(order)) > 1:
+                # 1 paisa of slack: the payment views round the rupee total down
+                logger.warning(f"Payment {payment['id']} amount {payment.get('amount')} doesn't match "
+                               f"order {order.id} ({amount_due(order)})")
+                stats['amount mismatch'] += 1
+            else:
+                to_complete[order.pk] = (order, payment['id'])
+                to_fail.pop(order.pk, None)
+        elif state == 'failed':
+            if order.payment_status == 'pending' and can_transition(order, 'fail_payment') and order.pk not in to_complete:
+                to_fail[order.pk] = order
+            else:
+                stats['in sync'] += 1
+        else:
+            # created / authorized / refunded: nothing for us to do yet
+            stats['not final'] += 1
+    return to_complete, to_fail, stats
+
+
+def apply_batch(to_complete, to_fail, now):
+    """Write the batch's transitions; returns how many orders were (completed, failed)."""
+    completed = apply_transitions(
+        [(order, {'transaction_id': payment_id}) for order, payment_id in to_complete.values()], 'complete', now=now,
+    )
+    if completed:
+        commit_orders_stock(completed)
+        send_payment_success_emails(Order.objects.with_details().filter(pk__in=[order.pk for order in completed]))
+    failed = apply_transitions([(order, {}) for order in to_fail.values()], 'fail_payment', now=now)
+    for order in failed:
+        release_order_stock(order)
+    return len(completed), len(failed)
+
+
+def reconcile_batch(payments, dry_run=False):
+    """Match and apply one batch of payments. Returns a Counter of outcomes."""
+    payment_ids = [payment['id'] for payment in payments if payment.get('id')]
+    order_ids = {order_id for order_id in map(local_order_id, payments) if order_id}
+    with transaction.atomic():
+        orders = Order.objects.filter(Q(pk__in=order_ids) | Q(transaction_id__in=payment_ids))
+        to_complete, to_fail, stats = match_batch(payments, list(orders))
+        if dry_run:
+            completed, failed = len(to_complete), len(to_fail)
+        else:
+            completed, failed = apply_batch(to_complete, to_fail, timezone.now())
+    stats['completed'] += completed
+    stats['failed'] += failed
+    # An order a webhook got to between our read and our write
+    stats['in sync'] += len(to_complete) + len(to_fail) - completed - failed
+    return stats
+
+
+def reconcile_payments(payments, batch_size=1000, dry_run=False):
+    """Reconcile an iterable of payment entities. Returns a Counter of outcomes."""
+    totals = Counter()
+    for batch in batched(payments, batch_size):
+        totals['payments'] += len(batch)
+        totals.update(reconcile_batch(batch, dry_run=dry_run))
+    if totals['completed'] or totals['failed']:
+        logger.info(f"Reconciliation {'would change' if dry_run else 'changed'} "
+                    f"{totals['completed']} completed / {totals['failed']} failed orders")
+    return totals
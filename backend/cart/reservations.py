@@ -0,0 +1,247 @@
+"""
+Stock reservations.
+
+Stock is taken with a conditional UPDATE (``stock >= qty`` in the WHERE
+clause, ``F('stock') - qty`` in the SET), so two checkouts racing for the
+last unit can't both win and nothing needs a table lock. Reservation rows
+move between held/committed/released with the same compare-and-swap style,
+so whichever caller flips a row first is the only one that touches stock.
+
+    approve  -> reserve_order_stock()   held, expires after STOCK_RESERVATION_TTL
+    payment  -> commit_paid_order_stock() committed (re-takes stock if the hold lapsed)
+    reject / payment failure -> release_order_stock()
+    release_expired_reservations() returns lapsed holds to stock
+"""
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from product.cache import bump_catalog_version_on_commit
+from product.models import Product
+from .models import OrderLine, StockReservation
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RESERVATION_TTL = timedelta(hours=48)
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product_name, available, requested):
+        self.product_name = product_name
+        self.available = available
+        self.requested = requested
+        super().__init__(
+            f"Insufficient stock for {product_name}. Available: {available}, Requested: {requested}"
+        )
+
+
+class _LostRace(Exception):
+    """Another request moved the reservation first; roll back our stock change."""
+
+
+def get_reservation_ttl():
+    return getattr(settings, 'STOCK_RESERVATION_TTL', DEFAULT_RESERVATION_TTL)
+
+
+def order_quantities(order):
+    """Return {product_id: total quantity} for the order's lines."""
+    rows = (
+        order.lines.filter(product__isnull=False)
+        .values('product_id').annotate(quantity=Sum('quantity')).order_by()
+    )
+    return {row['product_id']: row['quantity'] for row in rows}
+
+
+def _take_stock(product_id, quantity):
+    """Decrement stock only if enough is left. Returns False when it isn't."""
+    return Product.objects.filter(pk=product_id, stock__gte=quantity).update(stock=F('stock') - quantity) == 1
+
+
+def _return_stock(product_id, quantity):
+    Product.objects.filter(pk=product_id).update(stock=F('stock') + quantity)
+
+
+def _insufficient(product_id, requested):
+    product = Product.objects.filter(pk=product_id).values('name', 'stock').first() or {'name': product_id, 'stock': 0}
+    return InsufficientStock(product['name'], product['stock'], requested)
+
+
+def _move(reservation, from_status, **changes):
+    """Compare-and-swap a reservation out of from_status."""
+    return StockReservation.objects.filter(pk=reservation.pk, status=from_status).update(
+        updated_at=timezone.now(), **changes
+    ) == 1
+
+
+def reserve_order_stock(order, ttl=None):
+    """
+    Hold stock for every product in order, all or nothing.
+
+    Re-approving an order that already holds stock just extends the hold.
+    Raises InsufficientStock (with nothing reserved) if any product is short.
+    """
+    expires_at = timezone.now() + (ttl or get_reservation_ttl())
+    quantities = order_quantities(order)
+    reservations = {r.product_id: r for r in StockReservation.objects.filter(order=order)}
+
+    with transaction.atomic():
+        # Always touch products in the same order so concurrent
+        # reservations can't deadlock on each other's row locks.
+        for product_id in sorted(quantities):
+            quantity = quantities[product_id]
+            reservation = reservations.get(product_id)
+            if reservation is not None:
+                if reservation.status == 'committed':
+                    continue
+                if reservation.status == 'held' and _move(reservation, 'held', expires_at=expires_at):
+                    continue
+            if not _take_stock(product_id, quantity):
+                raise _insufficient(product_id, quantity)
+            if reservation is None:
+                StockReservation.objects.create(
+                    order=order, product_id=product_id, quantity=quantity, expires_at=expires_at
+                )
+            elif not _move(reservation, 'released', status='held', quantity=quantity, expires_at=expires_at):
+                raise _insufficient(product_id, quantity)
+        bump_catalog_version_on_commit(stock_only=True)
+    return expires_at
+
+
+def reserve_new_orders_stock(quantities_by_order, ttl=None):
+    """
+    Hold stock for many orders that hold nothing yet, all or nothing.
+
+    quantities_by_order maps order id -> {product_id: quantity}. Stock is
+    taken with one conditional UPDATE per distinct product (summed over all
+    the orders) and the holds are written in one INSERT. Raises
+    InsufficientStock, with nothing reserved, if any product is short; the
+    caller is expected to have checked availability already, so that only
+    happens when a concurrent sale got in first.
+    """
+    expires_at = timezone.now() + (ttl or get_reservation_ttl())
+    totals = defaultdict(int)
+    for quantities in quantities_by_order.values():
+        for product_id, quantity in quantities.items():
+            totals[product_id] += quantity
+
+    with transaction.atomic():
+        for product_id in sorted(totals):
+            if not _take_stock(product_id, totals[product_id]):
+                raise _insufficient(product_id, totals[product_id])
+        StockReservation.objects.bulk_create([
+            StockReservation(order_id=order_id, product_id=product_id, quantity=quantity, expires_at=expires_at)
+            for order_id, quantities in quantities_by_order.items()
+            for product_id, quantity in quantities.items()
+        ])
+        bump_catalog_version_on_commit(stock_only=True)
+    return expires_at
+
+
+def commit_order_stock(order):
+    """
+    Turn the order's holds into committed stock once payment succeeds.
+
+    Idempotent: committing twice (e.g. the payment callback and the webhook)
+    takes stock only once. If a hold lapsed and was released, stock is taken
+    again, raising InsufficientStock if it has sold out in the meantime.
+    """
+    quantities = order_quantities(order)
+    reservations = {r.product_id: r for r in StockReservation.objects.filter(order=order)}
+    now = timezone.now()
+
+    for product_id in sorted(quantities):
+        quantity = quantities[product_id]
+        reservation = reservations.get(product_id)
+        if reservation is not None:
+            if reservation.status == 'committed':
+                continue
+            if reservation.status == 'held' and _move(reservation, 'held', status='committed'):
+                continue
+        try:
+            with transaction.atomic():
+                if not _take_stock(product_id, quantity):
+                    raise _insufficient(product_id, quantity)
+                if reservation is None:
+                    StockReservation.objects.create(
+                        order=order, product_id=product_id, quantity=quantity,
+                        status='committed', expires_at=now,
+                    )
+                elif not _move(reservation, 'released', status='committed', quantity=quantity):
+                    raise _LostRace()
+                bump_catalog_version_on_commit(stock_only=True)
+        except (_LostRace, IntegrityError):
+            # A concurrent commit got there first; its stock change stands.
+            logger.info(f"Stock for product {product_id} on order {order.id} already committed")
+
+
+def commit_paid_order_stock(order):
+    """
+    commit_order_stock() for an order the customer has already paid for.
+
+    The payment callback, the webhook and reconciliation all land here, so
+    they agree on a lapsed hold whose stock has sold out meanwhile: the
+    order still completes and the shortfall is logged for someone to sort
+    out by hand, since refusing it wouldn't refund the customer.
+    """
+    try:
+        commit_order_stock(order)
+    except InsufficientStock as e:
+        logger.error(f"Order {order.id} paid but {e}")
+
+
+def commit_orders_stock(orders):
+    """
+    commit_paid_order_stock() for many orders.
+
+    Holds still in place are committed with one UPDATE. Only orders left
+    with a product that has no committed reservation go through
+    commit_paid_order_stock() one at a time. Those are orders whose hold
+    lapsed, or that never had one.
+    """
+    by_id = {order.pk: order for order in orders}
+    StockReservation.objects.filter(order_id__in=by_id, status='held').update(
+        status='committed', updated_at=timezone.now()
+    )
+    committed = set(
+        StockReservation.objects.filter(order_id__in=by_id, status='committed').values_list('order_id', 'product_id')
+    )
+    lines = OrderLine.objects.filter(order_id__in=by_id, product__isnull=False).values_list('order_id', 'product_id')
+    for order_id in sorted({line[0] for line in lines if line not in committed}):
+        commit_paid_order_stock(by_id[order_id])
+
+
+def _release(reservation_id, product_id, quantity):
+    with transaction.atomic():
+        if StockReservation.objects.filter(pk=reservation_id, status='held').update(
+            status='released', updated_at=timezone.now()
+        ):
+            _return_stock(product_id, quantity)
+            bump_catalog_version_on_commit(stock_only=True)
+            return True
+    return False
+
+
+def release_order_stock(order):
+    """Give back any stock still held for order. Committed stock is kept."""
+    held = StockReservation.objects.filter(order=order, status='held').values_list('pk', 'product_id', 'quantity')
+    return sum(_release(*row) for row in held)
+
+
+def release_expired_reservations(now=None, limit=500):
+    """Release up to limit holds whose TTL has passed. Returns how many were released."""
+    now = now or timezone.now()
+    expired = (
+        StockReservation.objects
+        .filter(status='held', expires_at__lte=now)
+        .order_by('expires_at')
+        .values_list('pk', 'product_id', 'quantity')[:limit]
+    )
+    released = sum(_release(*row) for row in expired)
+    if released:
+        logger.info(f"Released {released} expired stock reservations")
+    return released
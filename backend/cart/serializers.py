@@ -1,13 +1,17 @@
 from rest_framework import serializers
-from .models import CartItem, Order
+from .models import CartItem, Order, OrderLine
 from product.models import Product
+from backend.query_guard import LazyLoadGuardMixin
+from product.serializers import SparseFieldsetMixin
+
+class ProductSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    sparse_fieldset_key = 'product'
 
-class ProductSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = ['id', 'name', 'category', 'price', 'image', 'stock']
 
-class CartItemSerializer(serializers.ModelSerializer):
+class CartItemSerializer(LazyLoadGuardMixin, serializers.ModelSerializer):
     product = ProductSerializer(read_only=True)
     product_id = serializers.PrimaryKeyRelatedField(queryset=Product.objects.all(), source='product', write_only=True)
 
@@ -15,8 +19,20 @@ class CartItemSerializer(serializers.ModelSerializer):
         model = CartItem
         fields = ['id', 'product', 'product_id', 'quantity', 'added_at']
 
-class OrderSerializer(serializers.ModelSerializer):
-    items = CartItemSerializer(many=True, read_only=True)
+class OrderLineSerializer(serializers.ModelSerializer):
+    product = serializers.SerializerMethodField()
+    line_total = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+
+    class Meta:
+        model = OrderLine
+        fields = ['id', 'product', 'quantity', 'unit_price', 'line_total']
+
+    def get_product(self, line):
+        # Snapshot taken when the order was placed, not the live product
+        return {'id': line.product_id, 'name': line.product_name, 'price': str(line.unit_price)}
+
+class OrderSerializer(LazyLoadGuardMixin, serializers.ModelSerializer):
+    items = OrderLineSerializer(source='lines', many=True, read_only=True)
     user_username = serializers.CharField(source='user.username', read_only=True)
     user_name = serializers.CharField(source='user.name', read_only=True)
     user_phone = serializers.CharField(source='user.phone', read_only=True)
@@ -0,0 +1,184 @@
+"""
+Order state machine.
+
+An order's state is its (status, payment_status) pair. TRANSITIONS lists
+every move the app makes and the states each may start from:
+
+    approve       pending/approved/rejected          -> approved
+    reject        pending/approved/rejected          -> rejected
+    complete      approved/rejected, not yet paid    -> completed, paid
+    fail_payment  approved, not yet paid             -> payment failed
+
+(complete is allowed from rejected because a customer can finish paying
+after an admin rejects: the money has moved, so the order is fulfilled.)
+
+Transitions are written as a compare-and-swap, ``UPDATE ... WHERE id = ?
+AND status = <as read> AND payment_status = <as read>``, instead of
+load-then-save. If another request moved the order after we read it,
+nothing is written and the caller finds out: apply_transition() returns
+False. The last save() no longer silently wins. Every move that lands adds
+an OrderTransition row in the same transaction.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from .cache import invalidate_order_counts_on_commit
+from .models import Order, OrderTransition
+
+
+class InvalidTransition(Exception):
+    """The order isn't in a state the transition can start from."""
+
+
+class _LostRace(Exception):
+    """An order in the batch moved under us; roll back and go one by one."""
+
+
+class Transition:
+    def __init__(self, name, from_status, to_status=None, from_payment=None, to_payment=None):
+        self.name = name
+        self.from_status = from_status
+        self.to_status = to_status
+        self.from_payment = from_payment
+        self.to_payment = to_payment
+
+    def allows(self, order):
+        return order.status in self.from_status and (
+            self.from_payment is None or order.payment_status in self.from_payment
+        )
+
+    def target(self, order):
+        return self.to_status or order.status, self.to_payment or order.payment_status
+
+    def columns(self):
+        """The SET part of the UPDATE: only what this transition changes."""
+        columns = {}
+        if self.to_status:
+            columns['status'] = self.to_status
+        if self.to_payment:
+            columns['payment_status'] = self.to_payment
+        return columns
+
+
+TRANSITIONS = {t.name: t for t in [
+    Transition('approve', ('pending', 'approved', 'rejected'), to_status='approved'),
+    Transition('reject', ('pending', 'approved', 'rejected'), to_status='rejected'),
+    Transition('complete', ('approved', 'rejected'), from_payment=('pending', 'failed'),
+               to_status='completed', to_payment='success'),
+    Transition('fail_payment', ('approved',), from_payment=('pending', 'failed'), to_payment='failed'),
+]}
+
+
+def can_transition(order, name):
+    return TRANSITIONS[name].allows(order)
+
+
+def _check(transition, order):
+    if not transition.allows(order):
+        raise InvalidTransition(
+            f"Can't {transition.name} order {order.id} ({order.status}, payment {order.payment_status})"
+        )
+
+
+def _history(transition, order, now, actor, reference):
+    to_status, to_payment = transition.target(order)
+    return OrderTransition(
+        order_id=order.pk, name=transition.name, from_status=order.status, to_status=to_status,
+        from_payment_status=order.payment_status, to_payment_status=to_payment,
+        actor=actor, reference=reference, created_at=now,
+    )
+
+
+def _moved(order, transition, now, fields):
+    order.status, order.payment_status = transition.target(order)
+    order._loaded_status = order.status
+    order.updated_at = now
+    for name, value in fields.items():
+        setattr(order, name, value)
+
+
+def _swap(order, transition, now, fields):
+    return Order.objects.filter(
+        pk=order.pk, status=order.status, payment_status=order.payment_status,
+    ).update(updated_at=now, **transition.columns(), **fields) == 1
+
+
+def apply_transition(order, name, *, actor=None, reference='', now=None, **fields):
+    """
+    Move one order, also writing fields (e.g. transaction_id) in the same UPDATE.
+
+    Raises InvalidTransition if the order, as loaded, can't make this move;
+    returns False if it was moved by someone else since it was loaded.
+    On success the instance is updated to match the row.
+    """
+    transition = TRANSITIONS[name]
+    _check(transition, order)
+    now = now or timezone.now()
+    with transaction.atomic(savepoint=False):
+        if not _swap(order, transition, now, fields):
+            return False
+        _history(transition, order, now, actor, reference).save()
+        if transition.to_status:
+            invalidate_order_counts_on_commit()
+    _moved(order, transition, now, fields)
+    return True
+
+
+def apply_transitions(changes, name, *, actor=None, now=None):
+    """
+    Move many orders. changes is a list of (order, {field: value}) pairs.
+
+    Orders read in the same state are moved with one UPDATE (per-order
+    fields go in as CASE expressions); if any of them moved under us that
+    group falls back to one compare-and-swap per order. The history rows go
+    in with one INSERT, with transaction_id (if set) as their reference.
+    Returns the orders that moved.
+    """
+    transition = TRANSITIONS[name]
+    now = now or timezone.now()
+    groups = defaultdict(list)
+    for order, fields in changes:
+        _check(transition, order)
+        groups[order.status, order.payment_status].append((order, fields))
+
+    moved = []
+    with transaction.atomic(savepoint=False):
+        for (status, payment_status), group in groups.items():
+            if len(group) == 1:
+                # Nothing to roll back for a single order
+                moved.extend((order, fields) for order, fields in group if _swap(order, transition, now, fields))
+                continue
+            try:
+                with transaction.atomic():
+                    _swap_group(group, status, payment_status, transition, now)
+                moved.extend(group)
+            except _LostRace:
+                moved.extend((order, fields) for order, fields in group if _swap(order, transition, now, fields))
+        OrderTransition.objects.bulk_create([
+            _history(transition, order, now, actor, fields.get('transaction_id', ''))
+            for order, fields in moved
+        ])
+        if moved and transition.to_status:
+            invalidate_order_counts_on_commit()
+    for order, fields in moved:
+        _moved(order, transition, now, fields)
+    return [order for order, _ in moved]
+
+
+def _swap_group(group, status, payment_status, transition, now):
+    pks = [order.pk for order, _ in group]
+    columns = {}
+    for name in {name for _, fields in group for name in fields}:
+        field = Order._meta.get_field(name)
+        columns[name] = Case(
+            *(When(pk=order.pk, then=Value(fields[name], output_field=field)) for order, fields in group if name in fields),
+            default=F(name), output_field=field,
+        )
+    updated = Order.objects.filter(pk__in=pks, status=status, payment_status=payment_status).update(
+        updated_at=now, **transition.columns(), **columns
+    )
+    if updated != len(pks):
+        raise _LostRace()
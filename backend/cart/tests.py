@@ -1,3 +1,1086 @@
-from django.test import TestCase
+import hashlib
+import hmac
+import json
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
 
-# Create your tests here.
+import requests
+
+from django.conf import settings
+from django.core import mail
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from requests.adapters import BaseAdapter
+from rest_framework.test import APIClient
+
+from authentication.models import User
+from mailer.models import OutboundEmail
+from backend.gateway import CircuitBreaker, GatewayUnavailable, get_razorpay_client, reset_razorpay_clients
+from backend.query_guard import LazyLoadError
+from backend.testing import BudgetTestCase, fake_razorpay, seed_orders, seed_products, seed_users
+from product.models import Product
+from .cache import get_order_cache, get_order_status_counts
+from .emails import order_approval_email, payment_success_email
+from .reconciliation import gateway_payments, reconcile_payments
+from .models import CartItem, Order, OrderLine, OrderTransition, StockReservation, WebhookEvent
+from .reservations import commit_order_stock, release_expired_reservations, reserve_order_stock
+from .serializers import OrderSerializer
+from .states import InvalidTransition, apply_transition, apply_transitions
+from .webhooks import handle_payment_captured, handle_payment_failed, process_pending_events
+
+
+class OrderCreateQueryCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='buyer', password='secret', address='1 Main St', city='Surat')
+        cls.products = Product.objects.bulk_create([
+            Product(name=f'Product {i}', brand='Orane', category='Lips', price=100, original_price=100,
+                    discount_percent=0, stock=50, image='products/p.jpg')
+            for i in range(10)
+        ])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def place_order(self, count):
+        items = [{'product_id': p.id, 'quantity': 2} for p in self.products[:count]]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/cart/orders/', {'items': items}, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        Order.objects.filter(user=self.user).delete()
+        return response, len(queries)
+
+    def test_query_count_does_not_grow_with_basket_size(self):
+        _, one_item = self.place_order(1)
+        response, ten_items = self.place_order(10)
+        self.assertEqual(one_item, ten_items)
+        self.assertLessEqual(ten_items, 7)
+        self.assertEqual(len(response.data['items']), 10)
+        self.assertEqual(response.data['total'], '2000.00')
+
+    def test_order_lines_snapshot_name_and_price(self):
+        response = self.client.post('/api/cart/orders/', {'items': [{'product_id': self.products[0].id, 'quantity': 3}]},
+                                    format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        Product.objects.filter(pk=self.products[0].pk).update(name='Renamed', price=999)
+        line = OrderLine.objects.get(order_id=response.data['id'])
+        self.assertEqual((line.product_name, line.unit_price, line.quantity), ('Product 0', 100, 3))
+        self.assertFalse(CartItem.objects.exists())
+
+        detail = self.client.get(f"/api/cart/orders/{response.data['id']}/")
+        item = detail.data['items'][0]
+        self.assertEqual(item['product'], {'id': self.products[0].id, 'name': 'Product 0', 'price': '100.00'})
+        self.assertEqual(item['line_total'], '300.00')
+
+    def test_unknown_product_is_rejected(self):
+        response = self.client.post('/api/cart/orders/', {'items': [{'product_id': 999999}]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+    def test_invalid_quantity_is_rejected(self):
+        items = [{'product_id': self.products[0].id, 'quantity': 0}]
+        response = self.client.post('/api/cart/orders/', {'items': items}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(LAZY_LOAD_GUARD=True)
+class LazyLoadGuardTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='guarded', password='secret')
+        product = Product.objects.create(name='Kajal', brand='Orane', category='Eyes', price=80, stock=5,
+                                         image='products/p.jpg')
+        order = Order.objects.create(user=user, total=80, address='Surat')
+        OrderLine.objects.create(order=order, product=product, product_name=product.name, unit_price=80, quantity=1)
+
+    def test_lazy_load_raises(self):
+        order = Order.objects.get()
+        with self.assertRaises(LazyLoadError):
+            OrderSerializer(order).data
+
+    def test_eager_loaded_order_renders_without_queries(self):
+        orders = list(Order.objects.with_details())
+        with self.assertNumQueries(0):
+            data = OrderSerializer(orders, many=True).data
+        self.assertEqual(data[0]['user_username'], 'guarded')
+        self.assertEqual(len(data[0]['items']), 1)
+
+    @override_settings(LAZY_LOAD_GUARD=False)
+    def test_guard_off(self):
+        self.assertEqual(len(OrderSerializer(Order.objects.get()).data['items']), 1)
+
+    def test_fifty_orders_cost_two_queries(self):
+        user = User.objects.get()
+        Order.objects.bulk_create([Order(user=user, total=0) for _ in range(49)])
+        client = APIClient()
+        client.force_authenticate(user)
+        with self.assertNumQueries(2):
+            response = client.get('/api/cart/orders/')
+        self.assertEqual(len(response.data), 50)
+
+
+class CartEndpointBudgetTests(BudgetTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.products = seed_products(500)
+        cls.users = seed_users(20)
+        cls.customer = cls.users[0]
+        cls.admin = User.objects.create_user(username='staff', password='secret', is_staff=True)
+        seed_orders(cls.users, cls.products, per_user=4, lines_per_order=5)
+        seed_orders(cls.users[1:], cls.products, per_user=1, lines_per_order=5, status='pending')
+        CartItem.objects.bulk_create([
+            CartItem(user=cls.customer, product=product, quantity=1) for product in cls.products[:10]
+        ])
+
+    def make_order(self, status, user=None, lines=5):
+        user = user or self.customer
+        order = Order.objects.create(user=user, total=500, status=status, address=user.address)
+        OrderLine.objects.bulk_create([
+            OrderLine(order=order, product=product, product_name=product.name, unit_price=product.price, quantity=1)
+            for product in self.products[101:101 + lines]
+        ])
+        if status == 'approved':
+            reserve_order_stock(order)
+        return order
+
+    def approved_order(self):
+        return self.make_order('approved')
+
+    def pending_order(self):
+        order = self.make_order('pending', user=self.users[1])
+        return {'path': f'/api/cart/admin/orders/{order.id}/approve/'}
+
+    def no_pending_orders(self):
+        Order.objects.filter(user=self.customer, status='pending').delete()
+
+    def test_cart_list(self):
+        response = self.assertBudget('GET', '/api/cart/cart/', user=self.customer, queries=1, p50=40, p95=80)
+        self.assertEqual(len(response.data), 10)
+
+    def test_cart_add(self):
+        self.assertBudget('POST', '/api/cart/cart/', user=self.customer, data={'product_id': self.products[50].id, 'quantity': 2},
+                          status=201, queries=2, p50=30, p95=60)
+
+    def test_cart_item_retrieve_update_delete(self):
+        item = CartItem.objects.filter(user=self.customer).first()
+        self.assertBudget('GET', f'/api/cart/cart/{item.id}/', user=self.customer, queries=1, p50=20, p95=40)
+        self.assertBudget('PATCH', f'/api/cart/cart/{item.id}/', user=self.customer, data={'quantity': 3},
+                          queries=2, p50=30, p95=60)
+        items = iter(CartItem.objects.filter(user=self.customer).values_list('id', flat=True))
+        self.assertBudget('DELETE', '', user=self.customer, status=204, runs=5, queries=2, p50=20, p95=40,
+                          setup=lambda: {'path': f'/api/cart/cart/{next(items)}/'})
+
+    def test_order_list(self):
+        response = self.assertBudget('GET', '/api/cart/orders/', user=self.customer, queries=2, p50=40, p95=80)
+        self.assertEqual(len(response.data), 4)
+
+    def test_order_create(self):
+        items = [{'product_id': p.id, 'quantity': 1} for p in self.products[:5]]
+        self.assertBudget('POST', '/api/cart/orders/', user=self.customer, data={'items': items}, status=201,
+                          setup=self.no_pending_orders,
+                          queries=7, p50=50, p95=100)
+
+    def test_order_detail(self):
+        order = Order.objects.filter(user=self.customer).first()
+        response = self.assertBudget('GET', f'/api/cart/orders/{order.id}/', user=self.customer, queries=2, p50=30, p95=60)
+        self.assertEqual(len(response.data['items']), 5)
+
+    def test_admin_order_list(self):
+        response = self.assertBudget('GET', '/api/cart/admin/orders/', user=self.admin, queries=2, p50=80, p95=160)
+        self.assertEqual(len(response.data), 19)
+
+    def test_admin_order_queue_paginated(self):
+        response = self.assertBudget('GET', '/api/cart/admin/orders/?page_size=10&status=pending,completed',
+                                     user=self.admin, queries=3, p50=80, p95=160)
+        self.assertEqual(len(response.data['results']), 10)
+        self.assertEqual(response.data['counts']['pending'], 19)
+
+    def test_admin_order_counts(self):
+        response = self.assertBudget('GET', '/api/cart/admin/orders/counts/', user=self.admin, queries=1, p50=10, p95=20)
+        self.assertEqual(response.data['completed'], 80)
+
+    def test_admin_bulk_decision(self):
+        def setup():
+            return {'data': {'action': 'approve', 'shipping_charge': 40,
+                             'orders': [self.make_order('pending', user=user).id for user in self.users[1:5]]}}
+        response = self.assertBudget('POST', '/api/cart/admin/orders/bulk-decision/', user=self.admin, setup=setup,
+                                     runs=5, queries=24, p50=150, p95=300)
+        self.assertEqual(response.data['succeeded'], 4)
+
+    def test_admin_order_approve(self):
+        self.assertBudget('POST', '', user=self.admin, data={'action': 'approve', 'shipping_charge': 50},
+                          setup=self.pending_order, runs=10, queries=20, p50=60, p95=120)
+
+    def test_admin_order_reject(self):
+        self.assertBudget('POST', '', user=self.admin, data={'action': 'reject'},
+                          setup=self.pending_order, runs=10, queries=7, p50=30, p95=60)
+
+    def test_user_order_status(self):
+        self.approved_order()
+        response = self.assertBudget('GET', '/api/cart/order-status/', user=self.customer, queries=2, p50=30, p95=60)
+        self.assertEqual(response.data['status'], 'approved')
+
+    def test_checkout(self):
+        order = self.approved_order()
+        self.assertBudget('POST', f'/api/cart/checkout/{order.id}/', user=self.customer, queries=1, p50=20, p95=40)
+
+    def test_razorpay_order_create(self):
+        order = self.approved_order()
+        with fake_razorpay():
+            response = self.assertBudget('POST', f'/api/cart/orders/{order.id}/razorpay-order/', user=self.customer,
+                                         queries=1, p50=20, p95=40)
+        self.assertEqual(response.data['amount'], 50000)
+
+    def test_payment_completion(self):
+        def setup():
+            order = self.approved_order()
+            return {'path': f'/api/cart/orders/{order.id}/complete-payment/'}
+        self.assertBudget('POST', '', user=self.customer, data={'razorpay_payment_id': 'pay_TEST'},
+                          setup=setup, runs=10, queries=14, p50=60, p95=120)
+
+    def test_razorpay_webhook(self):
+        def setup():
+            order = self.approved_order()
+            body = json.dumps({
+                'event': 'payment.captured',
+                'payload': {'payment': {'entity': {'id': f'pay_{order.id}', 'notes': {'order_id': str(order.id)}}}},
+            })
+            signature = hmac.new(settings.RAZORPAY_WEBHOOK_SECRET.encode(), body.encode(), hashlib.sha256).hexdigest()
+            return {'data': body, 'HTTP_X_RAZORPAY_SIGNATURE': signature}
+        self.assertBudget('POST', '/api/cart/webhook/razorpay/', content_type='application/json',
+                          setup=setup, runs=10, queries=1, p50=10, p95=20)
+
+
+class AdminOrderQueueTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='staff', password='secret', is_staff=True)
+        cls.alice = User.objects.create_user(username='alice', password='secret')
+        cls.bob = User.objects.create_user(username='bob', password='secret')
+        orders = Order.objects.bulk_create(
+            [Order(user=cls.alice, total=10, status='pending') for _ in range(5)]
+            + [Order(user=cls.bob, total=10, status='pending') for _ in range(3)]
+            + [Order(user=cls.bob, total=10, status='approved') for _ in range(2)]
+        )
+        # Spread creation times one day apart, oldest first
+        base = timezone.now() - timedelta(days=len(orders))
+        for n, order in enumerate(orders):
+            Order.objects.filter(pk=order.pk).update(created_at=base + timedelta(days=n))
+        cls.orders = list(Order.objects.order_by('id'))
+
+    def setUp(self):
+        get_order_cache().clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def ids(self, response):
+        data = response.data['results'] if 'results' in response.data else response.data
+        return [order['id'] for order in data]
+
+    def test_all_digit_username_filter(self):
+        phone_user = User.objects.create_user(username='9876543210', password='secret')
+        order = Order.objects.create(user=phone_user, total=10, status='pending')
+        self.assertEqual(self.ids(self.client.get('/api/cart/admin/orders/?user=9876543210')), [order.id])
+
+    def test_plain_list_is_pending_newest_first(self):
+        response = self.client.get('/api/cart/admin/orders/')
+        self.assertEqual(self.ids(response), [o.id for o in reversed(self.orders[:8])])
+
+    def test_filters(self):
+        self.assertEqual(len(self.ids(self.client.get('/api/cart/admin/orders/?status=all'))), 10)
+        self.assertEqual(len(self.ids(self.client.get('/api/cart/admin/orders/?status=approved'))), 2)
+        self.assertEqual(len(self.ids(self.client.get('/api/cart/admin/orders/?user=bob'))), 3)
+        self.assertEqual(len(self.ids(self.client.get(f'/api/cart/admin/orders/?user={self.alice.id}'))), 5)
+        day = timezone.localtime(self.orders[2].created_at).date().isoformat()
+        response = self.client.get(f'/api/cart/admin/orders/?created_after={day}&created_before={day}')
+        self.assertEqual(self.ids(response), [self.orders[2].id])
+        self.assertEqual(self.client.get('/api/cart/admin/orders/?status=lost').status_code, 400)
+        self.assertEqual(self.ids(self.client.get(f'/api/cart/admin/orders/?user={10 ** 30}')), [])
+        self.assertEqual(self.client.get('/api/cart/admin/orders/?created_after=soon').status_code, 400)
+
+    def test_keyset_pagination_walks_every_order_once(self):
+        seen = []
+        url = '/api/cart/admin/orders/?page_size=3&ordering=created_at'
+        while url:
+            response = self.client.get(url)
+            seen += self.ids(response)
+            url = response.data['next']
+        self.assertEqual(seen, [o.id for o in self.orders[:8]])
+
+    def test_counts_are_cached_until_a_status_changes(self):
+        self.assertEqual(self.client.get('/api/cart/admin/orders/counts/').data['pending'], 8)
+        with self.assertNumQueries(0):
+            get_order_status_counts()
+        with self.captureOnCommitCallbacks(execute=True):
+            order = Order.objects.get(pk=self.orders[0].pk)
+            order.status = 'rejected'
+            order.save()
+        counts = self.client.get('/api/cart/admin/orders/counts/').data
+        self.assertEqual((counts['pending'], counts['rejected'], counts['total']), (7, 1, 10))
+
+    def test_non_admin_gets_nothing(self):
+        self.client.force_authenticate(self.alice)
+        self.assertEqual(self.client.get('/api/cart/admin/orders/').data, [])
+        self.assertEqual(self.client.get('/api/cart/admin/orders/counts/').status_code, 403)
+
+
+class BulkOrderDecisionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(username='boss', password='secret', email='boss@example.com')
+        cls.customer = User.objects.create_user(username='shopper', password='secret')
+        cls.lipstick = Product.objects.create(name='Lipstick', brand='Orane', category='Lips', price=100, stock=5,
+                                              image='products/p.jpg')
+        cls.kajal = Product.objects.create(name='Kajal', brand='Orane', category='Eyes', price=50, stock=100,
+                                           image='products/p.jpg')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def order(self, lipsticks=0, kajals=1, status='pending'):
+        order = Order.objects.create(user=self.customer, total=0, status=status)
+        for product, quantity in ((self.lipstick, lipsticks), (self.kajal, kajals)):
+            if quantity:
+                OrderLine.objects.create(order=order, product=product, product_name=product.name,
+                                         unit_price=product.price, quantity=quantity)
+        return order
+
+    def decide(self, **body):
+        return self.client.post('/api/cart/admin/orders/bulk-decision/', body, format='json')
+
+    def stock(self, product):
+        product.refresh_from_db()
+        return product.stock
+
+    def test_query_count_does_not_grow_with_batch_size(self):
+        def approve(count):
+            ids = [self.order().id for _ in range(count)]
+            with CaptureQueriesContext(connection) as queries:
+                response = self.decide(action='approve', orders=ids)
+            self.assertEqual(response.data['succeeded'], count)
+            return len(queries)
+        self.assertEqual(approve(2), approve(40))
+        self.assertEqual(self.stock(self.kajal), 58)
+        self.assertEqual(StockReservation.objects.filter(status='held').count(), 42)
+
+    def test_stock_goes_to_oldest_orders_first(self):
+        first, second, third = self.order(lipsticks=2), self.order(lipsticks=2), self.order(lipsticks=2)
+        response = self.decide(action='approve', orders=[third.id, second.id, first.id])
+        results = {r['order_id']: r for r in response.data['results']}
+        self.assertEqual([r['order_id'] for r in response.data['results']], [third.id, second.id, first.id])
+        self.assertTrue(results[first.id]['ok'] and results[second.id]['ok'])
+        self.assertEqual(results[third.id]['code'], 'insufficient_stock')
+        self.assertIn('Available: 1, Requested: 2', results[third.id]['error'])
+        self.assertEqual(self.stock(self.lipstick), 1)
+        self.assertEqual(Order.objects.get(pk=third.pk).status, 'pending')
+
+    def test_per_order_shipping_and_comments(self):
+        a, b = self.order(), self.order()
+        response = self.decide(action='approve', shipping_charge=40, comment='Packed',
+                               orders=[{'id': a.id, 'shipping_charge': 75, 'comment': 'Fragile'}, b.id])
+        self.assertEqual(response.data['succeeded'], 2)
+        a.refresh_from_db()
+        b.refresh_from_db()
+        self.assertEqual((a.status, a.shipping_charge, a.admin_comment), ('approved', 75, 'Fragile'))
+        self.assertEqual((b.shipping_charge, b.admin_comment), (40, 'Packed'))
+        self.assertIsNotNone(a.decision_time)
+
+    def test_missing_and_completed_orders_fail_individually(self):
+        done, fine = self.order(status='completed'), self.order()
+        response = self.decide(action='reject', orders=[done.id, 999999, fine.id])
+        self.assertEqual([r.get('code') for r in response.data['results']], ['invalid_status', 'not_found', None])
+        self.assertEqual(Order.objects.get(pk=fine.pk).status, 'rejected')
+
+    def test_reject_releases_held_stock(self):
+        order = self.order(lipsticks=3)
+        self.decide(action='approve', orders=[order.id])
+        self.assertEqual(self.stock(self.lipstick), 2)
+        self.decide(action='reject', orders=[order.id])
+        self.assertEqual(self.stock(self.lipstick), 5)
+        self.assertEqual(StockReservation.objects.get(order=order, product=self.lipstick).status, 'released')
+
+    def test_reapproval_reuses_existing_holds(self):
+        order = self.order(lipsticks=3)
+        self.decide(action='approve', orders=[order.id])
+        response = self.decide(action='approve', orders=[order.id, self.order(lipsticks=2).id])
+        self.assertEqual(response.data['succeeded'], 2)
+        self.assertEqual(self.stock(self.lipstick), 0)
+
+    def test_validation(self):
+        self.assertEqual(self.decide(action='ship', orders=[1]).status_code, 400)
+        self.assertEqual(self.decide(action='approve', orders=[]).status_code, 400)
+        self.assertEqual(self.decide(action='approve', orders=['x']).status_code, 400)
+        self.client.force_authenticate(self.customer)
+        self.assertEqual(self.decide(action='approve', orders=[1]).status_code, 403)
+
+    def test_admin_action_uses_the_same_path(self):
+        ok, short = self.order(lipsticks=5), self.order(lipsticks=1)
+        self.client.force_login(self.admin)
+        self.client.post('/admin/cart/order/', {'action': 'approve_orders', '_selected_action': [ok.id, short.id]})
+        self.assertEqual(Order.objects.get(pk=ok.pk).status, 'approved')
+        self.assertEqual(Order.objects.get(pk=short.pk).status, 'pending')
+        self.assertEqual(self.stock(self.lipstick), 0)
+
+
+class StockReservationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user(username='shopper', password='secret', email='shopper@example.com')
+        cls.product = Product.objects.create(name='Kajal', brand='Orane', category='Eyes', price=50, stock=5,
+                                             image='products/p.jpg')
+
+    def approved_order(self, quantity=2, ttl=None):
+        order = Order.objects.create(user=self.customer, total=50 * quantity, status='approved')
+        OrderLine.objects.create(order=order, product=self.product, product_name='Kajal', unit_price=50,
+                                 quantity=quantity)
+        reserve_order_stock(order, ttl=ttl)
+        return order
+
+    def stock(self):
+        return Product.objects.get(pk=self.product.pk).stock
+
+    def lapse(self, order):
+        StockReservation.objects.filter(order=order).update(expires_at=timezone.now() - timedelta(minutes=1))
+
+    def complete_payment(self, order):
+        client = APIClient()
+        client.force_authenticate(self.customer)
+        return client.post(f'/api/cart/orders/{order.id}/complete-payment/', {'razorpay_payment_id': 'pay_1'},
+                           format='json')
+
+    def test_holds_expire_after_their_ttl(self):
+        order = self.approved_order(ttl=timedelta(hours=1))
+        reservation = StockReservation.objects.get(order=order)
+        self.assertEqual(self.stock(), 3)
+        self.assertEqual(release_expired_reservations(now=reservation.expires_at - timedelta(seconds=1)), 0)
+        self.assertEqual(release_expired_reservations(now=reservation.expires_at), 1)
+        self.assertEqual(StockReservation.objects.get(order=order).status, 'released')
+        self.assertEqual(self.stock(), 5)
+        self.assertEqual(release_expired_reservations(now=reservation.expires_at), 0)
+
+    @override_settings(STOCK_RESERVATION_TTL=timedelta(minutes=30))
+    def test_ttl_comes_from_settings(self):
+        before = timezone.now()
+        order = self.approved_order()
+        expires_at = StockReservation.objects.get(order=order).expires_at
+        self.assertTrue(before + timedelta(minutes=30) <= expires_at <= timezone.now() + timedelta(minutes=30))
+
+    def test_command_releases_expired_holds_in_batches(self):
+        orders = [self.approved_order(quantity=1) for _ in range(3)]
+        for order in orders[:2]:
+            self.lapse(order)
+        out = StringIO()
+        call_command('release_expired_reservations', '--batch-size', '1', stdout=out)
+        self.assertIn('Released 2 expired reservation(s)', out.getvalue())
+        self.assertEqual(self.stock(), 4)
+        self.assertEqual(StockReservation.objects.get(order=orders[2]).status, 'held')
+
+    def test_commit_after_the_hold_lapsed_takes_stock_again(self):
+        order = self.approved_order()
+        self.lapse(order)
+        release_expired_reservations()
+        commit_order_stock(order)
+        commit_order_stock(order)
+        self.assertEqual(StockReservation.objects.get(order=order).status, 'committed')
+        self.assertEqual(self.stock(), 3)
+
+    def test_payment_completes_when_a_lapsed_hold_sold_out(self):
+        order = self.approved_order()
+        self.lapse(order)
+        release_expired_reservations()
+        Product.objects.filter(pk=self.product.pk).update(stock=1)
+        with self.assertLogs('cart.reservations', 'ERROR') as logs:
+            response = self.complete_payment(order)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(f'Order {order.id} paid but Insufficient stock for Kajal', logs.output[0])
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.payment_status), ('completed', 'success'))
+        self.assertEqual(StockReservation.objects.get(order=order).status, 'released')
+        self.assertEqual(self.stock(), 1)
+
+    def test_webhook_and_reconciliation_treat_a_sold_out_lapse_the_same(self):
+        by_webhook, by_reconcile = self.approved_order(), self.approved_order()
+        for order in (by_webhook, by_reconcile):
+            self.lapse(order)
+        release_expired_reservations()
+        Product.objects.filter(pk=self.product.pk).update(stock=0)
+        with self.assertLogs('cart.reservations', 'ERROR') as logs:
+            handle_payment_captured({'payment': {'entity': {
+                'id': 'pay_w', 'notes': {'order_id': str(by_webhook.id)},
+            }}})
+            reconcile_payments([{'id': 'pay_r', 'entity': 'payment', 'status': 'captured', 'amount': 10000,
+                                 'notes': {'order_id': str(by_reconcile.id)}}])
+        self.assertEqual(len(logs.output), 2)
+        self.assertEqual(Order.objects.filter(status='completed', payment_status='success').count(), 2)
+        self.assertEqual(self.stock(), 0)
+
+
+class CartSparseFieldsetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user(username='shopper', password='secret')
+        for product in seed_products(3):
+            CartItem.objects.create(user=cls.customer, product=product, quantity=1)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+
+    def test_nested_product_fields(self):
+        response = self.client.get('/api/cart/cart/?fields[product]=id,price')
+        self.assertEqual(len(response.data), 3)
+        for item in response.data:
+            self.assertEqual(set(item['product']), {'id', 'price'})
+            self.assertIn('quantity', item)
+
+    def test_nested_product_omit(self):
+        response = self.client.get('/api/cart/cart/?omit[product]=image,stock')
+        self.assertEqual(set(response.data[0]['product']), {'id', 'name', 'category', 'price'})
+
+    def test_bare_params_leave_the_nested_product_alone(self):
+        response = self.client.get('/api/cart/cart/?fields=id')
+        self.assertEqual(set(response.data[0]['product']), {'id', 'name', 'category', 'price', 'image', 'stock'})
+
+    def test_unknown_nested_fields_are_rejected(self):
+        response = self.client.get('/api/cart/cart/?fields[product]=id,description')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('fields[product]', response.data)
+
+
+class OrderEmailQueueTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(username='boss', password='secret', email='boss@example.com')
+        cls.customer = User.objects.create_user(username='shopper', password='secret', email='shopper@example.com')
+        cls.product = Product.objects.create(name='Kajal', brand='Orane', category='Eyes', price=50, stock=100,
+                                             image='products/p.jpg')
+
+    def order(self, status='pending'):
+        order = Order.objects.create(user=self.customer, total=100, status=status, address='1 Main St')
+        OrderLine.objects.create(order=order, product=self.product, product_name='Kajal', unit_price=50, quantity=2)
+        return order
+
+    def webhook(self, event, entity):
+        body = json.dumps({'event': event, 'payload': {'payment': {'entity': entity}}})
+        signature = hmac.new(settings.RAZORPAY_WEBHOOK_SECRET.encode(), body.encode(), hashlib.sha256).hexdigest()
+        return self.client.post('/api/cart/webhook/razorpay/', body, content_type='application/json',
+                                HTTP_X_RAZORPAY_SIGNATURE=signature)
+
+    def test_approval_queues_one_email_per_order_without_sending(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        orders = [self.order().id for _ in range(3)]
+        client.post('/api/cart/admin/orders/bulk-decision/', {'action': 'approve', 'orders': orders}, format='json')
+        queued = OutboundEmail.objects.filter(status='queued')
+        self.assertEqual(queued.count(), 3)
+        self.assertEqual(queued.first().to, ['shopper@example.com'])
+        self.assertEqual(mail.outbox, [])
+
+    def test_payment_callback_and_webhook_confirm_once(self):
+        order = self.order(status='approved')
+        client = APIClient()
+        client.force_authenticate(self.customer)
+        client.post(f'/api/cart/orders/{order.id}/complete-payment/', {'razorpay_payment_id': 'pay_1'}, format='json')
+        self.webhook('payment.captured', {'id': 'pay_1', 'notes': {'order_id': str(order.id)}})
+        process_pending_events()
+        email = OutboundEmail.objects.get()
+        self.assertEqual(email.dedupe_key, f'payment-success:{order.id}')
+        self.assertIn('Payment Successful', email.subject)
+
+    def test_payment_failure_is_queued(self):
+        order = self.order(status='approved')
+        self.webhook('payment.failed', {'id': 'pay_2', 'notes': {'order_id': str(order.id)}})
+        process_pending_events()
+        self.assertIn('Payment Failed', OutboundEmail.objects.get().subject)
+
+
+class OrderEmailRenderingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user(username='shopper', password='secret', email='shopper@example.com')
+        cls.order = Order.objects.create(user=cls.customer, total=250, shipping_charge=40, status='completed',
+                                         address='12 <b>Ring</b> Road', transaction_id='pay_42')
+        OrderLine.objects.bulk_create([
+            OrderLine(order=cls.order, product_name=f'Kajal №{i}', unit_price=50, quantity=1) for i in range(5)
+        ])
+
+    def test_receipt_lists_every_line_and_escapes_user_input(self):
+        order = Order.objects.with_details().get(pk=self.order.pk)
+        email = payment_success_email(order)
+        html = email.alternatives[0][0]
+        self.assertEqual(html.count('Kajal  0'), 1)
+        self.assertEqual(html.count('<tr><td'), 5)
+        self.assertIn('12 &lt;b&gt;Ring&lt;/b&gt; Road', html)
+        self.assertIn('₹290.00', html)
+        self.assertIn('pay_42', html)
+        self.assertTrue(html.replace('₹', '').isascii())
+        self.assertEqual(email.to, ['shopper@example.com'])
+
+    def test_approval_shows_totals_in_local_time(self):
+        email = order_approval_email(Order.objects.with_user().get(pk=self.order.pk))
+        html = email.alternatives[0][0]
+        self.assertIn(f'Order #{self.order.id}', html)
+        self.assertIn(timezone.localtime(self.order.created_at).strftime('%d %b %Y, %I:%M %p'), html)
+        self.assertIn('₹290.00', html)
+
+    def test_no_email_address_means_no_email(self):
+        order = Order.objects.with_user().get(pk=self.order.pk)
+        order.user.email = ''
+        self.assertIsNone(order_approval_email(order))
+
+
+class WebhookLedgerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user(username='shopper', password='secret', email='shopper@example.com')
+        cls.product = Product.objects.create(name='Kajal', brand='Orane', category='Eyes', price=50, stock=10,
+                                             image='products/p.jpg')
+
+    def setUp(self):
+        self.order = Order.objects.create(user=self.customer, total=100, status='approved')
+        OrderLine.objects.create(order=self.order, product=self.product, product_name='Kajal', unit_price=50,
+                                 quantity=2)
+        reserve_order_stock(self.order)
+
+    def deliver(self, event, entity, event_id, created_at=1700000000, secret=None):
+        key = 'order' if event == 'order.paid' else 'payment'
+        body = json.dumps({'entity': 'event', 'event': event, 'created_at': created_at,
+                           'payload': {key: {'entity': entity}}})
+        signature = hmac.new((secret or settings.RAZORPAY_WEBHOOK_SECRET).encode(), body.encode(),
+                             hashlib.sha256).hexdigest()
+        return self.client.post('/api/cart/webhook/razorpay/', body, content_type='application/json',
+                                HTTP_X_RAZORPAY_SIGNATURE=signature, HTTP_X_RAZORPAY_EVENT_ID=event_id)
+
+    def payment(self, payment_id='pay_1'):
+        return {'id': payment_id, 'notes': {'order_id': str(self.order.id)}}
+
+    def test_ack_only_records_the_event(self):
+        with self.assertNumQueries(1):
+            response = self.deliver('payment.captured', self.payment(), 'evt_1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Order.objects.get(pk=self.order.pk).status, 'approved')
+        self.assertEqual(WebhookEvent.objects.get().status, 'pending')
+
+    def test_redelivery_is_a_no_op(self):
+        for _ in range(3):
+            self.assertEqual(self.deliver('payment.captured', self.payment(), 'evt_1').status_code, 200)
+        self.assertEqual(WebhookEvent.objects.count(), 1)
+        self.assertEqual(process_pending_events(), 1)
+        self.assertEqual(process_pending_events(), 0)
+
+    def test_bad_signature_is_rejected_and_not_recorded(self):
+        response = self.deliver('payment.captured', self.payment(), 'evt_1', secret='not-the-secret')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(WebhookEvent.objects.exists())
+
+    @override_settings(RAZORPAY_WEBHOOK_SECRET='new-secret', RAZORPAY_WEBHOOK_PREVIOUS_SECRETS=['old-secret'])
+    def test_previous_secret_is_accepted_during_rotation(self):
+        self.assertEqual(self.deliver('payment.captured', self.payment(), 'evt_1', secret='new-secret').status_code, 200)
+        self.assertEqual(self.deliver('payment.captured', self.payment(), 'evt_2', secret='old-secret').status_code, 200)
+        self.assertEqual(self.deliver('payment.captured', self.payment(), 'evt_3', secret='retired-secret').status_code, 400)
+        self.assertEqual(WebhookEvent.objects.count(), 2)
+
+    def test_signed_garbage_is_rejected(self):
+        body = b'not json'
+        signature = hmac.new(settings.RAZORPAY_WEBHOOK_SECRET.encode(), body, hashlib.sha256).hexdigest()
+        response = self.client.post('/api/cart/webhook/razorpay/', body, content_type='application/json',
+                                    HTTP_X_RAZORPAY_SIGNATURE=signature)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(WebhookEvent.objects.exists())
+
+    def test_events_apply_in_gateway_order(self):
+        # The earlier failed attempt is delivered after the later success.
+        self.deliver('payment.captured', self.payment('pay_2'), 'evt_2', created_at=1700000100)
+        self.deliver('payment.failed', self.payment('pay_1'), 'evt_1', created_at=1700000000)
+        process_pending_events()
+        order = Order.objects.get(pk=self.order.pk)
+        self.assertEqual((order.status, order.payment_status, order.transaction_id), ('completed', 'success', 'pay_2'))
+        self.assertEqual(StockReservation.objects.get(order=order).status, 'committed')
+
+    def test_captured_then_order_paid_completes_once(self):
+        self.deliver('payment.captured', self.payment(), 'evt_1', created_at=1700000000)
+        self.deliver('order.paid', {'notes': {'order_id': str(self.order.id)}}, 'evt_2', created_at=1700000001)
+        process_pending_events()
+        self.assertEqual(set(WebhookEvent.objects.values_list('status', flat=True)), {'processed'})
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 8)
+
+    def test_handlers_load_only_their_order(self):
+        # Other orders in the table must not be loaded (or their lines prefetched)
+        Order.objects.bulk_create([Order(user=self.customer, total=10, status='approved') for _ in range(300)])
+        # order + lines, transition + history, stock commit (3), email
+        with self.assertNumQueries(8):
+            handle_payment_captured({'payment': {'entity': self.payment()}})
+        other = Order.objects.create(user=self.customer, total=100, status='approved')
+        # order, transition + history, stock release, email
+        with self.assertNumQueries(5):
+            handle_payment_failed({'payment': {'entity': {'id': 'pay_9', 'notes': {'order_id': str(other.id)}}}})
+
+    def test_order_paid_then_captured_keeps_the_payment(self):
+        # Same second, but order.paid was stored first
+        self.deliver('order.paid', {'notes': {'order_id': str(self.order.id)}}, 'evt_1', created_at=1700000000)
+        self.deliver('payment.captured', self.payment(), 'evt_2', created_at=1700000000)
+        process_pending_events()
+        order = Order.objects.get(pk=self.order.pk)
+        self.assertEqual((order.status, order.payment_status, order.transaction_id), ('completed', 'success', 'pay_1'))
+        self.assertEqual(OutboundEmail.objects.filter(dedupe_key=f'payment-success:{order.id}').count(), 1)
+        self.deliver('payment.captured', self.payment(), 'evt_3', created_at=1700000001)
+        process_pending_events()
+        self.assertEqual(OutboundEmail.objects.filter(dedupe_key=f'payment-success:{order.id}').count(), 1)
+
+    def test_worker_survives_database_errors(self):
+        self.deliver('payment.captured', self.payment(), 'evt_1')
+        calls = []
+
+        def flaky_process(limit):
+            calls.append(limit)
+            if len(calls) == 1:
+                raise OperationalError('server closed the connection unexpectedly')
+            return process_pending_events(limit=limit)
+
+        out = StringIO()
+        command = 'cart.management.commands.process_webhook_events'
+        with patch(f'{command}.process_pending_events', flaky_process), \
+                patch(f'{command}.time.sleep', side_effect=[None, KeyboardInterrupt]):
+            call_command('process_webhook_events', stdout=out)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(Order.objects.get(pk=self.order.pk).status, 'completed')
+        self.assertIn('Applied 1 webhook event(s)', out.getvalue())
+
+    def test_late_failure_does_not_undo_payment(self):
+        self.deliver('payment.captured', self.payment('pay_2'), 'evt_2', created_at=1700000000)
+        process_pending_events()
+        self.deliver('payment.failed', self.payment('pay_1'), 'evt_1', created_at=1700000001)
+        process_pending_events()
+        self.assertEqual(Order.objects.get(pk=self.order.pk).payment_status, 'success')
+
+    def test_unknown_order_is_ignored(self):
+        self.deliver('payment.captured', {'id': 'pay_1', 'notes': {'order_id': '999999'}}, 'evt_1')
+        process_pending_events()
+        self.assertEqual(WebhookEvent.objects.get().status, 'ignored')
+
+    def test_handler_errors_are_retried_later(self):
+        self.deliver('payment.captured', {'id': 'pay_1'}, 'evt_1')
+        WebhookEvent.objects.update(body='{"payload": {"payment": {}}}')
+        process_pending_events()
+        event = WebhookEvent.objects.get()
+        self.assertEqual((event.status, event.attempts), ('pending', 1))
+        self.assertIn('KeyError', event.last_error)
+        self.assertGreater(event.next_attempt_at, timezone.now())
+
+
+class RecordingAdapter(BaseAdapter):
+    """Transport that fails with error (or answers 200 {}) and records the timeouts it was given."""
+
+    def __init__(self, error=None):
+        super().__init__()
+        self.error = error
+        self.calls = []
+
+    def send(self, request, timeout=None, **kwargs):
+        self.calls.append(timeout)
+        if self.error:
+            raise self.error
+        response = requests.Response()
+        response.status_code = 200
+        response._content = b'{"id": "order_1", "amount": 100, "currency": "INR"}'
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+@override_settings(RAZORPAY_BREAKER_THRESHOLD=3, RAZORPAY_BREAKER_COOLDOWN=30, RAZORPAY_GATEWAY='live')
+class RazorpayClientTests(TestCase):
+    def setUp(self):
+        reset_razorpay_clients()
+        self.addCleanup(reset_razorpay_clients)
+
+    def mount(self, adapter):
+        client = get_razorpay_client()
+        client.session.mount(client.base_url, adapter)
+        return client
+
+    def test_one_client_per_process(self):
+        client = get_razorpay_client()
+        self.assertIs(get_razorpay_client(), client)
+        with override_settings(RAZORPAY_KEY_ID='rzp_test_other'):
+            self.assertIsNot(get_razorpay_client(), client)
+
+    def test_calls_get_the_default_timeout(self):
+        adapter = RecordingAdapter()
+        self.mount(adapter).order.create(data={'amount': 100})
+        self.assertEqual(adapter.calls, [(settings.RAZORPAY_CONNECT_TIMEOUT, settings.RAZORPAY_READ_TIMEOUT)])
+
+    def test_circuit_opens_after_repeated_failures(self):
+        adapter = RecordingAdapter(error=requests.ConnectionError('down'))
+        client = self.mount(adapter)
+        for _ in range(3):
+            with self.assertRaises(requests.ConnectionError):
+                client.order.create(data={'amount': 100})
+        with self.assertRaises(GatewayUnavailable):
+            client.order.create(data={'amount': 100})
+        self.assertEqual(len(adapter.calls), 3)
+
+    def test_open_circuit_turns_into_503(self):
+        customer = User.objects.create_user(username='shopper', password='secret')
+        order = Order.objects.create(user=customer, total=500, status='approved')
+        self.mount(RecordingAdapter(error=requests.Timeout()))
+        api = APIClient()
+        api.force_authenticate(customer)
+        codes = [api.post(f'/api/cart/orders/{order.id}/razorpay-order/').status_code for _ in range(4)]
+        self.assertEqual(codes, [500, 500, 500, 503])
+
+    def test_breaker_half_opens_after_cooldown(self):
+        now = [0]
+        breaker = CircuitBreaker(threshold=2, cooldown=30, clock=lambda: now[0])
+        breaker.record_failure()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, 'open')
+        with self.assertRaises(GatewayUnavailable):
+            breaker.before_call()
+        now[0] = 31
+        breaker.before_call()  # the trial call
+        with self.assertRaises(GatewayUnavailable):
+            breaker.before_call()  # only one trial at a time
+        breaker.record_failure()
+        self.assertEqual(breaker.state, 'open')
+        now[0] = 62
+        breaker.before_call()
+        breaker.record_success()
+        self.assertEqual(breaker.state, 'closed')
+
+    def test_unexpected_error_in_the_trial_call_does_not_wedge_the_breaker(self):
+        now = [0]
+        client = self.mount(RecordingAdapter(error=requests.ConnectionError('down')))
+        client.breaker.clock = lambda: now[0]
+        for _ in range(3):
+            with self.assertRaises(requests.ConnectionError):
+                client.order.create(data={'amount': 100})
+        now[0] = 31
+        client.session.mount(client.base_url, RecordingAdapter(error=KeyError('error')))
+        with self.assertRaises(KeyError):
+            client.order.create(data={'amount': 100})
+        self.assertEqual(client.breaker.state, 'open')
+        now[0] = 62
+        client.session.mount(client.base_url, RecordingAdapter())
+        self.assertEqual(client.order.create(data={'amount': 100})['id'], 'order_1')
+        self.assertEqual(client.breaker.state, 'closed')
+
+    @override_settings(RAZORPAY_GATEWAY='stub')
+    def test_stub_gateway_answers_offline(self):
+        order = get_razorpay_client().order.create(data={'amount': 49950, 'currency': 'INR', 'receipt': 'order_7'})
+        self.assertTrue(order['id'].startswith('order_'))
+        self.assertEqual(get_razorpay_client().order.fetch(order['id'], {})['receipt'], 'order_7')
+
+
+class ReconcilePaymentsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user(username='shopper', password='secret', email='shopper@example.com')
+        cls.product = Product.objects.create(name='Kajal', brand='Orane', category='Eyes', price=50, stock=100,
+                                             image='products/p.jpg')
+
+    def approved_order(self, shipping=0):
+        order = Order.objects.create(user=self.customer, total=100, shipping_charge=shipping, status='approved')
+        OrderLine.objects.create(order=order, product=self.product, product_name='Kajal', unit_price=50, quantity=2)
+        reserve_order_stock(order)
+        return order
+
+    def payment(self, order, status='captured', payment_id=None, amount=None, **extra):
+        return dict({
+            'id': payment_id or f'pay_{order.id}', 'entity': 'payment', 'status': status,
+            'amount': 10000 if amount is None else amount, 'currency': 'INR', 'order_id': f'order_rzp{order.id}',
+            'method': 'upi', 'captured': status == 'captured', 'notes': {'order_id': str(order.id)},
+        }, **extra)
+
+    def write_fixture(self, payments):
+        handle, path = tempfile.mkstemp(suffix='.jsonl')
+        with os.fdopen(handle, 'w') as f:
+            for payment in payments:
+                f.write(json.dumps(payment) + '\n')
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_missed_capture_completes_the_order(self):
+        order = self.approved_order()
+        totals = reconcile_payments([self.payment(order)])
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.payment_status, order.transaction_id),
+                         ('completed', 'success', f'pay_{order.id}'))
+        self.assertEqual(StockReservation.objects.get(order=order).status, 'committed')
+        self.assertEqual(Product.objects.get(pk=self.product.pk).stock, 98)
+        self.assertEqual(OutboundEmail.objects.get().dedupe_key, f'payment-success:{order.id}')
+        self.assertEqual(totals['completed'], 1)
+
+    def test_missed_failure_marks_the_order_failed(self):
+        order = self.approved_order()
+        reconcile_payments([self.payment(order, status='failed')])
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.payment_status), ('approved', 'failed'))
+        self.assertEqual(StockReservation.objects.get(order=order).status, 'released')
+
+    def test_capture_wins_over_an_earlier_failure(self):
+        order = self.approved_order()
+        reconcile_payments([
+            self.payment(order, status='failed', payment_id='pay_a'),
+            self.payment(order, payment_id='pay_b'),
+        ], batch_size=1)
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.transaction_id), ('completed', 'pay_b'))
+
+    def test_expanded_order_receipt_matches_when_notes_are_missing(self):
+        order = self.approved_order(shipping=25)
+        razorpay_order = {'id': f'order_rzp{order.id}', 'entity': 'order', 'receipt': f'order_{order.id}'}
+        reconcile_payments([self.payment(order, amount=12500, notes=[])])
+        self.assertEqual(Order.objects.get(pk=order.pk).status, 'approved')
+        reconcile_payments([dict(self.payment(order, amount=12500, notes=[]), order=razorpay_order)])
+        self.assertEqual(Order.objects.get(pk=order.pk).status, 'completed')
+
+    def test_mismatches_are_counted_not_fixed(self):
+        short = self.approved_order()
+        pending = Order.objects.create(user=self.customer, total=100, status='pending')
+        done = self.approved_order()
+        reconcile_payments([self.payment(done)])
+        totals = reconcile_payments([
+            self.payment(short, amount=100),
+            self.payment(pending),
+            self.payment(done, notes=[]),  # found by transaction_id
+            {'id': 'pay_x', 'status': 'captured', 'amount': 100, 'notes': {'order_id': '999999'}},
+        ])
+        self.assertEqual(totals['amount mismatch'], 1)
+        self.assertEqual(totals['skipped'], 1)
+        self.assertEqual(totals['in sync'], 1)
+        self.assertEqual(totals['unmatched'], 1)
+        self.assertEqual(Order.objects.get(pk=short.pk).status, 'approved')
+
+    def test_batches_cost_the_same_queries_whatever_their_size(self):
+        def queries_for(count):
+            orders = [self.approved_order() for _ in range(count)]
+            with CaptureQueriesContext(connection) as queries:
+                reconcile_payments([self.payment(order) for order in orders])
+            return len(queries)
+        self.assertEqual(queries_for(2), queries_for(20))
+
+    def test_command_reads_a_fixture_and_supports_dry_run(self):
+        orders = [self.approved_order() for _ in range(3)]
+        path = self.write_fixture(self.payment(order) for order in orders)
+        out = StringIO()
+        call_command('reconcile_payments', '--fixture', path, '--dry-run', stdout=out)
+        self.assertIn('[dry run] Reconciled 3 payment(s): 3 completed', out.getvalue())
+        self.assertFalse(Order.objects.filter(status='completed').exists())
+        call_command('reconcile_payments', '--fixture', path, '--batch-size', '2', stdout=StringIO())
+        self.assertEqual(Order.objects.filter(status='completed').count(), 3)
+
+    @override_settings(RAZORPAY_GATEWAY='stub')
+    def test_gateway_payments_are_read_page_by_page(self):
+        reset_razorpay_clients()
+        self.addCleanup(reset_razorpay_clients)
+        client = get_razorpay_client()
+        gateway = client.session.get_adapter(client.base_url).gateway
+        orders = [self.approved_order() for _ in range(5)]
+        for order in orders:
+            razorpay_order = client.order.create(data={
+                'amount': 10000, 'currency': 'INR', 'receipt': f'order_{order.id}',
+                'notes': {'order_id': str(order.id)},
+            })
+            gateway.capture(razorpay_order['id'])
+        now = timezone.now()
+        payments = list(gateway_payments(now - timedelta(hours=1), now + timedelta(minutes=1), page_size=2))
+        self.assertEqual(len(payments), 5)
+        self.assertNotIn('receipt', payments[0])
+        self.assertEqual(payments[0]['order']['id'], payments[0]['order_id'])
+        out = StringIO()
+        call_command('reconcile_payments', '--from', (now - timedelta(hours=1)).isoformat(), stdout=out)
+        self.assertIn('5 completed', out.getvalue())
+
+    @override_settings(RAZORPAY_GATEWAY='stub')
+    def test_gateway_payments_without_notes_match_on_the_expanded_receipt(self):
+        reset_razorpay_clients()
+        self.addCleanup(reset_razorpay_clients)
+        client = get_razorpay_client()
+        gateway = client.session.get_adapter(client.base_url).gateway
+        order = self.approved_order()
+        razorpay_order = client.order.create(data={'amount': 10000, 'currency': 'INR', 'receipt': f'order_{order.id}'})
+        gateway.capture(razorpay_order['id'], notes=[])
+        now = timezone.now()
+        totals = reconcile_payments(gateway_payments(now - timedelta(hours=1), now + timedelta(minutes=1)))
+        self.assertEqual(totals['completed'], 1)
+        self.assertEqual(Order.objects.get(pk=order.pk).transaction_id, next(iter(gateway.payments)))
+
+
+class OrderStateMachineTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='staff', password='secret', is_staff=True)
+        cls.customer = User.objects.create_user(username='shopper', password='secret')
+
+    def order(self, **fields):
+        return Order.objects.create(user=self.customer, total=100, **fields)
+
+    def test_transition_updates_the_row_and_records_history(self):
+        order = self.order(status='approved')
+        with self.assertNumQueries(2):
+            self.assertTrue(apply_transition(order, 'complete', reference='pay_1', transaction_id='pay_1'))
+        self.assertEqual((order.status, order.payment_status), ('completed', 'success'))
+        row = Order.objects.get(pk=order.pk)
+        self.assertEqual((row.status, row.payment_status, row.transaction_id), ('completed', 'success', 'pay_1'))
+        history = OrderTransition.objects.get()
+        self.assertEqual((history.from_status, history.to_status, history.to_payment_status, history.reference),
+                         ('approved', 'completed', 'success', 'pay_1'))
+
+    def test_invalid_transition_is_refused(self):
+        order = self.order(status='completed', payment_status='success')
+        with self.assertRaises(InvalidTransition):
+            apply_transition(order, 'reject')
+        with self.assertRaises(InvalidTransition):
+            apply_transition(self.order(status='pending'), 'complete')
+        self.assertFalse(OrderTransition.objects.exists())
+
+    def test_stale_copy_loses_the_race(self):
+        order = self.order(status='approved')
+        stale = Order.objects.get(pk=order.pk)
+        self.assertTrue(apply_transition(order, 'complete'))
+        self.assertFalse(apply_transition(stale, 'fail_payment'))
+        self.assertEqual(Order.objects.get(pk=order.pk).payment_status, 'success')
+        self.assertEqual(OrderTransition.objects.count(), 1)
+
+    def test_batch_moves_with_one_update_and_skips_orders_moved_underneath(self):
+        orders = [self.order() for _ in range(4)]
+        Order.objects.filter(pk=orders[1].pk).update(status='rejected')
+        moved = apply_transitions([(order, {'admin_comment': f'ok {order.pk}'}) for order in orders], 'approve',
+                                  actor=self.admin)
+        self.assertEqual([o.pk for o in moved], [orders[0].pk, orders[2].pk, orders[3].pk])
+        self.assertEqual(Order.objects.get(pk=orders[3].pk).admin_comment, f'ok {orders[3].pk}')
+        self.assertEqual(Order.objects.get(pk=orders[1].pk).status, 'rejected')
+        self.assertEqual(set(OrderTransition.objects.values_list('actor', flat=True)), {self.admin.pk})
+
+        fresh = [self.order() for _ in range(10)]
+        with self.assertNumQueries(4):  # savepoint, UPDATE, release, INSERT
+            apply_transitions([(order, {}) for order in fresh], 'reject')
+
+    def test_time_in_state(self):
+        order = self.order()
+        start = timezone.now()
+        apply_transition(order, 'approve', now=start)
+        apply_transition(order, 'complete', now=start + timedelta(hours=3))
+        rows = list(OrderTransition.objects.filter(order=order).with_time_in_state())
+        self.assertEqual(rows[0].left_at - rows[0].created_at, timedelta(hours=3))
+        self.assertIsNone(rows[1].left_at)
+
+    def test_history_is_append_only(self):
+        order = self.order()
+        apply_transition(order, 'approve')
+        history = OrderTransition.objects.get()
+        history.to_status = 'rejected'
+        with self.assertRaises(ValueError):
+            history.save()
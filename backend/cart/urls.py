@@ -1,7 +1,8 @@
 from django.urls import path
 from .views import (
     CartListCreateView, CartItemUpdateDeleteView, OrderListCreateView, 
-    OrderDetailView, AdminOrderListView, AdminOrderApprovalView, 
+    OrderDetailView, AdminOrderListView, AdminOrderCountsView, AdminOrderApprovalView,
+    AdminBulkOrderDecisionView, 
     UserOrderStatusView, CheckoutView, RazorpayOrderCreateView, 
     PaymentCompletionView, RazorpayWebhookView
 )
@@ -12,6 +13,8 @@ urlpatterns = [
     path('orders/', OrderListCreateView.as_view(), name='order-list-create'),
     path('orders/<int:pk>/', OrderDetailView.as_view(), name='order-detail'),
     path('admin/orders/', AdminOrderListView.as_view(), name='admin-order-list'),
+    path('admin/orders/counts/', AdminOrderCountsView.as_view(), name='admin-order-counts'),
+    path('admin/orders/bulk-decision/', AdminBulkOrderDecisionView.as_view(), name='admin-order-bulk-decision'),
     path('admin/orders/<int:order_id>/approve/', AdminOrderApprovalView.as_view(), name='admin-order-approval'),
     path('order-status/', UserOrderStatusView.as_view(), name='user-order-status'),
     path('checkout/<int:order_id>/', CheckoutView.as_view(), name='checkout'),
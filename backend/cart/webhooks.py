@@ -0,0 +1,242 @@
+"""
+Razorpay webhook event ledger.
+
+RazorpayWebhookView verifies the signature, calls record_event() (one
+INSERT ... ON CONFLICT DO NOTHING keyed on the Razorpay event id) and
+returns 200. Nothing else happens in the request. Retried deliveries hit
+the unique event_id and are dropped.
+
+The process_webhook_events worker calls process_pending_events(). It
+applies stored events oldest first by the gateway's created_at, so a
+late payment.failed can't undo a payment.captured that happened after
+it. Handlers are idempotent. An order that is already completed stays
+completed, so payment.captured and order.paid for the same payment are
+one state change, in either order; whichever comes second only fills in
+a missing transaction_id. A handler that raises is retried with
+backoff, behind the events that arrive in the meantime. An event that
+can't apply to anything here is marked ignored.
+
+Run a single worker: the ordering guarantee holds within one worker's
+batches.
+
+verify_webhook() checks the X-Razorpay-Signature locally: HMAC-SHA256
+over the raw body bytes, compared in constant time, against
+RAZORPAY_WEBHOOK_SECRET and then any RAZORPAY_WEBHOOK_PREVIOUS_SECRETS
+(so a secret can be rotated without dropping deliveries).
+"""
+import hashlib
+import hmac
+import json
+import logging
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .emails import send_payment_failure_email, send_payment_success_email
+from .models import Order, WebhookEvent
+from .reservations import commit_paid_order_stock, release_order_stock
+from .states import apply_transition, can_transition
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 8
+RETRY_DELAY = 30  # seconds, doubled after every failed attempt
+
+
+class IgnoreEvent(Exception):
+    """The event doesn't apply to anything we know about; don't retry it."""
+
+
+class InvalidWebhook(Exception):
+    """The delivery isn't signed with any of our secrets, or isn't JSON."""
+
+
+_signers = {}
+
+
+def _webhook_signers():
+    # Keyed HMAC objects are built once per secret; each check copies one
+    # instead of rehashing the key.
+    secrets = (settings.RAZORPAY_WEBHOOK_SECRET,) + tuple(
+        getattr(settings, 'RAZORPAY_WEBHOOK_PREVIOUS_SECRETS', ())
+    )
+    signers = _signers.get(secrets)
+    if signers is None:
+        signers = _signers[secrets] = [
+            hmac.new(secret.encode('utf-8'), digestmod=hashlib.sha256) for secret in secrets if secret
+        ]
+    return signers
+
+
+def verify_webhook(body, signature):
+    """Check a delivery's signature against the raw body; return the parsed payload."""
+    expected = (signature or '').encode('ascii', 'replace')
+    for signer in _webhook_signers():
+        mac = signer.copy()
+        mac.update(body)
+        if hmac.compare_digest(mac.hexdigest().encode('ascii'), expected):
+            break
+    else:
+        raise InvalidWebhook("Signature doesn't match any webhook secret")
+    try:
+        data = json.loads(body)
+    except ValueError as e:
+        raise InvalidWebhook(f"Body is not JSON: {e}")
+    if not isinstance(data, dict):
+        raise InvalidWebhook("Body is not a JSON object")
+    return data
+
+
+def event_id_for(headers, data, body):
+    """Razorpay's event id, falling back to a hash of the body so replays still dedupe."""
+    return (
+        headers.get('X-Razorpay-Event-Id')
+        or data.get('id')
+        or f'sha256:{hashlib.sha256(body).hexdigest()}'
+    )
+
+
+def record_event(event_id, data, body):
+    """Store a verified delivery; a repeat of a recorded event_id is dropped."""
+    created_at = data.get('created_at')
+    occurred_at = datetime.fromtimestamp(created_at, tz=dt_timezone.utc) if created_at else timezone.now()
+    WebhookEvent.objects.bulk_create([
+        WebhookEvent(event_id=event_id, event=data.get('event') or '', body=body.decode('utf-8'),
+                     occurred_at=occurred_at)
+    ], ignore_conflicts=True)
+
+
+def _payment(payload):
+    entity = payload['payment']['entity']
+    return entity['id'], entity.get('notes', {}).get('order_id')
+
+
+def _order(order_id, queryset=None):
+    if not order_id:
+        raise IgnoreEvent("No order_id in the payment notes")
+    try:
+        # Not `queryset or ...`: a QuerySet's truth value runs it
+        return (queryset if queryset is not None else Order.objects).get(id=order_id)
+    except (Order.DoesNotExist, ValueError):
+        raise IgnoreEvent(f"Order {order_id} not found in database")
+
+
+class OrderMoved(Exception):
+    """The order changed while the event was applied; retry the event."""
+
+
+def _complete(order, transaction_id=None):
+    """Mark order paid. Returns False if it already was."""
+    if order.status == 'completed' and order.payment_status == 'success':
+        logger.info(f"Order {order.id} already completed")
+        if transaction_id and not order.transaction_id:
+            # Completed by an event that didn't carry the payment id
+            if Order.objects.filter(pk=order.pk, transaction_id='').update(transaction_id=transaction_id):
+                order.transaction_id = transaction_id
+        return False
+    if not can_transition(order, 'complete'):
+        raise IgnoreEvent(f"Order {order.id} is {order.status}; it can't be completed")
+    fields = {'transaction_id': transaction_id} if transaction_id else {}
+    if not apply_transition(order, 'complete', reference=transaction_id or '', **fields):
+        raise OrderMoved(f"Order {order.id} changed while completing it")
+    commit_paid_order_stock(order)
+    logger.info(f"Order {order.id} updated to completed status")
+    return True
+
+
+def handle_payment_authorized(payload):
+    # Authorized but not captured yet: nothing to change.
+    payment_id, order_id = _payment(payload)
+    logger.info(f"Payment authorized - Payment ID: {payment_id}, Order ID: {order_id}")
+
+
+def handle_payment_captured(payload):
+    payment_id, order_id = _payment(payload)
+    logger.info(f"Payment captured - Payment ID: {payment_id}, Order ID: {order_id}")
+    order = _order(order_id, Order.objects.with_details())
+    _complete(order, payment_id)
+    # Also when order.paid completed it first; the dedupe key sends it once
+    send_payment_success_email(order)
+
+
+def handle_payment_failed(payload):
+    payment_id, order_id = _payment(payload)
+    logger.info(f"Payment failed - Payment ID: {payment_id}, Order ID: {order_id}")
+    order = _order(order_id, Order.objects.with_user())
+    if order.payment_status == 'success':
+        # An earlier attempt failed but the customer has paid since.
+        logger.info(f"Order {order.id} already paid, ignoring failed payment {payment_id}")
+        return
+    if not can_transition(order, 'fail_payment'):
+        raise IgnoreEvent(f"Order {order.id} is {order.status}; not awaiting payment")
+    if not apply_transition(order, 'fail_payment', reference=payment_id):
+        raise OrderMoved(f"Order {order.id} changed while failing its payment")
+    release_order_stock(order)
+    logger.info(f"Order {order.id} updated to failed status")
+    send_payment_failure_email(order, payment_id)
+
+
+def handle_order_paid(payload):
+    # No email for order.paid; the customer hears about it via payment.captured.
+    order_id = payload['order']['entity'].get('notes', {}).get('order_id')
+    payment_id = payload.get('payment', {}).get('entity', {}).get('id')
+    logger.info(f"Order paid - Order ID: {order_id}, Payment ID: {payment_id}")
+    _complete(_order(order_id), payment_id)
+
+
+HANDLERS = {
+    'payment.authorized': handle_payment_authorized,
+    'payment.captured': handle_payment_captured,
+    'payment.failed': handle_payment_failed,
+    'order.paid': handle_order_paid,
+}
+
+
+def apply_event(webhook_event, now):
+    """Run the handler for one stored event and record the outcome on it."""
+    webhook_event.attempts += 1
+    handler = HANDLERS.get(webhook_event.event)
+    try:
+        if handler is None:
+            raise IgnoreEvent(f"Unhandled webhook event: {webhook_event.event}")
+        with transaction.atomic():
+            handler(json.loads(webhook_event.body).get('payload', {}))
+    except IgnoreEvent as e:
+        logger.warning(f"Ignoring webhook event {webhook_event.event_id}: {e}")
+        webhook_event.status = 'ignored'
+        webhook_event.last_error = str(e)
+        webhook_event.processed_at = now
+    except Exception as e:
+        logger.exception(f"Error applying webhook event {webhook_event.event_id}")
+        webhook_event.last_error = f"{type(e).__name__}: {e}"
+        if webhook_event.attempts >= MAX_ATTEMPTS:
+            webhook_event.status = 'failed'
+        else:
+            webhook_event.next_attempt_at = now + timedelta(seconds=RETRY_DELAY * 2 ** (webhook_event.attempts - 1))
+    else:
+        webhook_event.status = 'processed'
+        webhook_event.last_error = ''
+        webhook_event.processed_at = now
+
+
+def process_pending_events(limit=100, now=None):
+    """
+    Apply up to limit due events, oldest first. Returns the number applied
+    (processed, ignored or rescheduled).
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        events = list(
+            WebhookEvent.objects
+            .filter(status='pending', next_attempt_at__lte=now)
+            .order_by('occurred_at', 'id')
+            .select_for_update(skip_locked=True)[:limit]
+        )
+        for webhook_event in events:
+            apply_event(webhook_event, now)
+        WebhookEvent.objects.bulk_update(
+            events, ['status', 'attempts', 'next_attempt_at', 'processed_at', 'last_error']
+        )
+    return len(events)
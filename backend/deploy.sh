@@ -19,5 +19,7 @@ python manage.py migrate
 # Optional: Load data if you have a backup
 # python manage.py loaddata render_data_backup.json
 
-# Start the application
-gunicorn backend.wsgi:application 
\ No newline at end of file
+# Start the application. Threaded workers, so password hashing (which runs
+# on a smaller pool, see authentication/hashing.py) leaves threads free for
+# the other endpoints; WEB_THREADS also sizes that pool.
+gunicorn backend.wsgi:application --worker-class gthread --threads "${WEB_THREADS:-4}"
\ No newline at end of file
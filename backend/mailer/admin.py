@@ -0,0 +1,21 @@
+from django.contrib import admin
+from django.utils import timezone
+
+from .models import OutboundEmail
+
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ('id', 'subject', 'recipients', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('subject', 'dedupe_key')
+    readonly_fields = ('created_at', 'sent_at', 'attempts', 'last_error')
+    actions = ['retry_now']
+
+    def recipients(self, obj):
+        return ', '.join(obj.to)
+
+    def retry_now(self, request, queryset):
+        updated = queryset.exclude(status='sent').update(status='queued', next_attempt_at=timezone.now())
+        self.message_user(request, f"{updated} email(s) queued for another attempt.")
+    retry_now.short_description = "Retry selected emails now"
@@ -0,0 +1,58 @@
+import logging
+import time
+
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, close_old_connections
+
+from mailer.outbox import claim_batch, outbox_setting, send_batch
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Send queued emails over a single SMTP connection, retrying failures with backoff'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Emails claimed per batch (default: EMAIL_OUTBOX_BATCH_SIZE)')
+        parser.add_argument('--interval', type=float, default=5,
+                            help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--once', action='store_true',
+                            help='Drain what is due now and exit instead of running forever')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size'] or outbox_setting('EMAIL_OUTBOX_BATCH_SIZE')
+        connection = get_connection(fail_silently=False)
+        totals = {'sent': 0, 'failed': 0}
+        try:
+            while True:
+                # Drop a database connection that broke or outlived CONN_MAX_AGE
+                close_old_connections()
+                try:
+                    batch = claim_batch(batch_size)
+                    if batch:
+                        sent, failed = send_batch(batch, connection)
+                        totals['sent'] += sent
+                        totals['failed'] += failed
+                        self.stdout.write(f'Sent {sent}, failed {failed}')
+                        if len(batch) == batch_size:
+                            continue
+                except DatabaseError:
+                    if options['once']:
+                        raise
+                    # Claimed emails go out again once their lease runs out
+                    logger.exception('Database error in the email worker, retrying')
+                    time.sleep(options['interval'])
+                    continue
+                if options['once']:
+                    break
+                # Don't hold an idle SMTP connection open between polls.
+                connection.close()
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            connection.close()
+        style = self.style.WARNING if totals['failed'] else self.style.SUCCESS
+        self.stdout.write(style(f"Sent {totals['sent']} email(s), {totals['failed']} failed"))
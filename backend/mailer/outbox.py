@@ -0,0 +1,181 @@
+"""
+Database-backed outbound email queue.
+
+Request handlers call enqueue()/enqueue_many() instead of message.send():
+that is one INSERT in the caller's transaction and never touches SMTP. The
+send_queued_email worker claims due rows in batches, sends them over one
+SMTP connection that stays open while there is work, and reschedules
+failures with exponential backoff until EMAIL_OUTBOX_MAX_ATTEMPTS.
+
+Claiming a row pushes its next_attempt_at forward by a lease instead of
+using a separate "sending" state, so a worker that dies mid-batch just
+leaves its rows to be picked up again once the lease runs out.
+"""
+import logging
+import random
+import smtplib
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'EMAIL_OUTBOX_BATCH_SIZE': 50,
+    'EMAIL_OUTBOX_MAX_ATTEMPTS': 8,
+    'EMAIL_OUTBOX_RETRY_DELAY': 60,        # seconds, doubled after every failure
+    'EMAIL_OUTBOX_MAX_RETRY_DELAY': 3600,
+    'EMAIL_OUTBOX_LEASE': 300,             # how long a claimed batch is hidden from other workers
+}
+
+# Errors that mean the connection itself is gone, not just this message.
+CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)
+# Errors that won't go away by trying again.
+PERMANENT_ERRORS = (smtplib.SMTPRecipientsRefused, ValueError)
+
+
+def outbox_setting(name):
+    return getattr(settings, name, DEFAULTS[name])
+
+
+def _row(message, dedupe_key=None):
+    html = next((content for content, mimetype in getattr(message, 'alternatives', ())
+                 if mimetype == 'text/html'), '')
+    return OutboundEmail(
+        subject=message.subject,
+        body=message.body,
+        html_body=html,
+        from_email=message.from_email or '',
+        to=list(message.to),
+        cc=list(message.cc),
+        bcc=list(message.bcc),
+        reply_to=list(message.reply_to),
+        dedupe_key=dedupe_key,
+    )
+
+
+def enqueue_many(messages):
+    """
+    Queue EmailMessage/EmailMultiAlternatives objects with one INSERT.
+
+    messages is an iterable of messages or (message, dedupe_key) pairs.
+    Messages whose dedupe_key is already queued or sent are dropped.
+    """
+    rows = [_row(*m) if isinstance(m, tuple) else _row(m) for m in messages]
+    if rows:
+        OutboundEmail.objects.bulk_create(rows, ignore_conflicts=True)
+    return len(rows)
+
+
+def enqueue(message, dedupe_key=None):
+    """Queue one message; see enqueue_many()."""
+    return enqueue_many([(message, dedupe_key)])
+
+
+def to_message(email, connection=None):
+    message = EmailMultiAlternatives(
+        subject=email.subject,
+        body=email.body,
+        from_email=email.from_email or settings.DEFAULT_FROM_EMAIL,
+        to=email.to,
+        cc=email.cc,
+        bcc=email.bcc,
+        reply_to=email.reply_to,
+        connection=connection,
+    )
+    if email.html_body:
+        message.attach_alternative(email.html_body, 'text/html')
+    message.encoding = 'utf-8'
+    return message
+
+
+def retry_delay(attempts):
+    """Backoff before attempt number attempts + 1, with up to 25% jitter."""
+    delay = min(outbox_setting('EMAIL_OUTBOX_RETRY_DELAY') * 2 ** max(attempts - 1, 0),
+                outbox_setting('EMAIL_OUTBOX_MAX_RETRY_DELAY'))
+    return timedelta(seconds=delay * random.uniform(1, 1.25))
+
+
+def claim_batch(limit=None, now=None):
+    """
+    Lease up to limit due emails to this worker and return them.
+
+    Uses SELECT ... FOR UPDATE SKIP LOCKED where the database supports it,
+    so several workers can drain the queue without sending anything twice.
+    """
+    now = now or timezone.now()
+    limit = limit or outbox_setting('EMAIL_OUTBOX_BATCH_SIZE')
+    with transaction.atomic():
+        batch = list(
+            OutboundEmail.objects
+            .filter(status='queued', next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')
+            .select_for_update(skip_locked=True)[:limit]
+        )
+        lease_until = now + timedelta(seconds=outbox_setting('EMAIL_OUTBOX_LEASE'))
+        for email in batch:
+            email.attempts += 1
+            email.next_attempt_at = lease_until
+        OutboundEmail.objects.bulk_update(batch, ['attempts', 'next_attempt_at'])
+    return batch
+
+
+def _failed(email, error, now, permanent=False):
+    email.last_error = str(error)[:2000] or error.__class__.__name__
+    if permanent or email.attempts >= outbox_setting('EMAIL_OUTBOX_MAX_ATTEMPTS'):
+        email.status = 'failed'
+        logger.error(f"Giving up on email {email.id} to {email.to} after {email.attempts} attempts: {error}")
+    else:
+        email.next_attempt_at = now + retry_delay(email.attempts)
+        logger.warning(f"Email {email.id} failed (attempt {email.attempts}), retrying: {error}")
+
+
+def _release(email, now):
+    """Undo claim_batch() for an email that wasn't attempted."""
+    email.attempts -= 1
+    email.next_attempt_at = now
+
+
+def send_batch(batch, connection, now=None):
+    """
+    Send a claimed batch over connection (opened here if needed) and record
+    the outcome of every email with one bulk UPDATE. Returns (sent, failed);
+    emails left untried after a disconnect are in neither count.
+    """
+    now = now or timezone.now()
+    sent = failed = 0
+    pending = list(batch)
+    while pending:
+        email = pending.pop(0)
+        try:
+            connection.open()
+            if not connection.send_messages([to_message(email, connection)]):
+                raise ValueError("Message has no recipients")
+        except CONNECTION_ERRORS as e:
+            # The server hung up. Only the email in flight counts as a failed
+            # attempt; the rest of the batch was never tried, so it goes back
+            # in the queue as it was. The next batch starts on a fresh connection.
+            connection.close()
+            _failed(email, e, now)
+            failed += 1
+            for untried in pending:
+                _release(untried, now)
+            break
+        except PERMANENT_ERRORS as e:
+            _failed(email, e, now, permanent=True)
+            failed += 1
+        except Exception as e:
+            _failed(email, e, now)
+            failed += 1
+        else:
+            email.status = 'sent'
+            email.sent_at = timezone.now()
+            email.last_error = ''
+            sent += 1
+    OutboundEmail.objects.bulk_update(batch, ['status', 'attempts', 'sent_at', 'last_error', 'next_attempt_at'])
+    return sent, failed
@@ -0,0 +1,62 @@
+"""
+Building outbound emails from templates.
+
+Email bodies are Django templates under <app>/templates/<app>/emails/.
+Each template is compiled the first time it is used and kept for the life
+of the process, so building an email is one render of a compiled template
+instead of assembling a large HTML string by hand.
+
+ascii_safe() replaces characters that some mail clients mangle with
+spaces. It keeps the rupee sign and runs as a single str.translate() pass.
+"""
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives
+from django.template.loader import get_template
+
+# Non-ASCII characters that are safe to keep in emails
+KEEP_CHARACTERS = frozenset('₹')
+
+
+class _AsciiTable(dict):
+    """
+    str.translate() table for ascii_safe(). Entries are added the first
+    time each code point is looked up, so the table never needs more than
+    the characters actually seen.
+    """
+
+    def __missing__(self, codepoint):
+        value = codepoint if codepoint < 128 or chr(codepoint) in KEEP_CHARACTERS else ord(' ')
+        self[codepoint] = value
+        return value
+
+
+_ASCII_TABLE = _AsciiTable()
+
+
+def ascii_safe(text):
+    """Replace non-ASCII characters (except KEEP_CHARACTERS) with spaces."""
+    text = str(text)
+    if text.isascii():
+        return text
+    return text.translate(_ASCII_TABLE)
+
+
+@lru_cache(maxsize=None)
+def compiled_template(name):
+    return get_template(name)
+
+
+def render_email(template_name, context, *, subject, text, to, from_email=None):
+    """Render template_name into an EmailMultiAlternatives with a plain-text fallback."""
+    html = compiled_template(template_name).render(context)
+    email = EmailMultiAlternatives(
+        subject=ascii_safe(subject),
+        body=ascii_safe(text),
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        to=to,
+    )
+    email.attach_alternative(ascii_safe(html), 'text/html')
+    email.encoding = 'utf-8'
+    return email
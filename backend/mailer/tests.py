@@ -0,0 +1,172 @@
+import smtplib
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+
+from django.core import mail
+from django.core.mail import EmailMultiAlternatives
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.management import call_command
+from django.db import OperationalError
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from .models import OutboundEmail
+from .outbox import claim_batch, enqueue, enqueue_many, send_batch
+from .rendering import ascii_safe, compiled_template
+
+
+class RecordingBackend(BaseEmailBackend):
+    """Counts connections and fails on demand instead of talking to SMTP."""
+    opened = 0
+    fail_for = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.connected = False
+
+    def open(self):
+        if not self.connected:
+            self.connected = True
+            RecordingBackend.opened += 1
+
+    def close(self):
+        self.connected = False
+
+    def send_messages(self, messages):
+        for message in messages:
+            error = self.fail_for.get(message.to[0])
+            if error:
+                raise error
+            mail.outbox.append(message)
+        return len(messages)
+
+
+def message(to='customer@example.com', subject='Order Approved'):
+    email = EmailMultiAlternatives(subject=subject, body='plain', from_email='shop@example.com', to=[to])
+    email.attach_alternative('<p>html</p>', 'text/html')
+    return email
+
+
+@override_settings(EMAIL_OUTBOX_MAX_ATTEMPTS=3, EMAIL_OUTBOX_RETRY_DELAY=60)
+class OutboxTests(TestCase):
+    def setUp(self):
+        RecordingBackend.opened = 0
+        RecordingBackend.fail_for = {}
+        self.connection = RecordingBackend()
+
+    def test_enqueue_stores_the_message_without_sending(self):
+        with self.assertNumQueries(1):
+            enqueue(message())
+        email = OutboundEmail.objects.get()
+        self.assertEqual((email.subject, email.body, email.html_body), ('Order Approved', 'plain', '<p>html</p>'))
+        self.assertEqual(email.to, ['customer@example.com'])
+        self.assertEqual(email.status, 'queued')
+        self.assertEqual(mail.outbox, [])
+
+    def test_dedupe_key_queues_once(self):
+        enqueue(message(), dedupe_key='payment-success:1')
+        enqueue_many([(message(), 'payment-success:1'), (message(), 'payment-success:2')])
+        self.assertEqual(OutboundEmail.objects.count(), 2)
+
+    def test_batch_goes_out_over_one_connection(self):
+        enqueue_many(message(to=f'c{i}@example.com') for i in range(5))
+        batch = claim_batch()
+        with self.assertNumQueries(1):
+            self.assertEqual(send_batch(batch, self.connection), (5, 0))
+        self.assertEqual(RecordingBackend.opened, 1)
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(mail.outbox[0].alternatives, [('<p>html</p>', 'text/html')])
+        self.assertFalse(OutboundEmail.objects.exclude(status='sent').exists())
+
+    def test_claimed_emails_are_leased(self):
+        enqueue(message())
+        self.assertEqual(len(claim_batch()), 1)
+        self.assertEqual(claim_batch(), [])
+        later = timezone.now() + timedelta(minutes=10)
+        self.assertEqual(len(claim_batch(now=later)), 1)
+
+    def test_failures_back_off_then_give_up(self):
+        RecordingBackend.fail_for = {'bad@example.com': smtplib.SMTPDataError(451, 'try later')}
+        enqueue(message(to='bad@example.com'))
+        now = timezone.now()
+        for attempt in range(1, 4):
+            send_batch(claim_batch(now=now), self.connection, now=now)
+            email = OutboundEmail.objects.get()
+            self.assertEqual(email.attempts, attempt)
+            self.assertIn('try later', email.last_error)
+            if attempt < 3:
+                self.assertEqual(email.status, 'queued')
+                delay = (email.next_attempt_at - now).total_seconds()
+                self.assertGreaterEqual(delay, 60 * 2 ** (attempt - 1) - 1)
+                now = email.next_attempt_at
+        self.assertEqual(email.status, 'failed')
+
+    def test_refused_recipient_is_not_retried(self):
+        RecordingBackend.fail_for = {'gone@example.com': smtplib.SMTPRecipientsRefused({})}
+        enqueue_many([message(to='gone@example.com'), message()])
+        self.assertEqual(send_batch(claim_batch(), self.connection), (1, 1))
+        self.assertEqual(OutboundEmail.objects.get(to=['gone@example.com']).status, 'failed')
+
+    def test_disconnect_requeues_the_rest_of_the_batch(self):
+        RecordingBackend.fail_for = {'c1@example.com': smtplib.SMTPServerDisconnected()}
+        enqueue_many(message(to=f'c{i}@example.com') for i in range(4))
+        now = timezone.now()
+        self.assertEqual(send_batch(claim_batch(now=now), self.connection, now=now), (1, 1))
+        self.assertFalse(self.connection.connected)
+        in_flight = OutboundEmail.objects.get(to=['c1@example.com'])
+        self.assertEqual((in_flight.status, in_flight.attempts), ('queued', 1))
+        self.assertGreater(in_flight.next_attempt_at, now)
+        # The two never tried are due again at once, without a charged attempt
+        untried = OutboundEmail.objects.filter(to__in=[['c2@example.com'], ['c3@example.com']])
+        self.assertEqual({(e.attempts, e.last_error, e.next_attempt_at) for e in untried}, {(0, '', now)})
+        self.assertEqual(len(claim_batch(now=now)), 2)
+
+
+@override_settings(EMAIL_BACKEND='mailer.tests.RecordingBackend')
+class SendQueuedEmailCommandTests(TestCase):
+    def setUp(self):
+        RecordingBackend.opened = 0
+        RecordingBackend.fail_for = {}
+
+    def test_once_drains_the_queue_in_batches(self):
+        enqueue_many(message(to=f'c{i}@example.com') for i in range(7))
+        out = StringIO()
+        call_command('send_queued_email', '--once', '--batch-size', '3', stdout=out)
+        self.assertEqual(len(mail.outbox), 7)
+        self.assertEqual(RecordingBackend.opened, 1)
+        self.assertIn('Sent 7 email(s), 0 failed', out.getvalue())
+
+
+    def test_database_errors_do_not_stop_the_worker(self):
+        enqueue(message())
+        calls = []
+
+        def flaky_claim(size):
+            calls.append(size)
+            if len(calls) == 1:
+                raise OperationalError('server closed the connection unexpectedly')
+            return claim_batch(size)
+
+        out = StringIO()
+        command = 'mailer.management.commands.send_queued_email'
+        with patch(f'{command}.claim_batch', flaky_claim), \
+                patch(f'{command}.time.sleep', side_effect=[None, KeyboardInterrupt]):
+            call_command('send_queued_email', stdout=out)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn('Sent 1 email(s), 0 failed', out.getvalue())
+
+class AsciiSafeTests(TestCase):
+    def test_keeps_ascii_and_rupee_sign(self):
+        self.assertEqual(ascii_safe('Total: ₹150.00'), 'Total: ₹150.00')
+
+    def test_replaces_everything_else_with_a_space(self):
+        self.assertEqual(ascii_safe('Café\xa0✅ done'), 'Caf    done')
+
+    def test_non_strings_are_converted(self):
+        self.assertEqual(ascii_safe(42), '42')
+
+    def test_templates_are_compiled_once(self):
+        self.assertIs(compiled_template('cart/emails/payment_failed.html'),
+                      compiled_template('cart/emails/payment_failed.html'))
@@ -1,5 +1,6 @@
 from django.contrib import admin
 from .models import Product
+from .cache import bump_catalog_version_on_commit
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
@@ -8,4 +9,8 @@ class ProductAdmin(admin.ModelAdmin):
     list_filter = ('brand', 'category')
     fields = ('name', 'brand', 'category', 'original_price', 'discount_percent', 'discounted_price', 'price', 'image', 'stock', 'description')
     readonly_fields = ('discounted_price', 'price')
- 
\ No newline at end of file
+
+    def delete_queryset(self, request, queryset):
+        # Bulk deletes from the changelist bypass Product.delete()
+        super().delete_queryset(request, queryset)
+        bump_catalog_version_on_commit()
@@ -0,0 +1,105 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponseNotModified
+from django.utils.cache import parse_etags, quote_etag
+from rest_framework.response import Response
+
+
+VERSION_KEY = 'catalog:version'
+SEARCH_VERSION_KEY = 'catalog:search-version'
+
+
+def get_catalog_cache():
+    return caches[getattr(settings, 'CATALOG_CACHE_ALIAS', 'default')]
+
+
+def _get_version(key):
+    cache = get_catalog_cache()
+    version = cache.get(key)
+    if version is None:
+        # Seed from the clock rather than 1 so an evicted counter can never
+        # collide with entries cached under an earlier version.
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def _bump_version(key):
+    cache = get_catalog_cache()
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Counter was evicted (or never created); start a fresh one.
+        _get_version(key)
+        return cache.incr(key)
+
+
+def get_catalog_version():
+    """Return the current catalog version, creating it on first use."""
+    return _get_version(VERSION_KEY)
+
+
+def get_search_version():
+    """Like get_catalog_version(), but stock changes leave it alone."""
+    return _get_version(SEARCH_VERSION_KEY)
+
+
+def bump_catalog_version(stock_only=False):
+    """
+    Invalidate every cached catalog response by moving to a new version.
+    The search version moves too unless only stock levels changed.
+    """
+    if not stock_only:
+        _bump_version(SEARCH_VERSION_KEY)
+    return _bump_version(VERSION_KEY)
+
+
+def bump_catalog_version_on_commit(stock_only=False):
+    """Bump once the surrounding transaction commits, so readers never cache
+    pre-commit rows under the new version."""
+    transaction.on_commit(lambda: bump_catalog_version(stock_only=stock_only))
+
+
+class CatalogCacheMixin:
+    """
+    Serve GET responses from the versioned catalog cache.
+
+    Responses are keyed by catalog version and full request URL, and carry an
+    ETag derived from that key, so a repeat visitor whose copy is current gets
+    a 304 without the view touching the database or the serializer.
+    """
+
+    def get_catalog_cache_key(self, request, version):
+        return f'catalog:{version}:{request.get_host()}{request.get_full_path()}'
+
+    def get_uncached_response(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+    def get(self, request, *args, **kwargs):
+        version = get_catalog_version()
+        key = self.get_catalog_cache_key(request, version)
+        etag = quote_etag(hashlib.md5(key.encode()).hexdigest())
+
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            response['Cache-Control'] = 'no-cache'
+            return response
+
+        cache = get_catalog_cache()
+        data = cache.get(key)
+        if data is None:
+            response = self.get_uncached_response(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            cache.set(key, response.data)
+        else:
+            response = Response(data)
+
+        response['ETag'] = etag
+        response['Cache-Control'] = 'no-cache'
+        return response
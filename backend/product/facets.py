@@ -0,0 +1,125 @@
+"""
+Faceted counts for catalog browsing.
+
+The catalog is small along every facet dimension, so we precompute a "cube":
+one row per (brand, category, price bucket, in stock) combination with its
+product count. The cube comes from a single GROUP BY query and is cached
+under the catalog version, so it is rebuilt after the next product change.
+Facet counts for any combination of brand/category/bucket/stock filters are
+then sums over the cube in Python. Arbitrary min/max price filters don't line
+up with the buckets, so those requests aggregate the filtered rows live
+(still a single query).
+"""
+from collections import Counter
+
+from django.db.models import BooleanField, Case, CharField, Count, Value, When
+
+from .cache import get_catalog_cache, get_catalog_version
+from .filters import PRICE_BUCKETS, filter_products, parse_bool, parse_list, parse_price_buckets
+from .models import Product
+
+
+DIMENSIONS = ('brand', 'category', 'price_bucket', 'in_stock')
+
+
+def _price_bucket_expression():
+    whens = [
+        When(price__lt=high, then=Value(label))
+        for label, _, high in PRICE_BUCKETS if high is not None
+    ]
+    return Case(*whens, default=Value(PRICE_BUCKETS[-1][0]), output_field=CharField())
+
+
+def build_facet_cube(queryset):
+    """Aggregate queryset into [{brand, category, price_bucket, in_stock, count}]."""
+    rows = (
+        queryset
+        .annotate(
+            price_bucket=_price_bucket_expression(),
+            in_stock=Case(When(stock__gt=0, then=Value(True)), default=Value(False), output_field=BooleanField()),
+        )
+        .values(*DIMENSIONS)
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    return list(rows)
+
+
+def get_facet_cube():
+    cache = get_catalog_cache()
+    key = f'catalog:{get_catalog_version()}:facet-cube'
+    cube = cache.get(key)
+    if cube is None:
+        cube = build_facet_cube(Product.objects.all())
+        cache.set(key, cube)
+    return cube
+
+
+def _selected(params):
+    selected = {
+        'brand': set(parse_list(params, 'brand')),
+        'category': set(parse_list(params, 'category')),
+        'price_bucket': set(parse_price_buckets(params)),
+    }
+    in_stock = parse_bool(params, 'in_stock')
+    selected['in_stock'] = set() if in_stock is None else {in_stock}
+    return selected
+
+
+def _matches(row, selected, skip=None):
+    return all(
+        not values or row[dimension] in values
+        for dimension, values in selected.items()
+        if dimension != skip
+    )
+
+
+def compute_facets(params):
+    """
+    Return facet counts for the filters in params.
+
+    Each dimension's counts ignore that dimension's own filter (so picking
+    "Orane" still shows how many "Klassy" products there are) but respect
+    all the others; ``total`` respects every filter.
+    """
+    selected = _selected(params)
+    if params.get('min_price') or params.get('max_price'):
+        cube = build_facet_cube(filter_products(Product.objects.all(), {
+            'min_price': params.get('min_price'),
+            'max_price': params.get('max_price'),
+        }))
+    else:
+        cube = get_facet_cube()
+
+    counts = {dimension: Counter() for dimension in DIMENSIONS}
+    total = 0
+    for row in cube:
+        if _matches(row, selected):
+            total += row['count']
+        for dimension in DIMENSIONS:
+            if _matches(row, selected, skip=dimension):
+                counts[dimension][row[dimension]] += row['count']
+
+    brands = [value for value, _ in Product.BRAND_CHOICES]
+    brands += sorted(set(counts['brand']) - set(brands))
+    return {
+        'total': total,
+        'brand': [{'value': brand, 'count': counts['brand'][brand]} for brand in brands],
+        'category': [
+            {'value': category, 'count': count}
+            for category, count in sorted(counts['category'].items(), key=lambda item: (-item[1], item[0]))
+        ],
+        'price_bucket': [
+            {
+                'value': label,
+                'min': str(low),
+                'max': str(high) if high is not None else None,
+                'count': counts['price_bucket'][label],
+            }
+            for label, low, high in PRICE_BUCKETS
+        ],
+        'in_stock': [
+            {'value': True, 'count': counts['in_stock'][True]},
+            {'value': False, 'count': counts['in_stock'][False]},
+        ],
+    }
@@ -0,0 +1,106 @@
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Q
+from rest_framework import serializers
+
+
+TRUE_VALUES = {'1', 'true', 'yes', 'on'}
+FALSE_VALUES = {'0', 'false', 'no', 'off'}
+
+# (label, lower bound inclusive, upper bound exclusive) in rupees.
+PRICE_BUCKETS = [
+    ('0-100', Decimal('0'), Decimal('100')),
+    ('100-250', Decimal('100'), Decimal('250')),
+    ('250-500', Decimal('250'), Decimal('500')),
+    ('500-1000', Decimal('500'), Decimal('1000')),
+    ('1000+', Decimal('1000'), None),
+]
+PRICE_BUCKET_LABELS = [label for label, _, _ in PRICE_BUCKETS]
+
+
+def _parse_price(params, name):
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        price = Decimal(value)
+    except InvalidOperation:
+        raise serializers.ValidationError({name: 'Must be a number.'})
+    if price < 0:
+        raise serializers.ValidationError({name: 'Must not be negative.'})
+    return price
+
+
+def parse_bool(params, name):
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    value = value.lower()
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    raise serializers.ValidationError({name: 'Must be true or false.'})
+
+
+def parse_list(params, name):
+    return [value for value in params.get(name, '').split(',') if value]
+
+
+def parse_price_buckets(params):
+    buckets = parse_list(params, 'price_bucket')
+    unknown = [b for b in buckets if b not in PRICE_BUCKET_LABELS]
+    if unknown:
+        raise serializers.ValidationError(
+            {'price_bucket': f"Unknown bucket(s): {', '.join(unknown)}. Choose from {', '.join(PRICE_BUCKET_LABELS)}."}
+        )
+    return buckets
+
+
+def price_bucket_q(labels):
+    condition = Q()
+    for label, low, high in PRICE_BUCKETS:
+        if label in labels:
+            bucket = Q(price__gte=low)
+            if high is not None:
+                bucket &= Q(price__lt=high)
+            condition |= bucket
+    return condition
+
+
+def filter_products(queryset, params):
+    """
+    Apply the public catalog filters to a Product queryset.
+
+    Supported query params: ``brand``, ``category`` and ``price_bucket``
+    (comma separated for several values), ``min_price``/``max_price`` and
+    ``in_stock``.
+    """
+    brands = parse_list(params, 'brand')
+    if brands:
+        queryset = queryset.filter(brand__in=brands)
+
+    categories = parse_list(params, 'category')
+    if categories:
+        queryset = queryset.filter(category__in=categories)
+
+    buckets = parse_price_buckets(params)
+    if buckets:
+        queryset = queryset.filter(price_bucket_q(buckets))
+
+    min_price = _parse_price(params, 'min_price')
+    max_price = _parse_price(params, 'max_price')
+    if min_price is not None and max_price is not None and min_price > max_price:
+        raise serializers.ValidationError({'min_price': 'Must not be greater than max_price.'})
+    if min_price is not None:
+        queryset = queryset.filter(price__gte=min_price)
+    if max_price is not None:
+        queryset = queryset.filter(price__lte=max_price)
+
+    in_stock = parse_bool(params, 'in_stock')
+    if in_stock is True:
+        queryset = queryset.filter(stock__gt=0)
+    elif in_stock is False:
+        queryset = queryset.filter(stock=0)
+
+    return queryset
@@ -0,0 +1,56 @@
+import csv
+import gzip
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from product.models import Product
+from .import_products import COLUMNS
+
+
+class Command(BaseCommand):
+    help = 'Stream all products to a CSV or JSONL file (use - for stdout)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-', help='Output file, optionally .gz, or - for stdout')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Defaults to the file extension')
+        parser.add_argument('--fields', help=f"Comma separated subset of: {', '.join(COLUMNS)}")
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format']
+        if fmt is None:
+            name = path[:-3] if path.endswith('.gz') else path
+            fmt = 'jsonl' if name.endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+        fields = options['fields'].split(',') if options['fields'] else COLUMNS
+        unknown = set(fields) - set(COLUMNS)
+        if unknown:
+            raise CommandError(f"Unknown field(s): {', '.join(sorted(unknown))}")
+
+        if path == '-':
+            out = sys.stdout
+        elif path.endswith('.gz'):
+            out = gzip.open(path, 'wt', newline='', encoding='utf-8')
+        else:
+            out = open(path, 'w', newline='', encoding='utf-8')
+
+        rows = Product.objects.order_by('id').values_list(*fields).iterator(chunk_size=options['chunk_size'])
+        count = 0
+        try:
+            if fmt == 'csv':
+                writer = csv.writer(out)
+                writer.writerow(fields)
+                for row in rows:
+                    writer.writerow(row)
+                    count += 1
+            else:
+                for row in rows:
+                    out.write(json.dumps(dict(zip(fields, row)), default=str) + '\n')
+                    count += 1
+        finally:
+            if out is not sys.stdout:
+                out.close()
+
+        self.stderr.write(self.style.SUCCESS(f'Exported {count} products'))
@@ -0,0 +1,209 @@
+import sys
+from decimal import Decimal
+
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from product.cache import bump_catalog_version_on_commit
+from product.models import Product
+
+
+COLUMNS = ['id', 'name', 'brand', 'category', 'original_price', 'discount_percent',
+           'price', 'stock', 'description', 'image']
+MONEY_COLUMNS = ['price', 'original_price']
+INTEGER_COLUMNS = ['discount_percent', 'stock']
+BRANDS = {value for value, _ in Product.BRAND_CHOICES}
+
+
+def to_paise(column):
+    """Parse a rupee column into nullable integer paise."""
+    return (pd.to_numeric(column, errors='coerce') * 100).round().astype('Int64')
+
+
+def discounted_paise(original_paise, discount_percent):
+    """
+    Vectorised form of the discount in Product.save().
+
+    Works in integer paise so it matches the Decimal arithmetic there,
+    rounding half a paisa up (away from zero, as Postgres numeric does):
+    199.90 at 5% off is 189.91.
+    """
+    hundredths = original_paise * (100 - discount_percent)
+    quotient = hundredths // 100
+    round_up = hundredths % 100 >= 50  # prices are never negative
+    return quotient + round_up.astype('Int64')
+
+
+def paise_to_decimal(value):
+    return Decimal(int(value)).scaleb(-2)
+
+
+class Command(BaseCommand):
+    help = 'Bulk create/update products from a CSV or JSONL file (use - for stdin)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV/JSONL file, optionally .gz, or - for stdin')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--match-on', choices=['id', 'name'],
+                            help='Column used to find existing products (default: id if present, else name)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Print what would change without writing anything')
+
+    def handle(self, *args, **options):
+        self.dry_run = options['dry_run']
+        self.batch_size = options['batch_size']
+        self.match_on = options['match_on']
+        self.stats = {'created': 0, 'updated': 0, 'unchanged': 0, 'errors': 0}
+        self.line = 1  # header / first record
+
+        chunks = self.read_chunks(options['path'], options['format'])
+        if self.dry_run:
+            for chunk in chunks:
+                self.process_chunk(chunk)
+        else:
+            with transaction.atomic():
+                for chunk in chunks:
+                    self.process_chunk(chunk)
+                # bulk_create/bulk_update bypass Product.save()
+                bump_catalog_version_on_commit()
+
+        prefix = '[dry run] ' if self.dry_run else ''
+        summary = ', '.join(f'{count} {name}' for name, count in self.stats.items())
+        style = self.style.WARNING if self.stats['errors'] else self.style.SUCCESS
+        self.stdout.write(style(f'{prefix}Import finished: {summary}'))
+
+    def read_chunks(self, path, fmt):
+        source = sys.stdin if path == '-' else path
+        if fmt is None:
+            name = path[:-3] if path.endswith('.gz') else path
+            fmt = 'jsonl' if name.endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+        try:
+            if fmt == 'csv':
+                reader = pd.read_csv(source, dtype=str, keep_default_na=False, chunksize=self.batch_size)
+            else:
+                reader = pd.read_json(source, lines=True, dtype=False, chunksize=self.batch_size)
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Could not read {path}: {e}')
+        for chunk in reader:
+            unknown = set(chunk.columns) - set(COLUMNS)
+            if unknown:
+                raise CommandError(f"Unknown column(s): {', '.join(sorted(unknown))}")
+            present = [c for c in COLUMNS if c in chunk.columns]
+            chunk = chunk.reindex(columns=present).fillna('').astype(str).apply(lambda col: col.str.strip())
+            yield chunk
+
+    def error(self, line, message):
+        self.stats['errors'] += 1
+        self.stderr.write(self.style.ERROR(f'Line {line}: {message}'))
+
+    def find_existing(self, chunk):
+        match_on = self.match_on or ('id' if 'id' in chunk.columns else 'name')
+        if match_on not in chunk.columns:
+            raise CommandError(f"--match-on {match_on} but the file has no '{match_on}' column")
+        keys = chunk[match_on]
+        if match_on == 'id':
+            keys = pd.to_numeric(keys, errors='coerce').astype('Int64')
+            existing = Product.objects.in_bulk([int(k) for k in keys.dropna()])
+        else:
+            existing = {}
+            for product in Product.objects.filter(name__in=list(keys[keys != ''])).order_by('id'):
+                existing.setdefault(product.name, product)
+        return keys, existing
+
+    def process_chunk(self, chunk):
+        first_line = self.line + 1
+        self.line += len(chunk)
+        keys, existing = self.find_existing(chunk)
+        found = [existing.get(k) if not pd.isna(k) else None for k in keys]
+        columns = set(chunk.columns)
+
+        # Parse every numeric column for the whole chunk at once, then fall
+        # back to the stored value wherever the file leaves a cell empty.
+        parsed = pd.DataFrame(index=chunk.index)
+        for column in MONEY_COLUMNS + INTEGER_COLUMNS:
+            raw = chunk[column] if column in columns else pd.Series('', index=chunk.index)
+            if column in MONEY_COLUMNS:
+                values = to_paise(raw)
+                current = [int(getattr(p, column) * 100) if p is not None and getattr(p, column) is not None else None
+                           for p in found]
+            else:
+                values = pd.to_numeric(raw, errors='coerce').round().astype('Int64')
+                current = [getattr(p, column) if p is not None else None for p in found]
+            parsed[f'{column}_invalid'] = (raw != '') & values.isna()
+            parsed[column] = values.fillna(pd.Series(current, index=chunk.index, dtype='Int64'))
+
+        has_discount = (parsed['original_price'].fillna(0) != 0) & parsed['discount_percent'].notna()
+        parsed['discounted_price'] = discounted_paise(parsed['original_price'], parsed['discount_percent']).where(has_discount)
+        parsed['price'] = parsed['discounted_price'].where(has_discount, parsed['price'])
+
+        to_create, to_update, update_fields = [], [], set()
+        rows = zip(chunk.to_dict('records'), parsed.to_dict('records'), found)
+        for offset, (row, numbers, product) in enumerate(rows):
+            line = first_line + offset
+            values = self.row_values(line, row, numbers, columns, product)
+            if values is None:
+                continue
+            if product is None:
+                to_create.append(Product(**values))
+                if self.dry_run:
+                    self.stdout.write(f"+ {values['name']}")
+                continue
+            changes = {
+                field: (getattr(product, field), value)
+                for field, value in values.items()
+                if getattr(product, field) != value
+            }
+            if not changes:
+                self.stats['unchanged'] += 1
+                continue
+            for field, (_, value) in changes.items():
+                setattr(product, field, value)
+            to_update.append(product)
+            update_fields.update(changes)
+            if self.dry_run:
+                diff = '; '.join(f'{f}: {old!r} -> {new!r}' for f, (old, new) in changes.items())
+                self.stdout.write(f'~ #{product.pk} {product.name}: {diff}')
+
+        self.stats['created'] += len(to_create)
+        self.stats['updated'] += len(to_update)
+        if self.dry_run:
+            return
+        if to_create:
+            Product.objects.bulk_create(to_create, batch_size=self.batch_size)
+        if to_update:
+            Product.objects.bulk_update(to_update, sorted(update_fields), batch_size=self.batch_size)
+
+    def row_values(self, line, row, numbers, columns, product):
+        """Build the field values for one row, or None (after reporting) if it is invalid."""
+        values = {}
+        for field in ('name', 'brand', 'category', 'description', 'image'):
+            if field in columns and row[field] != '':
+                values[field] = row[field]
+
+        for field in MONEY_COLUMNS + INTEGER_COLUMNS:
+            if numbers[f'{field}_invalid']:
+                self.error(line, f'{field} {row[field]!r} is not a number')
+                return None
+            if field in INTEGER_COLUMNS and not pd.isna(numbers[field]) and numbers[field] < 0:
+                self.error(line, f'{field} must not be negative')
+                return None
+        if product is None:
+            missing = [f for f in ('name', 'category') if f not in values]
+            if pd.isna(numbers['price']):
+                missing.append('price or original_price')
+            if missing:
+                self.error(line, f"new product is missing {', '.join(missing)}")
+                return None
+        if 'brand' in values and values['brand'] not in BRANDS:
+            self.error(line, f"unknown brand {values['brand']!r}")
+            return None
+
+        for field in MONEY_COLUMNS + ['discounted_price']:
+            if not pd.isna(numbers[field]):
+                values[field] = paise_to_decimal(numbers[field])
+        for field in INTEGER_COLUMNS:
+            if not pd.isna(numbers[field]):
+                values[field] = int(numbers[field])
+        return values
@@ -0,0 +1,51 @@
+from django.db import migrations, transaction, DatabaseError
+
+# Frozen copy of product.search.SEARCH_DOCUMENT_SQL.
+SEARCH_DOCUMENT_SQL = (
+    "setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(brand, '') || ' ' || coalesce(category, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(description, '')), 'C')"
+)
+
+
+def create_search_indexes(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != "postgresql":
+        # Other databases fall back to the in-process search index.
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS product_search_document_idx "
+            f"ON product_product USING gin (({SEARCH_DOCUMENT_SQL}))"
+        )
+        try:
+            # Creating extensions may need privileges the app role lacks;
+            # search still works without it, just without typo tolerance.
+            with transaction.atomic(using=connection.alias):
+                cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        except DatabaseError:
+            return
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS product_name_trgm_idx "
+            "ON product_product USING gin (name gin_trgm_ops)"
+        )
+
+
+def drop_search_indexes(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != "postgresql":
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("DROP INDEX IF EXISTS product_name_trgm_idx")
+        cursor.execute("DROP INDEX IF EXISTS product_search_document_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("product", "0005_product_catalog_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
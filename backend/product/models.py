@@ -1,4 +1,7 @@
+from decimal import ROUND_HALF_UP, Decimal
+
 from django.db import models
+from .cache import bump_catalog_version_on_commit
 
 # Create your models here.
 
@@ -24,6 +27,16 @@ class Product(models.Model):
         max_digits=10, decimal_places=2, help_text="Price after discount", default=0, blank=True, null=True
     )
 
+    class Meta:
+        # Composite indexes backing the catalog filters and keyset pagination
+        # on /api/products/: each ends on the column the cursor seeks on.
+        indexes = [
+            models.Index(fields=['brand', 'category', 'id'], name='product_brand_cat_id_idx'),
+            models.Index(fields=['category', 'id'], name='product_category_id_idx'),
+            models.Index(fields=['price', 'id'], name='product_price_id_idx'),
+            models.Index(fields=['id'], condition=models.Q(stock__gt=0), name='product_in_stock_id_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -36,7 +49,16 @@ class Product(models.Model):
     def save(self, *args, **kwargs):
         # Auto-calculate discounted_price before saving
         if self.original_price and self.discount_percent is not None:
-            self.discounted_price = self.original_price - (self.original_price * self.discount_percent / 100)
+            original_price = Decimal(str(self.original_price))
+            self.discounted_price = (
+                original_price - (original_price * self.discount_percent / 100)
+            ).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
             self.price = self.discounted_price  # Optionally keep price in sync
         super().save(*args, **kwargs)
+        bump_catalog_version_on_commit()
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        bump_catalog_version_on_commit()
+        return result
  
\ No newline at end of file
@@ -0,0 +1,11 @@
+from backend.pagination import OptionalCursorPagination
+
+
+class ProductCursorPagination(OptionalCursorPagination):
+    ordering_choices = {
+        'id': ('id',),
+        '-id': ('-id',),
+        'price': ('price', 'id'),
+        '-price': ('-price', '-id'),
+    }
+    default_ordering = 'id'
@@ -0,0 +1,258 @@
+"""
+Product search.
+
+On PostgreSQL (with the pg_trgm extension) queries run against the GIN
+indexes created in migration 0006: a weighted tsvector over name, brand,
+category and description for full-text matches, and a trigram index on name
+for typo tolerance. Anywhere else an in-process inverted index is used; it is
+rebuilt lazily whenever the search version changes, which stock changes
+(every checkout) leave alone since the index holds no stock.
+
+Catalog filters are applied before the results are cut to the limit, so
+a filtered search still returns up to limit matches.
+"""
+import bisect
+import math
+import re
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection
+
+from .cache import get_search_version
+from .models import Product
+
+
+# Keep in sync with migration 0006 - the planner only uses the GIN index when
+# the query repeats this expression exactly.
+SEARCH_DOCUMENT_SQL = (
+    "setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(brand, '') || ' ' || coalesce(category, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(description, '')), 'C')"
+)
+
+# Parameters: tsquery, query, tsquery, query, then any from {filter}, then limit
+POSTGRES_SEARCH_SQL = f"""
+    SELECT id,
+           ts_rank({SEARCH_DOCUMENT_SQL}, to_tsquery('simple', %s)) * 2
+             + word_similarity(%s, name) AS rank
+    FROM product_product
+    WHERE ({SEARCH_DOCUMENT_SQL} @@ to_tsquery('simple', %s)
+           OR %s <%% name){{filter}}
+    ORDER BY rank DESC, id
+    LIMIT %s
+"""
+
+FIELD_WEIGHTS = {
+    'name': 3.0,
+    'brand': 2.0,
+    'category': 2.0,
+    'description': 1.0,
+}
+PREFIX_MATCH_WEIGHT = 0.8
+FUZZY_MATCH_WEIGHT = 0.6
+MAX_FUZZY_CANDIDATES = 200
+
+TOKEN_RE = re.compile(r'\w+')
+
+_pg_trgm_installed = None
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower()) if text else []
+
+
+def _trigrams(token):
+    padded = f'${token}$'
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def max_edits(token):
+    """Typo budget for a query token: none for short words, more for long ones."""
+    if len(token) <= 3:
+        return 0
+    if len(token) <= 7:
+        return 1
+    return 2
+
+
+def within_distance(a, b, limit):
+    """
+    True if the optimal-string-alignment distance between a and b is at most
+    limit. Gives up as soon as a whole row exceeds the limit.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return False
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if (previous2 is not None and i > 1 and j > 1
+                    and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]):
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return False
+        previous2, previous = previous, current
+    return previous[-1] <= limit
+
+
+class ProductSearchIndex:
+    """In-process inverted index over the searchable Product fields."""
+
+    def __init__(self, rows, version=None):
+        self.version = version
+        self.postings = defaultdict(dict)
+        self.doc_count = 0
+        for row in rows:
+            self.add(row)
+        self.vocabulary = sorted(self.postings)
+        self.trigram_index = defaultdict(set)
+        for token in self.vocabulary:
+            for gram in _trigrams(token):
+                self.trigram_index[gram].add(token)
+
+    def add(self, row):
+        self.doc_count += 1
+        product_id = row['id']
+        for field, weight in FIELD_WEIGHTS.items():
+            for token in tokenize(row.get(field)):
+                postings = self.postings[token]
+                postings[product_id] = postings.get(product_id, 0) + weight
+
+    def idf(self, token):
+        return math.log(1 + self.doc_count / len(self.postings[token]))
+
+    def prefix_matches(self, prefix):
+        start = bisect.bisect_left(self.vocabulary, prefix)
+        for token in self.vocabulary[start:]:
+            if not token.startswith(prefix):
+                break
+            yield token
+
+    def fuzzy_matches(self, token):
+        limit = max_edits(token)
+        if not limit:
+            return
+        shared = defaultdict(int)
+        for gram in _trigrams(token):
+            for candidate in self.trigram_index.get(gram, ()):
+                shared[candidate] += 1
+        # A padded token has len(token) trigrams and every edit destroys at
+        # most three of them, so anything sharing fewer is out of budget.
+        needed = max(1, len(token) - 3 * limit)
+        candidates = [c for c, count in shared.items() if count >= needed and c != token]
+        candidates.sort(key=lambda c: -shared[c])
+        for candidate in candidates[:MAX_FUZZY_CANDIDATES]:
+            if within_distance(token, candidate, limit):
+                yield candidate
+
+    def expand(self, token, is_last):
+        """Yield (indexed term, match weight) pairs for a query token."""
+        seen = set()
+        if token in self.postings:
+            seen.add(token)
+            yield token, 1.0
+        if is_last:
+            # The last word is probably still being typed.
+            for term in self.prefix_matches(token):
+                if term not in seen:
+                    seen.add(term)
+                    yield term, PREFIX_MATCH_WEIGHT
+        for term in self.fuzzy_matches(token):
+            if term not in seen:
+                seen.add(term)
+                yield term, FUZZY_MATCH_WEIGHT
+
+    def search(self, query, limit=20, allowed=None):
+        """Best matches first; only ids in allowed, if given."""
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        scores = defaultdict(float)
+        matched = defaultdict(int)
+        for position, token in enumerate(tokens):
+            best = {}
+            for term, match_weight in self.expand(token, position == len(tokens) - 1):
+                idf = self.idf(term)
+                for product_id, field_weight in self.postings[term].items():
+                    if allowed is not None and product_id not in allowed:
+                        continue
+                    score = idf * field_weight * match_weight
+                    if score > best.get(product_id, 0):
+                        best[product_id] = score
+            for product_id, score in best.items():
+                scores[product_id] += score
+                matched[product_id] += 1
+        # Products matching more of the query words always rank first.
+        ranked = sorted(scores, key=lambda pid: (-matched[pid], -scores[pid], pid))
+        return ranked[:limit]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_search_index():
+    """Return the in-process index, rebuilding it if the searchable text changed."""
+    global _index
+    version = get_search_version()
+    index = _index
+    if index is not None and index.version == version:
+        return index
+    with _index_lock:
+        if _index is None or _index.version != version:
+            rows = Product.objects.values('id', *FIELD_WEIGHTS).iterator(chunk_size=2000)
+            _index = ProductSearchIndex(rows, version=version)
+        return _index
+
+
+def use_postgres_search():
+    global _pg_trgm_installed
+    backend = getattr(settings, 'PRODUCT_SEARCH_BACKEND', 'auto')
+    if backend == 'memory' or connection.vendor != 'postgresql':
+        return False
+    if backend == 'postgres':
+        return True
+    if _pg_trgm_installed is None:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            _pg_trgm_installed = cursor.fetchone() is not None
+    return _pg_trgm_installed
+
+
+def _is_filtered(queryset):
+    return queryset is not None and bool(queryset.query.where)
+
+
+def postgres_search(query, limit=20, queryset=None):
+    tokens = tokenize(query)
+    if not tokens:
+        return []
+    # Tokens are \w+ only, so they are safe to splice into a tsquery; the
+    # trailing :* gives prefix matching on every word.
+    tsquery = ' & '.join(f'{token}:*' for token in tokens)
+    params = [tsquery, query, tsquery, query]
+    extra = ''
+    if _is_filtered(queryset):
+        subquery, subquery_params = queryset.values('id').query.sql_with_params()
+        extra = f' AND id IN ({subquery})'
+        params.extend(subquery_params)
+    params.append(limit)
+    with connection.cursor() as cursor:
+        cursor.execute(POSTGRES_SEARCH_SQL.format(filter=extra), params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search_product_ids(query, limit=20, queryset=None):
+    """
+    Return product ids matching query, best match first. If queryset is
+    given (e.g. from filter_products), only its products are returned.
+    """
+    if use_postgres_search():
+        return postgres_search(query, limit, queryset)
+    allowed = set(queryset.values_list('id', flat=True)) if _is_filtered(queryset) else None
+    return get_search_index().search(query, limit, allowed)
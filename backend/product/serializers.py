@@ -1,8 +1,57 @@
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
 from .models import Product
 
-class ProductSerializer(serializers.ModelSerializer):
+class SparseFieldsetMixin:
+    """
+    Let clients trim a read representation with ``?fields=a,b`` or ``?omit=c``.
+
+    Only the top-level serializer honours the bare params. Nested serializers
+    set ``sparse_fieldset_key`` and read ``fields[<key>]``/``omit[<key>]``
+    instead, e.g. ``?fields[product]=id,name,price`` on the cart endpoints.
+    Naming a field the representation doesn't have is a 400.
+    """
+    sparse_fieldset_key = None
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        if request is None or request.method not in SAFE_METHODS:
+            return fields
+        only = self._get_sparse_param(request.query_params, 'fields', fields)
+        omit = self._get_sparse_param(request.query_params, 'omit', fields)
+        if only:
+            fields = {name: field for name, field in fields.items() if name in only}
+        for name in omit or ():
+            fields.pop(name, None)
+        return fields
+
+    def _is_top_level(self):
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        return parent is None
+
+    def _get_sparse_param(self, params, name, fields):
+        keys = []
+        if self.sparse_fieldset_key:
+            keys.append(f'{name}[{self.sparse_fieldset_key}]')
+        if self._is_top_level():
+            keys.append(name)
+        for key in keys:
+            if key in params:
+                values = {value for value in params[key].split(',') if value}
+                unknown = values - set(fields)
+                if unknown:
+                    raise serializers.ValidationError(
+                        {key: f"Unknown field(s): {', '.join(sorted(unknown))}. Choose from {', '.join(fields)}."}
+                    )
+                return values
+        return None
+
+class ProductSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     image_url = serializers.SerializerMethodField()
+    sparse_fieldset_key = 'product'
 
     class Meta:
         model = Product
@@ -10,3 +59,9 @@ class ProductSerializer(serializers.ModelSerializer):
 
     def get_image_url(self, obj):
         return obj.image_url
+
+class ProductListSerializer(ProductSerializer):
+    """Compact card representation for the shop grid (``?view=compact``)."""
+
+    class Meta(ProductSerializer.Meta):
+        fields = ['id', 'name', 'brand', 'category', 'original_price', 'discount_percent', 'price', 'stock', 'image_url']
@@ -1,3 +1,503 @@
-from django.test import TestCase
+import csv
+import json
+import os
+import tempfile
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import MagicMock, patch
 
-# Create your tests here.
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+
+from authentication.models import User
+from backend.testing import BRANDS, FAST_HASHERS, BudgetTestCase, seed_products
+from cart.models import Order, OrderLine
+from cart.reservations import release_order_stock, reserve_order_stock
+from .cache import get_catalog_version, get_search_version
+from .facets import compute_facets
+from .models import Product
+from .search import get_search_index, search_product_ids
+from .serializers import ProductSerializer
+
+
+class ProductEndpointBudgetTests(BudgetTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.products = seed_products()
+
+    def test_product_list(self):
+        response = self.assertBudget('GET', '/api/products/', queries=1, p50=400, p95=800)
+        self.assertEqual(len(response.data), len(self.products))
+
+    def test_product_list_paginated_and_filtered(self):
+        response = self.assertBudget(
+            'GET', '/api/products/?page_size=24&brand=Orane&category=Lips&in_stock=1&ordering=-price',
+            queries=1, p50=30, p95=60,
+        )
+        self.assertEqual(len(response.data['results']), 24)
+
+    def test_product_list_compact_view(self):
+        self.assertBudget('GET', '/api/products/?page_size=100&view=compact', queries=1, p50=40, p95=80)
+
+    def test_product_search(self):
+        response = self.assertBudget('GET', '/api/products/search/?q=lips shade', queries=2, p50=60, p95=500)
+        self.assertTrue(response.data)
+
+    def test_product_search_filtered(self):
+        response = self.assertBudget('GET', '/api/products/search/?q=lips shade&brand=Orane&limit=5',
+                                     queries=3, p50=60, p95=500)
+        self.assertEqual(len(response.data), 5)
+        self.assertEqual({product['brand'] for product in response.data}, {'Orane'})
+
+    def test_search_filters_before_the_limit(self):
+        top = search_product_ids('lips shade', 5)
+        brand = next(b for b in BRANDS if not Product.objects.filter(id__in=top, brand=b).exists())
+        ids = search_product_ids('lips shade', 5, Product.objects.filter(brand=brand))
+        self.assertEqual(len(ids), 5)
+        self.assertFalse(set(ids) & set(top))
+        self.assertEqual(set(Product.objects.filter(id__in=ids).values_list('brand', flat=True)), {brand})
+
+    def test_product_facets(self):
+        response = self.assertBudget('GET', '/api/products/facets/?brand=Orane', queries=1, p50=20, p95=60)
+        self.assertEqual(response.data['total'], sum(b['count'] for b in response.data['brand'] if b['value'] == 'Orane'))
+
+    def test_product_facets_price_range(self):
+        self.assertBudget('GET', '/api/products/facets/?min_price=100&max_price=500', queries=1, p50=30, p95=60)
+
+    def test_product_detail(self):
+        product = self.products[len(self.products) // 2]
+        response = self.assertBudget('GET', f'/api/products/{product.id}/', queries=1, p50=15, p95=60)
+        self.assertEqual(response.data['id'], product.id)
+
+    def test_product_detail_missing(self):
+        self.assertBudget('GET', '/api/products/999999/', queries=1, p50=15, p95=40, status=404)
+
+
+class ProductImportExportTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.dir = directory.name
+
+    def write_csv(self, rows):
+        path = os.path.join(self.dir, 'products.csv')
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+        return path
+
+    def run_import(self, *args):
+        out, err = StringIO(), StringIO()
+        call_command('import_products', *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_discount_rounds_half_a_paisa_up(self):
+        path = self.write_csv([
+            {'name': 'Gloss', 'category': 'Lips', 'original_price': '199.90', 'discount_percent': '5'},
+            {'name': 'Liner', 'category': 'Eyes', 'original_price': '0.10', 'discount_percent': '5'},
+        ])
+        out, _ = self.run_import(path)
+        self.assertIn('2 created', out)
+        gloss = Product.objects.get(name='Gloss')
+        self.assertEqual(gloss.discounted_price, Decimal('189.91'))
+        self.assertEqual(gloss.price, Decimal('189.91'))
+        self.assertEqual(Product.objects.get(name='Liner').price, Decimal('0.10'))
+
+    def test_import_matches_product_save(self):
+        path = self.write_csv([{'name': 'Gloss', 'category': 'Lips', 'original_price': '199.90',
+                                'discount_percent': '5'}])
+        self.run_import(path)
+        saved = Product(name='Saved', category='Lips', price=0, original_price=Decimal('199.90'), discount_percent=5)
+        saved.save()
+        saved.refresh_from_db()
+        self.assertEqual(Product.objects.get(name='Gloss').price, saved.price)
+
+    def test_import_updates_by_id_and_reports_bad_rows(self):
+        product = Product.objects.create(name='Blush', category='Face', price=Decimal('120.00'), stock=3)
+        path = self.write_csv([
+            {'id': str(product.id), 'name': '', 'category': '', 'price': '', 'stock': '7'},
+            {'id': '', 'name': 'Broken', 'category': 'Face', 'price': 'cheap', 'stock': ''},
+        ])
+        out, err = self.run_import(path)
+        self.assertIn('0 created, 1 updated, 0 unchanged, 1 errors', out)
+        self.assertIn("Line 3: price 'cheap' is not a number", err)
+        product.refresh_from_db()
+        self.assertEqual((product.name, product.price, product.stock), ('Blush', Decimal('120.00'), 7))
+        self.assertFalse(Product.objects.filter(name='Broken').exists())
+
+        out, _ = self.run_import(path)
+        self.assertIn('1 unchanged', out)
+
+    def test_dry_run_writes_nothing(self):
+        product = Product.objects.create(name='Blush', category='Face', price=Decimal('120.00'), stock=3)
+        path = self.write_csv([
+            {'name': 'Blush', 'category': 'Face', 'price': '99.50', 'stock': ''},
+            {'name': 'Kajal', 'category': 'Eyes', 'price': '80', 'stock': '5'},
+        ])
+        out, _ = self.run_import(path, '--dry-run')
+        self.assertIn('+ Kajal', out)
+        self.assertIn(f"~ #{product.id} Blush: price: Decimal('120.00') -> Decimal('99.50')", out)
+        self.assertIn('[dry run] Import finished: 1 created, 1 updated', out)
+        product.refresh_from_db()
+        self.assertEqual(product.price, Decimal('120.00'))
+        self.assertFalse(Product.objects.filter(name='Kajal').exists())
+
+    def test_export_round_trips_through_import(self):
+        seed_products(30)
+        path = os.path.join(self.dir, 'export.csv.gz')
+        err = StringIO()
+        call_command('export_products', path, stderr=err)
+        self.assertIn('Exported 30 products', err.getvalue())
+
+        Product.objects.update(stock=0)
+        out, _ = self.run_import(path)
+        self.assertIn('0 created, 30 updated', out)
+        self.assertEqual(sorted(Product.objects.values_list('stock', flat=True)),
+                         sorted(i % 40 for i in range(30)))
+
+    def test_export_jsonl_fields(self):
+        product = Product.objects.create(name='Blush', category='Face', price=Decimal('120.00'))
+        path = os.path.join(self.dir, 'export.jsonl')
+        call_command('export_products', path, '--fields', 'id,name,price', stderr=StringIO())
+        with open(path) as f:
+            self.assertEqual([json.loads(line) for line in f],
+                             [{'id': product.id, 'name': 'Blush', 'price': '120.00'}])
+
+
+class CatalogCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.products = seed_products(10)
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+
+    def assertBumps(self, change):
+        before = get_catalog_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        self.assertGreater(get_catalog_version(), before)
+
+    def test_repeat_requests_are_served_from_the_cache(self):
+        first = self.client.get('/api/products/?page_size=5')
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/products/?page_size=5')
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertEqual(second['Cache-Control'], 'no-cache')
+        self.assertNotEqual(self.client.get('/api/products/?page_size=6')['ETag'], first['ETag'])
+
+    def test_if_none_match_gets_a_304(self):
+        etag = self.client.get(f'/api/products/{self.products[0].id}/')['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(f'/api/products/{self.products[0].id}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(self.client.get(f'/api/products/{self.products[0].id}/',
+                                         HTTP_IF_NONE_MATCH='"stale"').status_code, 200)
+
+    def test_a_catalog_change_invalidates_etags_and_cached_data(self):
+        product = self.products[0]
+        etag = self.client.get(f'/api/products/{product.id}/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(pk=product.pk).update(name='Renamed')
+            product.refresh_from_db()
+            product.save()
+        response = self.client.get(f'/api/products/{product.id}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['name'], 'Renamed')
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_errors_are_not_cached(self):
+        self.assertEqual(self.client.get('/api/products/999999/').status_code, 404)
+        with self.assertNumQueries(1):
+            self.client.get('/api/products/999999/')
+
+    def test_save_and_delete_bump_the_version(self):
+        product = self.products[0]
+        self.assertBumps(lambda: Product.objects.get(pk=product.pk).save())
+        self.assertBumps(lambda: Product.objects.get(pk=product.pk).delete())
+
+    @override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+    def test_admin_bulk_delete_bumps_the_version(self):
+        self.client.force_login(User.objects.create_superuser(username='boss', password='secret'))
+        ids = [product.id for product in self.products[:3]]
+        self.assertBumps(lambda: self.client.post('/admin/product/product/', {
+            'action': 'delete_selected', '_selected_action': ids, 'post': 'yes',
+        }))
+        self.assertFalse(Product.objects.filter(id__in=ids).exists())
+
+    def test_stock_reservations_bump_the_version(self):
+        customer = User.objects.create_user(username='shopper', password='secret')
+        order = Order.objects.create(user=customer, total=100, status='approved')
+        OrderLine.objects.create(order=order, product=self.products[1], product_name='x', unit_price=50, quantity=1)
+        Product.objects.filter(pk=self.products[1].pk).update(stock=5)
+        self.assertBumps(lambda: reserve_order_stock(order))
+        self.assertBumps(lambda: release_order_stock(order))
+
+
+class ProductCursorPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_products(120)
+        # A run of equal prices that page boundaries have to cut through
+        Product.objects.bulk_create([
+            Product(name=f'Tied {i}', brand='Orane', category='Lips', price=499, stock=1, image='products/p.jpg')
+            for i in range(15)
+        ])
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+
+    def walk(self, url, link='next'):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, response.data)
+            pages.append([product['id'] for product in response.data['results']])
+            url = response.data[link]
+        return pages
+
+    def test_next_links_walk_every_filtered_product_once(self):
+        expected = list(Product.objects.filter(brand='Orane', stock__gt=0).order_by('-price', '-id')
+                        .values_list('id', flat=True))
+        pages = self.walk('/api/products/?brand=Orane&in_stock=1&ordering=-price&page_size=7')
+        self.assertEqual([pk for page in pages for pk in page], expected)
+        self.assertTrue(all(len(page) == 7 for page in pages[:-1]))
+
+    def test_previous_links_walk_back_to_the_start(self):
+        url = '/api/products/?category=Lips,Eyes&ordering=price&page_size=5'
+        forward = self.walk(url)
+        last = self.client.get(url)
+        while last.data['next']:
+            last = self.client.get(last.data['next'])
+        backward = self.walk(last.data['previous'], link='previous')
+        self.assertEqual(backward, forward[-2::-1])
+
+    def test_filters_are_kept_in_the_links(self):
+        response = self.client.get('/api/products/?brand=Klassy&max_price=800&page_size=3')
+        for product in self.client.get(response.data['next']).data['results']:
+            self.assertEqual(product['brand'], 'Klassy')
+            self.assertLessEqual(Decimal(product['price']), 800)
+
+    def test_invalid_ordering_is_rejected(self):
+        for ordering in ('name', '-stock', 'price,id'):
+            response = self.client.get(f'/api/products/?ordering={ordering}&page_size=5')
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('ordering', response.data)
+        self.assertEqual(self.client.get('/api/products/?ordering=bogus').status_code, 400)
+
+    def test_invalid_filters_are_rejected(self):
+        for query, field in [
+            ('min_price=cheap', 'min_price'),
+            ('max_price=-1', 'max_price'),
+            ('min_price=500&max_price=100', 'min_price'),
+            ('in_stock=maybe', 'in_stock'),
+            ('price_bucket=0-50', 'price_bucket'),
+        ]:
+            response = self.client.get(f'/api/products/?{query}&page_size=5')
+            self.assertEqual(response.status_code, 400, query)
+            self.assertIn(field, response.data)
+
+    def test_tampered_cursor_is_rejected(self):
+        self.assertEqual(self.client.get('/api/products/?cursor=not-a-cursor').status_code, 404)
+
+
+class ProductSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_products(50)
+        cls.lipstick = Product.objects.create(name='Velvet Matte Lipstick', brand='Klassy', category='Lips',
+                                              price=299, stock=4, image='products/p.jpg')
+        cls.mascara = Product.objects.create(name='Volume Mascara', brand='Orane', category='Eyes',
+                                             price=349, stock=0, image='products/p.jpg',
+                                             description='Waterproof lash lengthening formula')
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+
+    def test_typos_find_the_intended_product(self):
+        for query, product in [('lipstik', self.lipstick), ('lipstcik', self.lipstick),
+                               ('velevt lipstick', self.lipstick), ('mascra', self.mascara),
+                               ('volume mascarra', self.mascara)]:
+            self.assertEqual(search_product_ids(query, 3)[:1], [product.id], query)
+
+    def test_prefixes_and_descriptions_match(self):
+        self.assertEqual(search_product_ids('volume masc', 3)[:1], [self.mascara.id])
+        self.assertEqual(search_product_ids('waterproof', 3), [self.mascara.id])
+
+    def test_short_words_get_no_typo_budget(self):
+        self.assertEqual(search_product_ids('xyz'), [])
+
+    def test_filters_apply_before_the_limit(self):
+        response = self.client.get('/api/products/search/?q=mascara&in_stock=1')
+        self.assertNotIn(self.mascara.id, [product['id'] for product in response.data])
+        response = self.client.get('/api/products/search/?q=mascara&in_stock=0&limit=1')
+        self.assertEqual([product['id'] for product in response.data], [self.mascara.id])
+
+    def test_missing_query_is_rejected(self):
+        self.assertEqual(self.client.get('/api/products/search/?q=').status_code, 400)
+        self.assertEqual(self.client.get('/api/products/search/?q=lips&limit=0').status_code, 400)
+
+    def test_stock_changes_keep_the_index(self):
+        index = get_search_index()
+        customer = User.objects.create_user(username='shopper', password='secret')
+        order = Order.objects.create(user=customer, total=299, status='approved')
+        OrderLine.objects.create(order=order, product=self.lipstick, product_name='x', unit_price=299, quantity=1)
+        catalog_version, search_version = get_catalog_version(), get_search_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            reserve_order_stock(order)
+        self.assertGreater(get_catalog_version(), catalog_version)
+        self.assertEqual(get_search_version(), search_version)
+        self.assertIs(get_search_index(), index)
+
+    def test_product_edits_rebuild_the_index(self):
+        index = get_search_index()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lipstick.name = 'Velvet Matte Crayon'
+            self.lipstick.save()
+        self.assertIsNot(get_search_index(), index)
+        self.assertEqual(search_product_ids('crayon'), [self.lipstick.id])
+
+    def pg_connection(self, has_trgm):
+        """Pretend to be on PostgreSQL, with or without pg_trgm."""
+        get_search_index()  # built now, while the real connection answers
+        cursor = MagicMock()
+        cursor.__enter__.return_value.fetchone.return_value = (1,) if has_trgm else None
+        return patch.object(connection, 'vendor', 'postgresql'), patch.object(connection, 'cursor', return_value=cursor)
+
+    @patch('product.search._pg_trgm_installed', None)
+    def test_postgres_without_pg_trgm_falls_back_to_the_index(self):
+        vendor, cursor = self.pg_connection(has_trgm=False)
+        with vendor, cursor, patch('product.search.postgres_search') as postgres_search:
+            ids = search_product_ids('lipstik', 3)
+        postgres_search.assert_not_called()
+        self.assertEqual(ids[:1], [self.lipstick.id])
+
+    @patch('product.search._pg_trgm_installed', None)
+    def test_postgres_with_pg_trgm_searches_in_the_database(self):
+        vendor, cursor = self.pg_connection(has_trgm=True)
+        with vendor, cursor, patch('product.search.postgres_search', return_value=[7]) as postgres_search:
+            self.assertEqual(search_product_ids('lipstik', 3), [7])
+            with self.settings(PRODUCT_SEARCH_BACKEND='memory'):
+                self.assertEqual(search_product_ids('lipstik', 3)[:1], [self.lipstick.id])
+        postgres_search.assert_called_once_with('lipstik', 3, None)
+
+
+class ProductFacetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Product.objects.bulk_create([
+            Product(name=name, brand=brand, category=category, price=Decimal(price), stock=stock,
+                    image='products/p.jpg')
+            for name, brand, category, price, stock in [
+                ('Balm', 'Orane', 'Lips', '50', 3),
+                ('Gloss', 'Orane', 'Lips', '150', 0),
+                ('Liner', 'Orane', 'Eyes', '300', 2),
+                ('Tint', 'Klassy', 'Lips', '99.99', 1),
+                ('Primer', 'Klassy', 'Face', '100', 0),
+                ('Palette', 'Klassy', 'Eyes', '1200', 5),
+                ('Serum', 'Orane', 'Face', '999.99', 0),
+            ]
+        ])
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+
+    def counts(self, facets, dimension):
+        return {entry['value']: entry['count'] for entry in facets[dimension]}
+
+    def test_unfiltered_counts(self):
+        facets = compute_facets({})
+        self.assertEqual(facets['total'], 7)
+        self.assertEqual(self.counts(facets, 'brand'), {'Orane': 4, 'Klassy': 3})
+        self.assertEqual(facets['category'], [{'value': 'Lips', 'count': 3}, {'value': 'Eyes', 'count': 2},
+                                              {'value': 'Face', 'count': 2}])
+        self.assertEqual(self.counts(facets, 'price_bucket'),
+                         {'0-100': 2, '100-250': 2, '250-500': 1, '500-1000': 1, '1000+': 1})
+        self.assertEqual(self.counts(facets, 'in_stock'), {True: 4, False: 3})
+
+    def test_a_dimension_ignores_its_own_filter(self):
+        facets = compute_facets({'brand': 'Orane'})
+        self.assertEqual(facets['total'], 4)
+        self.assertEqual(self.counts(facets, 'brand'), {'Orane': 4, 'Klassy': 3})
+        self.assertEqual(self.counts(facets, 'category'), {'Lips': 2, 'Eyes': 1, 'Face': 1})
+        self.assertEqual(self.counts(facets, 'price_bucket'),
+                         {'0-100': 1, '100-250': 1, '250-500': 1, '500-1000': 1, '1000+': 0})
+        self.assertEqual(self.counts(facets, 'in_stock'), {True: 2, False: 2})
+
+    def test_filters_combine(self):
+        facets = compute_facets({'brand': 'Orane', 'in_stock': '1'})
+        self.assertEqual(facets['total'], 2)
+        self.assertEqual(self.counts(facets, 'brand'), {'Orane': 2, 'Klassy': 2})
+        self.assertEqual(facets['category'], [{'value': 'Eyes', 'count': 1}, {'value': 'Lips', 'count': 1}])
+        self.assertEqual(self.counts(facets, 'in_stock'), {True: 2, False: 2})
+
+        facets = compute_facets({'category': 'Lips,Face', 'price_bucket': '0-100,100-250'})
+        self.assertEqual(facets['total'], 4)
+        self.assertEqual(self.counts(facets, 'price_bucket'),
+                         {'0-100': 2, '100-250': 2, '250-500': 0, '500-1000': 1, '1000+': 0})
+
+    def test_price_range_counts_the_rows_live(self):
+        facets = compute_facets({'min_price': '100', 'max_price': '999.99'})
+        self.assertEqual(facets['total'], 4)
+        self.assertEqual(self.counts(facets, 'brand'), {'Orane': 3, 'Klassy': 1})
+        self.assertEqual(self.counts(facets, 'price_bucket'),
+                         {'0-100': 0, '100-250': 2, '250-500': 1, '500-1000': 1, '1000+': 0})
+        self.assertEqual(compute_facets({'min_price': '0'}), compute_facets({}))
+
+    def test_cached_cube_follows_catalog_changes(self):
+        self.assertEqual(self.client.get('/api/products/facets/').data['total'], 7)
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(name='Kajal', brand='Klassy', category='Eyes', price=80, stock=1,
+                                   image='products/p.jpg')
+        response = self.client.get('/api/products/facets/?category=Eyes')
+        self.assertEqual(response.data['total'], 3)
+        self.assertEqual(self.counts(response.data, 'category')['Eyes'], 3)
+
+
+class SparseFieldsetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = seed_products(3)[0]
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+
+    def test_fields_keeps_only_the_named_fields(self):
+        response = self.client.get(f'/api/products/{self.product.id}/?fields=id,name,price')
+        self.assertEqual(set(response.data), {'id', 'name', 'price'})
+        response = self.client.get('/api/products/?fields=id,stock')
+        self.assertEqual([set(product) for product in response.data], [{'id', 'stock'}] * 3)
+
+    def test_omit_drops_the_named_fields(self):
+        response = self.client.get(f'/api/products/{self.product.id}/?omit=description,image')
+        self.assertNotIn('description', response.data)
+        self.assertNotIn('image', response.data)
+        self.assertIn('image_url', response.data)
+
+    def test_keyed_params_apply_to_the_product_serializer_too(self):
+        response = self.client.get('/api/products/?page_size=2&fields[product]=id,name')
+        self.assertEqual([set(product) for product in response.data['results']], [{'id', 'name'}] * 2)
+        response = self.client.get('/api/products/?page_size=2&view=compact&omit[product]=image_url')
+        self.assertNotIn('image_url', response.data['results'][0])
+
+    def test_unknown_fields_are_rejected(self):
+        response = self.client.get(f'/api/products/{self.product.id}/?fields=id,colour')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('colour', response.data['fields'])
+        self.assertEqual(self.client.get('/api/products/?omit=sku').status_code, 400)
+        # The compact card has no description to pick
+        self.assertEqual(self.client.get('/api/products/?view=compact&fields=description').status_code, 400)
+
+    def test_writes_ignore_the_params(self):
+        serializer = ProductSerializer(self.product, context={'request': MagicMock(method='POST')})
+        self.assertIn('description', serializer.data)
@@ -1,7 +1,9 @@
 from django.urls import path
-from .views import ProductListView, ProductDetailView
+from .views import ProductListView, ProductSearchView, ProductFacetsView, ProductDetailView
  
 urlpatterns = [
     path('products/', ProductListView.as_view(), name='product-list'),
+    path('products/search/', ProductSearchView.as_view(), name='product-search'),
+    path('products/facets/', ProductFacetsView.as_view(), name='product-facets'),
     path('products/<int:pk>/', ProductDetailView.as_view(), name='product-detail'),
 ] 
\ No newline at end of file
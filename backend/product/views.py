@@ -1,17 +1,68 @@
 from django.shortcuts import render
-from rest_framework import generics
+from rest_framework import generics, serializers
 from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
 from .models import Product
-from .serializers import ProductSerializer
+from .serializers import ProductSerializer, ProductListSerializer
+from .filters import filter_products
+from .pagination import ProductCursorPagination
+from .cache import CatalogCacheMixin
+from .search import search_product_ids
+from .facets import compute_facets
 
 # Create your views here.
 
-class ProductListView(generics.ListAPIView):
-    queryset = Product.objects.all().order_by('id')
+class ProductListView(CatalogCacheMixin, generics.ListAPIView):
     serializer_class = ProductSerializer
     permission_classes = [AllowAny]
+    pagination_class = ProductCursorPagination
 
-class ProductDetailView(generics.RetrieveAPIView):
+    def get_serializer_class(self):
+        if self.request.query_params.get('view') == 'compact':
+            return ProductListSerializer
+        return ProductSerializer
+
+    def get_queryset(self):
+        queryset = filter_products(Product.objects.all(), self.request.query_params)
+        if 'description' not in self.get_serializer().fields:
+            # Skip the largest column when the response won't include it.
+            queryset = queryset.defer('description')
+        # Unpaginated requests honour ?ordering= too; paginated ones re-apply it.
+        ordering = self.paginator.get_ordering(self.request, queryset, self)
+        return queryset.order_by(*ordering)
+
+class ProductSearchView(CatalogCacheMixin, generics.ListAPIView):
+    """Ranked product search: /api/products/search/?q=...&limit=..."""
+    serializer_class = ProductSerializer
+    permission_classes = [AllowAny]
+    default_limit = 20
+    max_limit = 50
+
+    def get_queryset(self):
+        params = self.request.query_params
+        query = params.get('q', '').strip()
+        if not query:
+            raise serializers.ValidationError({'q': 'This query parameter is required.'})
+        try:
+            limit = min(int(params.get('limit', self.default_limit)), self.max_limit)
+        except ValueError:
+            raise serializers.ValidationError({'limit': 'Must be an integer.'})
+        if limit < 1:
+            raise serializers.ValidationError({'limit': 'Must be at least 1.'})
+
+        # Filter inside the search, so the limit counts only matching products
+        ranked_ids = search_product_ids(query, limit, filter_products(Product.objects.all(), params))
+        products = Product.objects.in_bulk(ranked_ids)
+        return [products[pk] for pk in ranked_ids if pk in products]
+
+class ProductFacetsView(CatalogCacheMixin, generics.GenericAPIView):
+    """Brand/category/price bucket/stock counts for the given catalog filters."""
+    permission_classes = [AllowAny]
+
+    def get_uncached_response(self, request, *args, **kwargs):
+        return Response(compute_facets(request.query_params))
+
+class ProductDetailView(CatalogCacheMixin, generics.RetrieveAPIView):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
     permission_classes = [AllowAny]